@@ -0,0 +1,133 @@
+import time
+from contextlib import asynccontextmanager
+import redis.asyncio as redis
+from config import settings, logger
+from fastapi import HTTPException
+
+# Streams dos relatórios (somente leitura); os demais recebem escritas
+STREAMS_LEITURA = ('stream_app1_app5', 'stream_app1_app6')
+
+
+class ControleAdmissao:
+    """
+    Classe que recusa requisições no gateway quando um worker não dá conta da fila,
+    em vez de continuar enfileirando: cada stream tem um limite de requisições em
+    andamento nesta instância (429) e um limite de backlog do consumer group, as
+    mensagens ainda não entregues (lag) mais as pendentes de confirmação (503).
+    Leitura (relatórios) e escrita têm limites separados em settings.admissao.
+    """
+
+    def __init__(self, redis_client):
+        """
+        Inicializa o controle.
+
+        Args:
+            redis_client: Cliente Redis assíncrono.
+        """
+        self.redis_client = redis_client
+        self.limites = {'leitura': settings.admissao.leitura, 'escrita': settings.admissao.escrita}
+        self.intervalo_backlog = settings.admissao.intervalo_backlog
+        self.retry_after = settings.admissao.retry_after
+        self.em_andamento = {}
+        self.recusadas = {}
+        # stream -> (instante da leitura, backlog)
+        self._backlog = {}
+
+    @staticmethod
+    def classe(stream: str) -> str:
+        return 'leitura' if stream in STREAMS_LEITURA else 'escrita'
+
+    async def _lag(self, stream: str, grupo: dict, limite: int) -> int:
+        """
+        Mensagens ainda não entregues ao grupo. O campo lag do XINFO GROUPS não existe
+        antes do Redis 7 e vem nulo depois de XDEL/XTRIM (que os workers fazem ao aparar
+        o stream): nesses casos as entradas após o último ID entregue são contadas,
+        até `limite`.
+        """
+        if grupo.get('lag') is not None:
+            return grupo['lag']
+        ultimo = grupo['last-delivered-id'].decode('utf-8')
+        return len(await self.redis_client.xrange(stream, min=f"({ultimo}", count=limite))
+
+    async def backlog(self, stream: str, limite: int) -> int:
+        """
+        Retorna o backlog do stream (lag + pendentes do consumer group mais atrasado),
+        lido do Redis no máximo a cada intervalo_backlog segundos. Sem consumer group
+        (worker ainda não iniciado), o backlog é o comprimento do stream.
+
+        Args:
+            stream (str): Nome do stream de requisição.
+            limite (int): Backlog a partir do qual a contagem exata deixa de importar.
+
+        Returns:
+            int: Quantidade de mensagens aguardando o worker.
+        """
+        lido_em, valor = self._backlog.get(stream, (0.0, 0))
+        if time.monotonic() - lido_em < self.intervalo_backlog:
+            return valor
+        # Marca a leitura antes do round trip: as requisições concorrentes usam o valor anterior
+        self._backlog[stream] = (time.monotonic(), valor)
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xinfo_groups(stream)
+        pipe.xlen(stream)
+        try:
+            grupos, comprimento = await pipe.execute(raise_on_error=False)
+            if isinstance(grupos, redis.ResponseError) or not grupos:
+                valor = comprimento if isinstance(comprimento, int) else 0
+            else:
+                valor = max([await self._lag(stream, grupo, limite + 1) + grupo['pending']
+                             for grupo in grupos])
+        except redis.RedisError as e:
+            logger.warning(f"Erro ao ler o backlog de {stream}: {e}")
+            return valor
+
+        self._backlog[stream] = (time.monotonic(), valor)
+        return valor
+
+    def _recusa(self, stream: str, codigo: int, motivo: str):
+        self.recusadas[stream] = self.recusadas.get(stream, 0) + 1
+        logger.warning(f"Requisição para {stream} recusada: {motivo}")
+        raise HTTPException(status_code=codigo, detail=motivo,
+                            headers={'Retry-After': str(self.retry_after)})
+
+    @asynccontextmanager
+    async def admitir(self, stream: str, quantidade: int = 1):
+        """
+        Admite uma requisição para o stream, contando-a como em andamento até o fim
+        do bloco `async with`.
+
+        Args:
+            stream (str): Nome do stream de requisição.
+            quantidade (int): Mensagens que a requisição envia ao stream (lotes).
+
+        Raises:
+            HTTPException: 429 se o limite de requisições em andamento foi atingido;
+                503 se o backlog do worker passaria do limite. Ambas com Retry-After.
+        """
+        limites = self.limites[self.classe(stream)]
+        if await self.backlog(stream, limites.max_backlog) + quantidade > limites.max_backlog:
+            self._recusa(stream, 503, "Serviço sobrecarregado, tente novamente mais tarde")
+        # Sem await entre a verificação e o incremento: requisições concorrentes não furam o limite
+        if self.em_andamento.get(stream, 0) >= limites.max_em_andamento:
+            self._recusa(stream, 429, f"Limite de {limites.max_em_andamento} requisições em andamento atingido")
+
+        self.em_andamento[stream] = self.em_andamento.get(stream, 0) + 1
+        try:
+            yield
+        finally:
+            self.em_andamento[stream] -= 1
+
+    def estado(self) -> dict:
+        """
+        Retorna, por stream, as requisições em andamento, o último backlog lido e as
+        requisições recusadas desde o início da instância.
+        """
+        return {
+            stream: {
+                'classe': self.classe(stream),
+                'em_andamento': self.em_andamento.get(stream, 0),
+                'backlog': self._backlog.get(stream, (0.0, None))[1],
+                'recusadas': self.recusadas.get(stream, 0),
+            } for stream in set(self.em_andamento) | set(self._backlog) | set(self.recusadas)
+        }
@@ -1,18 +1,90 @@
 import json
-import time
-import redis
+import asyncio
+from typing import List
+import redis.asyncio as redis
 from config import settings, logger
-from pydantic import BaseModel
-from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, ValidationError
+from jobs import GerenciadorJobs
+from idempotencia import ControleIdempotencia
+from admissao import ControleAdmissao
+from cache import CacheRelatorios
+from codec import decodifica_campo
+from streams import (STREAMS_REQUISICAO, limite_stream, timeout_stream, prazo, estado_streams,
+                     lista_dead_letters, reprocessa_dead_letters)
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Header, Request, Body
+from fastapi.exceptions import RequestValidationError
+from despachante import DespachanteRespostas, novo_correlation_id
 from models import (DetalhesCompra, Compra, Associacao,
                     DetalhesAssociacao, DetalhesStreaming,
                     Streaming, Comissao, Remessa)
 
-# Configurar Redis
-r = redis.Redis(host=settings.redis.host, port=settings.redis.port)
+# Configurar Redis: um único pool de conexões compartilhado por todas as requisições
+pool = redis.ConnectionPool(host=settings.redis.host, port=settings.redis.port,
+                            max_connections=settings.redis.get('max_connections', 100))
+r = redis.Redis(connection_pool=pool)
+
+# Streams de resposta dos workers, lidos por um único despachante
+STREAMS_RESPOSTA = ['stream_app2_app1', 'stream_app3_app1',
+                    'stream_app4_app1', 'stream_app5_app1', 'stream_app6_app1']
+
+jobs = GerenciadorJobs(r)
+idempotencia = ControleIdempotencia(r)
+admissao = ControleAdmissao(r)
+cache = CacheRelatorios(r)
+# Respostas sem requisição aguardando nesta instância podem pertencer a jobs assíncronos
+despachante = DespachanteRespostas(r, STREAMS_RESPOSTA, sem_dono=jobs.concluir)
+
+
+def modo_assincrono(modo: str, prefer: str) -> bool:
+    """
+    Indica se o cliente optou pelo modo assíncrono (?modo=async ou Prefer: respond-async).
+
+    Args:
+        modo (str): Valor do parâmetro de query `modo`.
+        prefer (str): Valor do header `Prefer`.
+
+    Returns:
+        bool: True para enfileirar o job e responder 202 imediatamente.
+    """
+    return modo == 'async' or 'respond-async' in (prefer or '')
+
+
+def modelo_da_consulta(modelo, corpo, **parametros):
+    """
+    Retorna o modelo enviado no corpo JSON ou, sem corpo, o monta a partir dos
+    parâmetros de query.
+
+    Args:
+        modelo: Classe do modelo Pydantic.
+        corpo: Modelo já validado a partir do corpo, ou None.
+        **parametros: Parâmetros de query.
+
+    Raises:
+        RequestValidationError: Se os parâmetros de query não formarem um modelo válido (422).
+    """
+    if corpo is not None:
+        return corpo
+    try:
+        return modelo(**{nome: valor for nome, valor in parametros.items() if valor is not None})
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Inicia o despachante de respostas junto com a aplicação e o encerra no shutdown.
+    """
+    await despachante.iniciar()
+    yield
+    await despachante.parar()
+    await r.aclose()
+
 
 # Inicializar FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 class Processador:
@@ -25,26 +97,209 @@ class Processador:
         Inicializa o objeto e configura o cliente Redis.
         """
         self.redis_client = r
+        self.despachante = despachante
+        self.jobs = jobs
+        self.admissao = admissao
 
-    def enviar_para_classe(self, stream_name: str, data_json: str):
+    async def enviar_para_classe(self, stream_name: str, data_json: str, correlation_id: str,
+                                 chave_idempotencia: str = None, prazo_msg: str = None):
         """
-        Envia dados para um stream Redis.
+        Envia dados para um stream Redis, com o MAXLEN aproximado da política de retenção.
 
         Args:
             stream_name (str): O nome do stream Redis.
-            data_json (str): Os dados a serem enviados em formato JSON.
+            data_json (str | bytes): Os dados a serem enviados em formato JSON.
+            correlation_id (str): Identificador ecoado pelo worker na resposta.
+            chave_idempotencia (str): Chave de idempotência, repassada ao worker.
+            prazo_msg (str): Prazo absoluto (ms desde a época) após o qual o worker descarta a mensagem.
 
         Returns:
             None
         """
-        self.redis_client.xadd(stream_name, {'data': data_json})
+        campos = {'data': data_json, 'correlation_id': correlation_id}
+        if chave_idempotencia:
+            campos['idempotency_key'] = chave_idempotencia
+        if prazo_msg:
+            campos['prazo'] = prazo_msg
+        await self.redis_client.xadd(
+            stream_name, campos, maxlen=limite_stream(stream_name), approximate=True)
+
+    async def enviar_e_aguardar(self, stream_name: str, data_json: str, chave_idempotencia: str = None) -> dict:
+        """
+        Envia dados para um stream Redis e aguarda a resposta correspondente,
+        entregue pelo despachante através do correlation_id. A espera é limitada por
+        settings.prazos, e o mesmo prazo vai na mensagem para que o worker não processe
+        uma requisição que o gateway já abandonou.
+
+        Args:
+            stream_name (str): O nome do stream Redis.
+            data_json (str | bytes): Os dados a serem enviados em formato JSON.
+            chave_idempotencia (str): Chave de idempotência, repassada ao worker.
 
-    async def processar_compra(self, compra: Compra):
+        Returns:
+            dict: Os campos da mensagem de resposta do worker.
+
+        Raises:
+            HTTPException: 504 se a resposta não chegar dentro do prazo; 429 e 503 se a
+                requisição não for admitida (ver ControleAdmissao).
+        """
+        timeout = timeout_stream(stream_name)
+        async with self.admissao.admitir(stream_name):
+            correlation_id = novo_correlation_id()
+            self.despachante.registrar(correlation_id)
+            try:
+                await self.enviar_para_classe(stream_name, data_json, correlation_id, chave_idempotencia,
+                                              prazo(timeout))
+            except BaseException:
+                self.despachante.descartar(correlation_id)
+                raise
+
+            logger.info("Aguardando respostas ...")
+            try:
+                return await self.despachante.aguardar_resposta(correlation_id, timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Sem resposta de {stream_name} em {timeout}s (correlation_id {correlation_id})")
+                raise HTTPException(status_code=504, detail="Tempo de resposta do serviço esgotado")
+
+    async def enviar_job(self, stream_name: str, data_json: str, tipo: str,
+                         chave_idempotencia: str = None) -> JSONResponse:
+        """
+        Enfileira um job no modo assíncrono: registra o job no Redis, envia os dados ao
+        worker e responde imediatamente, sem manter a conexão aberta.
+
+        Args:
+            stream_name (str): O nome do stream Redis.
+            data_json (str | bytes): Os dados a serem enviados em formato JSON.
+            tipo (str): Tipo do job, usado para montar o resultado quando o worker responder.
+            chave_idempotencia (str): Chave de idempotência, repassada ao worker.
+
+        Returns:
+            JSONResponse: Resposta 202 com o ID do job e a URL de consulta.
+
+        Raises:
+            HTTPException: 429 e 503 se o job não for admitido (ver ControleAdmissao).
+        """
+        job_id = novo_correlation_id()
+        async with self.admissao.admitir(stream_name):
+            await self.jobs.criar(job_id, tipo)
+            # O job só pode ser consultado enquanto o registro pendente existir
+            await self.enviar_para_classe(stream_name, data_json, job_id, chave_idempotencia,
+                                          prazo(self.jobs.ttl_pendente))
+        logger.info(f"Job {job_id} enfileirado em {stream_name}")
+        return JSONResponse(status_code=202,
+                            content={"job_id": job_id, "status": "pendente",
+                                     "url": f"/jobs/{job_id}"},
+                            headers={"Location": f"/jobs/{job_id}"})
+
+    def resposta_compra(self, msg: dict) -> dict:
+        """
+        Monta o corpo da resposta de uma compra a partir da resposta do worker.
+
+        Args:
+            msg (dict): Campos da mensagem de resposta do worker.
+
+        Returns:
+            dict: Um dicionário contendo uma mensagem e os dados da venda processada.
+
+        Raises:
+            HTTPException: Se o worker não conseguiu processar a compra.
+        """
+        status = msg.get(b'status', b'').decode('utf-8')
+        venda_id = msg.get(b'venda_id', b'').decode('utf-8')
+
+        if status == 'true':
+            logger.info(f"Resposta recebida de app3: Venda: {venda_id}")
+            return {"message": "Recebido e processado por produto_fisico", "data": {"venda_id": venda_id}}
+
+        raise HTTPException(
+            status_code=500, detail="Erro ao processar compra."
+        )
+
+    def resposta_streaming(self, msg: dict) -> dict:
+        """
+        Monta o corpo da resposta de um streaming a partir da resposta do worker.
+
+        Args:
+            msg (dict): Campos da mensagem de resposta do worker.
+
+        Returns:
+            dict: Um dicionário contendo uma mensagem e os dados do streaming processado.
+
+        Raises:
+            HTTPException: Se o worker não conseguiu enviar os vídeos.
+        """
+        status = msg.get(b'status', b'').decode('utf-8')
+
+        if status == 'true':
+            streaming_id = decodifica_campo(msg, 'video')
+            logger.info(f"Resposta recebida de app4: Streaming: {streaming_id}")
+            return {"message": "Recebido e processado por streaming", "data": {"video": streaming_id}}
+
+        raise HTTPException(
+            status_code=500, detail="Erro ao enviar vídeos."
+        )
+
+    def resposta_comissao(self, msg: dict) -> dict:
+        """
+        Monta o corpo da resposta de uma comissão a partir da resposta do worker.
+
+        Args:
+            msg (dict): Campos da mensagem de resposta do worker.
+
+        Returns:
+            dict: Um dicionário contendo uma mensagem e os dados da comissão processada.
+
+        Raises:
+            HTTPException: Se o worker não conseguiu calcular a comissão.
+        """
+        if msg.get(b'status', b'').decode('utf-8') == 'true':
+            comissao_data = decodifica_campo(msg, 'vendedores')
+            if isinstance(comissao_data, str):
+                # Resposta no formato anterior, sem o campo codec
+                comissao_data = json.loads(comissao_data)
+            logger.info(f"Resposta recebida de app5: Comissao: {comissao_data}")
+            return {"message": "Recebido e processado por Comissão", "data": {"comissao": comissao_data}}
+
+        raise HTTPException(
+            status_code=500, detail="Erro ao calcular comissão do vendedor."
+        )
+
+    def resposta_remessa(self, msg: dict) -> dict:
+        """
+        Monta o corpo da resposta de uma remessa a partir da resposta do worker.
+
+        Args:
+            msg (dict): Campos da mensagem de resposta do worker.
+
+        Returns:
+            dict: Um dicionário contendo uma mensagem e os dados da remessa processada.
+
+        Raises:
+            HTTPException: Se o worker não conseguiu gerar a guia de remessa.
+        """
+        if msg.get(b'status', b'').decode('utf-8') == 'true':
+            remessa_data = decodifica_campo(msg, 'remessa')
+            if isinstance(remessa_data, str):
+                # Resposta no formato anterior, sem o campo codec
+                remessa_data = json.loads(remessa_data)
+            logger.info("Resposta recebida de remessa")
+            return {"message": "Recebido e processado por Remessa", "data": {"remessa": remessa_data}}
+
+        raise HTTPException(
+            status_code=500, detail="Erro ao gerar a guia de remessa"
+        )
+
+    async def processar_compra(self, compra: Compra, assincrono: bool = False, corpo: bytes = None,
+                               chave_idempotencia: str = None):
         """
         Processa uma compra, envia os dados para o stream Redis apropriado e aguarda a resposta.
 
         Args:
             compra (Compra): Objeto de compra contendo os detalhes da compra.
+            assincrono (bool): Enfileira como job e responde 202 sem aguardar o worker.
+            corpo (bytes): Corpo original da requisição, já validado, encaminhado sem nova serialização.
+            chave_idempotencia (str): Chave de idempotência (ver ControleIdempotencia.chave_efetiva); o worker
+                não grava de novo uma venda com a mesma chave.
 
         Returns:
             dict: Um dicionário contendo uma mensagem e os dados da venda processada.
@@ -52,54 +307,72 @@ class Processador:
         Raises:
             HTTPException: Se o tipo de compra não for suportado ou se houver um erro ao processar a compra.
         """
-        compra_json = compra.json()
+        compra_json = corpo if corpo is not None else compra.json()
         match compra.tipo_compra:
             case "produto_fisico":
-                self.enviar_para_classe('stream_app1_app3', compra_json)
+                if assincrono:
+                    return await self.enviar_job('stream_app1_app3', compra_json, 'compra', chave_idempotencia)
+                msg = await self.enviar_e_aguardar('stream_app1_app3', compra_json, chave_idempotencia)
             case _:
                 raise HTTPException(
                     status_code=400, detail="Tipo de compra não suportado"
                 )
 
-        logger.info("Aguardando respostas ...")
-
-        while True:
-            response_app3 = self.redis_client.xread(
-                {'stream_app3_app1': '0-0'}, block=1000)
-
-            if response_app3:
-                for stream, messages in response_app3:
-                    for msg_id, msg in messages:
-                        if b'status' in msg:
-                            status = msg[b'status'].decode('utf-8')
-                            venda_id = msg.get(
-                                b'venda_id', b'').decode('utf-8')
-
-                            if status == 'true':
-                                logger.info(
-                                    f"Resposta recebida de app3: Venda: {venda_id}")
-                                compra.clear()
-                                self.redis_client.xdel(
-                                    'stream_app3_app1', msg_id)
-                                return {"message": "Recebido e processado por produto_fisico", "data": {"venda_id": venda_id}}
-
-                            else:
-                                raise HTTPException(
-                                    status_code=500, detail="Erro ao processar compra."
-                                )
-                        else:
-                            logger.error(
-                                "Chave 'status' não encontrada na mensagem.")
-
-            print("Nenhuma resposta recebida, continuando a aguardar...")
-            time.sleep(1)
-
-    async def processar_associacao(self, associacao: Associacao):
+        resposta = self.resposta_compra(msg)
+        compra.clear()
+        return resposta
+
+    async def processar_compras_lote(self, compras: List[Compra]) -> JSONResponse:
+        """
+        Processa um lote de compras: valida todos os itens de uma vez e envia todos ao
+        stream Redis num único pipeline (um round trip), como jobs assíncronos.
+
+        Args:
+            compras (List[Compra]): Lista de compras.
+
+        Returns:
+            JSONResponse: Resposta 202 com o correlation_id (ID do job) de cada item, na ordem recebida.
+
+        Raises:
+            HTTPException: Se o lote estiver vazio, exceder o limite ou contiver tipos de compra não suportados,
+                ou se o backlog do worker não comportar o lote (ver ControleAdmissao).
+        """
+        if not compras:
+            raise HTTPException(status_code=400, detail="Lote vazio")
+        if len(compras) > settings.lote.max_itens:
+            raise HTTPException(
+                status_code=413, detail=f"Lote excede o limite de {settings.lote.max_itens} compras")
+
+        invalidos = [indice for indice, compra in enumerate(compras)
+                     if compra.tipo_compra != "produto_fisico"]
+        if invalidos:
+            raise HTTPException(
+                status_code=400, detail={"message": "Tipo de compra não suportado", "indices": invalidos})
+
+        itens = []
+        limite = limite_stream('stream_app1_app3')
+        prazo_lote = prazo(self.jobs.ttl_pendente)
+        async with self.admissao.admitir('stream_app1_app3', len(compras)):
+            pipe = self.redis_client.pipeline(transaction=False)
+            for indice, compra in enumerate(compras):
+                job_id = novo_correlation_id()
+                await self.jobs.criar(job_id, 'compra', pipe)
+                pipe.xadd('stream_app1_app3', {'data': compra.json(), 'correlation_id': job_id,
+                                               'prazo': prazo_lote},
+                          maxlen=limite, approximate=True)
+                itens.append({"indice": indice, "correlation_id": job_id, "url": f"/jobs/{job_id}"})
+            await pipe.execute()
+
+        logger.info(f"Lote de {len(itens)} compras enviado para stream_app1_app3")
+        return JSONResponse(status_code=202, content={"status": "pendente", "itens": itens})
+
+    async def processar_associacao(self, associacao: Associacao, corpo: bytes = None):
         """
         Processa uma associação, envia os dados para o stream Redis apropriado e aguarda a resposta.
 
         Args:
             associacao (Associacao): Objeto de associação contendo os detalhes da associação.
+            corpo (bytes): Corpo original da requisição, já validado, encaminhado sem nova serialização.
 
         Returns:
             dict: Um dicionário contendo uma mensagem indicando o status do processamento.
@@ -107,56 +380,37 @@ class Processador:
         Raises:
             HTTPException: Se o tipo de assinatura não for suportado ou se houver um erro ao processar a associação.
         """
-        associacao_json = json.loads(associacao.json())
+        associacao_json = corpo if corpo is not None else associacao.json()
 
-        logger.info(associacao_json)
+        logger.info(associacao)
 
-        match associacao_json['tipo_assinatura']:
+        match associacao.tipo_assinatura:
             case "nova_associacao" | "upgrade_associacao" | "ativacao_associacao":
                 logger.info("Enviando para app2")
-                self.enviar_para_classe(
-                    'stream_app1_app2', json.dumps(associacao_json))
+                msg = await self.enviar_e_aguardar(
+                    'stream_app1_app2', associacao_json)
             case _:
                 raise HTTPException(
                     status_code=400, detail="Tipo de assinatura não suportado"
                 )
 
-        logger.info("Aguardando respostas ...")
-
-        while True:
-            response_app2 = self.redis_client.xread(
-                {'stream_app2_app1': '0-0'}, block=1000)
-
-            if response_app2:
-                for stream, messages in response_app2:
-                    for msg_id, msg in messages:
-                        if b'status' in msg:
-                            status = msg[b'status'].decode('utf-8')
-                            if status == 'true':
-                                logger.info(
-                                    f"Resposta recebida de app2: {msg}")
-                                associacao.clear()
-                                self.redis_client.xdel(
-                                    'stream_app2_app1', msg_id)
-                                return {"message": "Recebido e processado por nova_associacao"}
-
-                            else:
-                                raise HTTPException(
-                                    status_code=500, detail="Erro ao processar associação."
-                                )
-                        else:
-                            logger.error(
-                                "Chave 'status' não encontrada na mensagem.")
-
-            logger.info("Nenhuma resposta recebida, continuando a aguardar...")
-            time.sleep(1)
-
-    async def processar_streaming(self, streaming: Streaming):
+        if msg.get(b'status', b'').decode('utf-8') == 'true':
+            logger.info(f"Resposta recebida de app2: {msg}")
+            associacao.clear()
+            return {"message": "Recebido e processado por nova_associacao"}
+
+        raise HTTPException(
+            status_code=500, detail="Erro ao processar associação."
+        )
+
+    async def processar_streaming(self, streaming: Streaming, assincrono: bool = False, corpo: bytes = None):
         """
         Processa uma solicitação de streaming, envia os dados para o stream Redis apropriado e aguarda a resposta.
 
         Args:
             streaming (Streaming): Objeto de streaming contendo os detalhes do streaming.
+            assincrono (bool): Enfileira como job e responde 202 sem aguardar o worker.
+            corpo (bytes): Corpo original da requisição, já validado, encaminhado sem nova serialização.
 
         Returns:
             dict: Um dicionário contendo uma mensagem e os dados do streaming processado.
@@ -164,47 +418,23 @@ class Processador:
         Raises:
             HTTPException: Se houver um erro ao enviar vídeos.
         """
-        streaming_json = streaming.json()
-        self.enviar_para_classe('stream_app1_app4', streaming_json)
-        logger.info("Aguardando respostas ...")
-
-        while True:
-            response_app4 = self.redis_client.xread(
-                {'stream_app4_app1': '0-0'}, block=1000)
-
-            if response_app4:
-                for stream, messages in response_app4:
-                    for msg_id, msg in messages:
-                        if b'status' in msg:
-                            status = msg[b'status'].decode('utf-8')
-                            streaming_id = msg.get(
-                                b'video', b'').decode('utf-8')
-
-                            if status == 'true':
-                                logger.info(f"Resposta recebida de app4: Streaming: {
-                                            streaming_id}")
-                                streaming.clear()
-                                self.redis_client.xdel(
-                                    'stream_app4_app1', msg_id)
-                                return {"message": "Recebido e processado por streaming", "data": {"video": streaming_id}}
-
-                            else:
-                                raise HTTPException(
-                                    status_code=500, detail="Erro ao enviar vídeos."
-                                )
-                        else:
-                            logger.error(
-                                "Chave 'status' não encontrada na mensagem.")
-
-            print("Nenhuma resposta recebida, continuando a aguardar...")
-            time.sleep(1)
-
-    async def processar_comissao(self, comissao: Comissao):
+        streaming_json = corpo if corpo is not None else streaming.json()
+        if assincrono:
+            return await self.enviar_job('stream_app1_app4', streaming_json, 'streaming')
+        msg = await self.enviar_e_aguardar('stream_app1_app4', streaming_json)
+
+        resposta = self.resposta_streaming(msg)
+        streaming.clear()
+        return resposta
+
+    async def processar_comissao(self, comissao: Comissao, assincrono: bool = False, corpo: bytes = None):
         """
         Processa uma solicitação de comissão, envia os dados para o stream Redis apropriado e aguarda a resposta.
 
         Args:
             comissao (Comissao): Objeto de comissão contendo os detalhes da comissão.
+            assincrono (bool): Enfileira como job e responde 202 sem aguardar o worker.
+            corpo (bytes): Corpo original da requisição, já validado, encaminhado sem nova serialização.
 
         Returns:
             dict: Um dicionário contendo uma mensagem e os dados da comissão processada.
@@ -212,48 +442,23 @@ class Processador:
         Raises:
             HTTPException: Se houver um erro ao calcular a comissão do vendedor.
         """
-        comissao_json = comissao.json()
-        self.enviar_para_classe('stream_app1_app5', comissao_json)
-        logger.info("Aguardando respostas ...")
-
-        while True:
-            response_app5 = self.redis_client.xread(
-                {'stream_app5_app1': '0-0'}, block=1000)
-
-            if response_app5:
-                for stream, messages in response_app5:
-                    for msg_id, msg in messages:
-                        if b'status' in msg:
-                            status = msg[b'status'].decode('utf-8')
-                            comissao_id = msg.get(
-                                b'vendedores', b'').decode('utf-8')
-                            comissao_data = json.loads(comissao_id)
-
-                            if status == 'true':
-                                logger.info(f"Resposta recebida de app5: Comissao: {
-                                            comissao_data}")
-                                comissao.clear()
-                                self.redis_client.xdel(
-                                    'stream_app5_app1', msg_id)
-                                return {"message": "Recebido e processado por Comissão", "data": {"comissao": comissao_data}}
-
-                            else:
-                                raise HTTPException(
-                                    status_code=500, detail="Erro ao calcular comissão do vendedor."
-                                )
-                        else:
-                            logger.error(
-                                "Chave 'status' não encontrada na mensagem.")
-
-            print("Nenhuma resposta recebida, continuando a aguardar...")
-            time.sleep(1)
-
-    async def processar_remessa(self, remessa: Remessa):
+        comissao_json = corpo if corpo is not None else comissao.json()
+        if assincrono:
+            return await self.enviar_job('stream_app1_app5', comissao_json, 'comissao')
+        msg = await self.enviar_e_aguardar('stream_app1_app5', comissao_json)
+
+        resposta = self.resposta_comissao(msg)
+        comissao.clear()
+        return resposta
+
+    async def processar_remessa(self, remessa: Remessa, assincrono: bool = False, corpo: bytes = None):
         """
         Processa uma solicitação de remessa, envia os dados para o stream Redis apropriado e aguarda a resposta.
 
         Args:
             remessa (Remessa): Objeto de remessa contendo os detalhes da remessa.
+            assincrono (bool): Enfileira como job e responde 202 sem aguardar o worker.
+            corpo (bytes): Corpo original da requisição, já validado, encaminhado sem nova serialização.
 
         Returns:
             dict: Um dicionário contendo uma mensagem e os dados da remessa processada.
@@ -261,61 +466,62 @@ class Processador:
         Raises:
             HTTPException: Se houver um erro ao gerar a guia de remessa.
         """
-        remessa_json = remessa.json()
-        self.enviar_para_classe('stream_app1_app6', remessa_json)
-        logger.info("Aguardando respostas ...")
-
-        while True:
-            response_app6 = self.redis_client.xread(
-                {'stream_app6_app1': '0-0'}, block=1000)
-
-            if response_app6:
-                for stream, messages in response_app6:
-                    for msg_id, msg in messages:
-                        if b'status' in msg:
-                            status = msg[b'status'].decode('utf-8')
-                            remessa_id = msg.get(
-                                b'remessa', b'').decode('utf-8')
-                            remessa_data = json.loads(remessa_id)
-
-                            if status == 'true':
-                                logger.info("Resposta recebida de remessa")
-                                remessa.clear()
-                                self.redis_client.xdel(
-                                    'stream_app6_app1', msg_id)
-                                return {"message": "Recebido e processado por Remessa", "data": {"remessa": remessa_data}}
-
-                            else:
-                                raise HTTPException(
-                                    status_code=500, detail="Erro ao gerar a guia de remessa"
-                                )
-                        else:
-                            logger.error(
-                                "Chave 'status' não encontrada na mensagem.")
-
-            print("Nenhuma resposta recebida, continuando a aguardar...")
-            time.sleep(1)
+        remessa_json = corpo if corpo is not None else remessa.json()
+        if assincrono:
+            return await self.enviar_job('stream_app1_app6', remessa_json, 'remessa')
+        msg = await self.enviar_e_aguardar('stream_app1_app6', remessa_json)
+
+        resposta = self.resposta_remessa(msg)
+        remessa.clear()
+        return resposta
 
 
 processador = Processador()
+jobs.registrar_tipo('compra', processador.resposta_compra)
+jobs.registrar_tipo('streaming', processador.resposta_streaming)
+jobs.registrar_tipo('comissao', processador.resposta_comissao)
+jobs.registrar_tipo('remessa', processador.resposta_remessa)
 
 
 @app.post("/processar_compra")
-async def processar_compra_endpoint(compra: Compra):
+async def processar_compra_endpoint(compra: Compra, request: Request, modo: str = None, prefer: str = Header(None),
+                                    idempotency_key: str = Header(None)):
     """
-    Endpoint para processar uma compra.
+    Endpoint para processar uma compra. Repetições da mesma requisição (mesmo header
+    Idempotency-Key ou, sem ele, mesmo corpo) recebem a resposta da primeira.
 
     Args:
         compra (Compra): Objeto de compra contendo os detalhes da compra.
+        modo (str): "async" para enfileirar como job e responder 202 com o ID do job.
+        idempotency_key (str): Chave escolhida pelo cliente para identificar a compra nas repetições.
 
     Returns:
         dict: Um dicionário contendo uma mensagem e os dados da venda processada.
     """
-    return await processador.processar_compra(compra)
+    # O FastAPI já leu (e guardou) o corpo para validar o modelo: os mesmos bytes seguem para o worker
+    corpo = await request.body()
+    chave = idempotencia.chave_efetiva(idempotency_key, corpo)
+    return await idempotencia.executar(
+        'compra', idempotency_key, corpo,
+        lambda: processador.processar_compra(compra, modo_assincrono(modo, prefer), corpo, chave))
+
+
+@app.post("/processar_compra/lote")
+async def processar_compras_lote_endpoint(compras: List[Compra]):
+    """
+    Endpoint para processar um lote de compras.
+
+    Args:
+        compras (List[Compra]): Lista de compras; cada item é acompanhado por GET /jobs/{correlation_id}.
+
+    Returns:
+        JSONResponse: Resposta 202 com o correlation_id de cada item.
+    """
+    return await processador.processar_compras_lote(compras)
 
 
 @app.post("/processar_associacao")
-async def processar_associacao_endpoint(associacao: Associacao):
+async def processar_associacao_endpoint(associacao: Associacao, request: Request):
     """
     Endpoint para processar uma associação.
 
@@ -325,46 +531,164 @@ async def processar_associacao_endpoint(associacao: Associacao):
     Returns:
         dict: Um dicionário contendo uma mensagem indicando o status do processamento.
     """
-    return await processador.processar_associacao(associacao)
+    return await processador.processar_associacao(associacao, await request.body())
 
 
 @app.post("/streaming")
-async def processar_streaming_endpoint(streaming: Streaming):
+async def processar_streaming_endpoint(streaming: Streaming, request: Request, modo: str = None, prefer: str = Header(None)):
     """
     Endpoint para processar uma solicitação de streaming.
 
     Args:
         streaming (Streaming): Objeto de streaming contendo os detalhes do streaming.
+        modo (str): "async" para enfileirar como job e responder 202 com o ID do job.
 
     Returns:
         dict: Um dicionário contendo uma mensagem e os dados do streaming processado.
     """
-    return await processador.processar_streaming(streaming)
+    return await processador.processar_streaming(streaming, modo_assincrono(modo, prefer), await request.body())
 
 
 @app.get("/calcular_comissao")
-async def processar_comissao_endpoint(comissao: Comissao):
+async def processar_comissao_endpoint(request: Request, comissao: Comissao = Body(None), mes: int = None,
+                                      ano: int = None, vendedor_id: int = None, modo: str = None,
+                                      prefer: str = Header(None), if_none_match: str = Header(None)):
     """
-    Endpoint para processar uma solicitação de comissão.
+    Endpoint para processar uma solicitação de comissão. O filtro vem na query
+    (?mes=&ano=&vendedor_id=) ou no corpo JSON; a resposta sai do cache quando possível
+    (ver CacheRelatorios) e traz uma ETag para a revalidação com If-None-Match.
 
     Args:
         comissao (Comissao): Objeto de comissão contendo os detalhes da comissão.
+        modo (str): "async" para enfileirar como job e responder 202 com o ID do job (sem cache).
+        if_none_match (str): ETag da resposta que o cliente já tem.
 
     Returns:
-        dict: Um dicionário contendo uma mensagem e os dados da comissão processada.
+        Response: Mensagem e dados da comissão processada, ou 304 se o cliente já tem a versão atual.
     """
-    return await processador.processar_comissao(comissao)
+    comissao = modelo_da_consulta(Comissao, comissao, mes=mes, ano=ano, vendedor_id=vendedor_id)
+    corpo = await request.body() or None
+    if modo_assincrono(modo, prefer):
+        return await processador.processar_comissao(comissao, True, corpo)
+
+    # processar_comissao limpa o modelo: a chave do cache é lida antes
+    ano, mes, vendedor_id = comissao.ano, comissao.mes, comissao.vendedor_id
+    registro = await cache.comissao(ano, mes, vendedor_id,
+                                    lambda: processador.processar_comissao(comissao, False, corpo))
+    return cache.resposta(registro, if_none_match, cache.cache_control_comissao(ano, mes))
 
 
 @app.get("/gera_remessa")
-async def processar_remessa_endpoint(remessa: Remessa):
+async def processar_remessa_endpoint(request: Request, remessa: Remessa = Body(None), codigo_venda: int = None,
+                                     modo: str = None, prefer: str = Header(None),
+                                     if_none_match: str = Header(None)):
     """
-    Endpoint para processar uma solicitação de remessa.
+    Endpoint para processar uma solicitação de remessa. O código da venda vem na query
+    (?codigo_venda=) ou no corpo JSON; a guia sai do cache quando possível (ver
+    CacheRelatorios) e traz uma ETag para a revalidação com If-None-Match.
 
     Args:
         remessa (Remessa): Objeto de remessa contendo os detalhes da remessa.
+        modo (str): "async" para enfileirar como job e responder 202 com o ID do job (sem cache).
+        if_none_match (str): ETag da resposta que o cliente já tem.
+
+    Returns:
+        Response: Mensagem e dados da remessa processada, ou 304 se o cliente já tem a versão atual.
+    """
+    remessa = modelo_da_consulta(Remessa, remessa, codigo_venda=codigo_venda)
+    corpo = await request.body() or None
+    if modo_assincrono(modo, prefer):
+        return await processador.processar_remessa(remessa, True, corpo)
+
+    registro = await cache.remessa(remessa.codigo_venda,
+                                   lambda: processador.processar_remessa(remessa, False, corpo))
+    return cache.resposta(registro, if_none_match, "private, no-cache")
+
+
+@app.get("/jobs/{job_id}")
+async def consultar_job_endpoint(job_id: str, aguardar: float = 0):
+    """
+    Endpoint para consultar um job do modo assíncrono.
+
+    Args:
+        job_id (str): Identificador devolvido na resposta 202.
+        aguardar (float): Long-poll: segundos a aguardar pela conclusão antes de responder.
+
+    Returns:
+        JSONResponse: 202 enquanto o job está pendente; 200 com o resultado quando concluído.
+    """
+    job = await jobs.consultar(job_id, aguardar)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+
+    return JSONResponse(status_code=202 if job['status'] == 'pendente' else 200, content=job)
+
+
+@app.get("/monitoramento/admissao")
+async def monitoramento_admissao_endpoint():
+    """
+    Endpoint para acompanhar o controle de admissão desta instância.
+
+    Returns:
+        dict: Por stream, a classe de limites, as requisições em andamento, o último
+        backlog lido e as requisições recusadas.
+    """
+    return admissao.estado()
+
+
+@app.get("/monitoramento/streams")
+async def monitoramento_streams_endpoint():
+    """
+    Endpoint para acompanhar a retenção dos streams de requisição e de resposta.
+
+    Returns:
+        dict: Por stream, o comprimento, a memória ocupada, o limite configurado e a
+        posição de cada consumer group.
+    """
+    return await estado_streams(r, STREAMS_REQUISICAO + STREAMS_RESPOSTA)
+
+
+def valida_stream(stream: str) -> str:
+    """
+    Garante que o stream informado na URL é um dos streams de requisição.
+
+    Raises:
+        HTTPException: 404 para um stream desconhecido.
+    """
+    if stream not in STREAMS_REQUISICAO:
+        raise HTTPException(status_code=404, detail="Stream não encontrado")
+    return stream
+
+
+@app.get("/admin/dead_letters/{stream}")
+async def lista_dead_letters_endpoint(stream: str, inicio: str = '-', quantidade: int = 100):
+    """
+    Endpoint para listar as mensagens que esgotaram as tentativas num worker.
+
+    Args:
+        stream (str): Stream de requisição do worker (ex.: stream_app1_app3).
+        inicio (str): ID a partir do qual listar (paginação).
+        quantidade (int): Máximo de mensagens.
+
+    Returns:
+        dict: As mensagens da dead-letter.
+    """
+    mensagens = await lista_dead_letters(r, valida_stream(stream), inicio, quantidade)
+    return {"stream": stream, "mensagens": mensagens}
+
+
+@app.post("/admin/dead_letters/{stream}/reprocessar")
+async def reprocessa_dead_letters_endpoint(stream: str, ids: List[str] = None, quantidade: int = 100):
+    """
+    Endpoint para reprocessar em lote mensagens da dead-letter de um worker.
+
+    Args:
+        stream (str): Stream de requisição do worker (ex.: stream_app1_app3).
+        ids (List[str]): IDs das mensagens na dead-letter; sem eles, as `quantidade` mais antigas.
+        quantidade (int): Máximo de mensagens quando os IDs não são informados.
 
     Returns:
-        dict: Um dicionário contendo uma mensagem e os dados da remessa processada.
+        dict: A quantidade de mensagens devolvidas ao worker.
     """
-    return await processador.processar_remessa(remessa)
+    reprocessadas = await reprocessa_dead_letters(r, valida_stream(stream), ids, quantidade)
+    return {"stream": stream, "reprocessadas": reprocessadas}
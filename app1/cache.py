@@ -0,0 +1,180 @@
+import json
+import asyncio
+import hashlib
+from datetime import date, datetime, time, timedelta
+from config import settings, logger
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+# Chaves do cache de relatórios, as mesmas de tools/cache_relatorios.py (o produto_fisico
+# incrementa a geração do mês de cada venda gravada)
+
+
+def chave_geracao_comissao(ano: int, mes: int) -> str:
+    return f"cache:comissao:geracao:{ano}-{mes:02d}"
+
+
+def chave_comissao(ano: int, mes: int, geracao: int) -> str:
+    return f"cache:comissao:{ano}-{mes:02d}:{geracao}"
+
+
+def chave_remessa(codigo_venda: int) -> str:
+    return f"cache:remessa:{codigo_venda}"
+
+
+def calcula_etag(dados) -> str:
+    corpo = json.dumps(dados, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return f'"{hashlib.sha256(corpo.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def etag_confere(if_none_match: str, etag: str) -> bool:
+    """
+    Indica se o header If-None-Match do cliente contém a ETag atual (comparação fraca).
+    """
+    if not if_none_match:
+        return False
+    etiquetas = [etiqueta.strip().removeprefix('W/') for etiqueta in if_none_match.split(',')]
+    return '*' in etiquetas or etag in etiquetas
+
+
+class CacheRelatorios:
+    """
+    Classe que guarda no Redis as respostas dos relatórios (comissão e guia de remessa),
+    com uma ETag para a revalidação pelos clientes, e junta numa só chamada ao worker
+    as requisições idênticas em andamento nesta instância (singleflight).
+
+    A comissão de um mês encerrado não muda e fica em cache sem expiração (ou por
+    settings.cache.ttl_mes_fechado); a do mês corrente expira em ttl_mes_aberto e é
+    invalidada pelo produto_fisico a cada venda gravada. A guia de remessa traz a data
+    de emissão (CURRENT_DATE) e fica em cache até a meia-noite.
+    """
+
+    def __init__(self, redis_client):
+        """
+        Inicializa o cache.
+
+        Args:
+            redis_client: Cliente Redis assíncrono.
+        """
+        self.redis_client = redis_client
+        self.ttl_mes_aberto = settings.cache.ttl_mes_aberto
+        self.ttl_mes_fechado = settings.cache.ttl_mes_fechado
+        self.max_age_fechado = settings.cache.max_age_fechado
+        # chave -> future do cálculo em andamento
+        self._em_andamento = {}
+
+    async def _singleflight(self, chave: str, calcula):
+        """
+        Executa `calcula` uma única vez para as chamadas concorrentes com a mesma chave:
+        as demais aguardam o mesmo resultado (ou a mesma exceção).
+
+        Args:
+            chave (str): Identificador da chamada.
+            calcula: Função sem argumentos que retorna a corrotina do cálculo.
+
+        Returns:
+            O resultado do cálculo.
+        """
+        future = self._em_andamento.get(chave)
+        if future is None:
+            future = asyncio.ensure_future(calcula())
+            self._em_andamento[chave] = future
+            future.add_done_callback(lambda _: self._em_andamento.pop(chave, None))
+        else:
+            logger.info(f"Requisição idêntica em andamento, aguardando: {chave}")
+        # shield: o cancelamento de um cliente não interrompe o cálculo dos demais
+        return await asyncio.shield(future)
+
+    async def _le_ou_calcula(self, chave: str, campo: str, calcula, ttl: int = None,
+                             expira_em: datetime = None) -> dict:
+        """
+        Lê a resposta do cache ou a calcula e grava, com a ETag.
+
+        Args:
+            chave (str): Hash Redis do relatório.
+            campo (str): Campo do hash.
+            calcula: Função sem argumentos que retorna a corrotina da resposta.
+            ttl (int): TTL (s) do hash; None ou 0 para não expirar.
+            expira_em (datetime): Horário de expiração, no lugar do TTL.
+
+        Returns:
+            dict: {'etag': ..., 'dados': ...}
+        """
+        valor = await self.redis_client.hget(chave, campo)
+        if valor is not None:
+            return json.loads(valor)
+
+        async def calcula_e_grava():
+            dados = await calcula()
+            registro = {'etag': calcula_etag(dados), 'dados': dados}
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(chave, campo, json.dumps(registro))
+            if ttl:
+                pipe.expire(chave, ttl)
+            elif expira_em:
+                pipe.expireat(chave, expira_em)
+            await pipe.execute()
+            return registro
+
+        return await self._singleflight(f"{chave}:{campo}", calcula_e_grava)
+
+    @staticmethod
+    def mes_encerrado(ano: int, mes: int) -> bool:
+        hoje = date.today()
+        return (ano, mes) < (hoje.year, hoje.month)
+
+    async def comissao(self, ano: int, mes: int, vendedor_id: int, calcula) -> dict:
+        """
+        Retorna a comissão de um vendedor (ou de todos) no mês, do cache ou calculada pelo worker.
+
+        Args:
+            ano (int): Ano.
+            mes (int): Mês.
+            vendedor_id (int): ID do vendedor, ou None para todos os vendedores.
+            calcula: Função sem argumentos que retorna a corrotina da resposta do worker.
+
+        Returns:
+            dict: {'etag': ..., 'dados': ...}
+        """
+        geracao = int(await self.redis_client.get(chave_geracao_comissao(ano, mes)) or 0)
+        ttl = self.ttl_mes_fechado if self.mes_encerrado(ano, mes) else self.ttl_mes_aberto
+        return await self._le_ou_calcula(chave_comissao(ano, mes, geracao),
+                                        'todos' if vendedor_id is None else str(vendedor_id), calcula, ttl)
+
+    async def remessa(self, codigo_venda: int, calcula) -> dict:
+        """
+        Retorna a guia de remessa de uma venda, do cache ou gerada pelo worker.
+
+        Args:
+            codigo_venda (int): ID da venda.
+            calcula: Função sem argumentos que retorna a corrotina da resposta do worker.
+
+        Returns:
+            dict: {'etag': ..., 'dados': ...}
+        """
+        meia_noite = datetime.combine(date.today() + timedelta(days=1), time())
+        return await self._le_ou_calcula(chave_remessa(codigo_venda), 'guia', calcula,
+                                         expira_em=meia_noite)
+
+    @staticmethod
+    def resposta(registro: dict, if_none_match: str, cache_control: str) -> Response:
+        """
+        Monta a resposta com a ETag: 304 sem corpo se o cliente já tem a versão atual.
+
+        Args:
+            registro (dict): {'etag': ..., 'dados': ...}
+            if_none_match (str): Header If-None-Match da requisição.
+            cache_control (str): Header Cache-Control da resposta.
+
+        Returns:
+            Response: 200 com os dados ou 304.
+        """
+        cabecalhos = {'ETag': registro['etag'], 'Cache-Control': cache_control}
+        if etag_confere(if_none_match, registro['etag']):
+            return Response(status_code=304, headers=cabecalhos)
+        return JSONResponse(content=registro['dados'], headers=cabecalhos)
+
+    def cache_control_comissao(self, ano: int, mes: int) -> str:
+        if self.mes_encerrado(ano, mes):
+            return f"private, max-age={self.max_age_fechado}"
+        return "private, no-cache"
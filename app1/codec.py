@@ -0,0 +1,66 @@
+import gzip
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Leitura do formato versionado dos campos de dados das respostas dos workers
+# (codificadas por tools/codec.py): o campo `codec` da mensagem traz
+# "<versão>:<serialização>[+<compressão>]", ex.: "1:json" ou "1:msgpack+zstd".
+VERSAO = 1
+CAMPO_CODEC = 'codec'
+
+
+def _desserializa(dados: bytes, formato: str):
+    if formato == 'msgpack':
+        return msgpack.unpackb(dados, raw=False)
+    if formato == 'json':
+        return json.loads(dados)
+    raise ValueError(f"Serialização não suportada: {formato}")
+
+
+def _descomprime(dados: bytes, compressao: str) -> bytes:
+    if compressao == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(dados)
+    if compressao == 'gzip':
+        return gzip.decompress(dados)
+    raise ValueError(f"Compressão não suportada: {compressao}")
+
+
+def decodifica_campo(msg: dict, campo: str):
+    """
+    Lê um campo de dados de uma resposta de worker. Respostas sem o campo `codec`
+    (formato anterior) têm o valor devolvido como texto.
+
+    Args:
+        msg (dict): Campos da mensagem, com chaves em bytes.
+        campo (str): Nome do campo.
+
+    Returns:
+        O valor decodificado, ou None se o campo não existir.
+
+    Raises:
+        ValueError: Se a versão, a serialização ou a compressão não forem suportadas.
+    """
+    valor = msg.get(campo.encode('utf-8'))
+    if valor is None:
+        return None
+
+    codec = msg.get(CAMPO_CODEC.encode('utf-8'))
+    if codec is None:
+        return valor.decode('utf-8')
+
+    versao, _, nome = codec.decode('utf-8').partition(':')
+    if versao != str(VERSAO):
+        raise ValueError(f"Versão do formato não suportada: {versao}")
+    formato, _, compressao = nome.partition('+')
+    if compressao:
+        valor = _descomprime(valor, compressao)
+    return _desserializa(valor, formato)
@@ -0,0 +1,173 @@
+import uuid
+import asyncio
+import redis
+from config import logger
+
+
+def novo_correlation_id() -> str:
+    """
+    Gera um identificador único para correlacionar uma requisição com a sua resposta.
+
+    Returns:
+        str: O correlation_id em formato hexadecimal.
+    """
+    return uuid.uuid4().hex
+
+
+class DespachanteRespostas:
+    """
+    Classe que lê os streams de resposta dos workers em segundo plano e entrega
+    cada mensagem ao request que a aguarda, usando o correlation_id ecoado pelo worker.
+    """
+
+    def __init__(self, redis_client, streams: list, sem_dono=None):
+        """
+        Inicializa o despachante.
+
+        Args:
+            redis_client: Cliente Redis assíncrono utilizado para ler os streams de resposta.
+            streams (list): Lista com os nomes dos streams de resposta.
+            sem_dono: Corrotina opcional `sem_dono(correlation_id, msg)` chamada para as
+                respostas que nenhuma requisição desta instância aguarda (ex.: jobs assíncronos).
+        """
+        self.redis_client = redis_client
+        self.streams = {stream: '0-0' for stream in streams}
+        self.pendentes = {}
+        self.sem_dono = sem_dono
+        self._tarefa = None
+
+    async def iniciar(self):
+        """
+        Posiciona a leitura no fim de cada stream e inicia a tarefa de leitura.
+
+        Returns:
+            None
+        """
+        for stream in self.streams:
+            ultima = await self.redis_client.xrevrange(stream, count=1)
+            if ultima:
+                self.streams[stream] = ultima[0][0]
+
+        self._tarefa = asyncio.create_task(self._executar())
+        logger.info("Despachante de respostas iniciado")
+
+    async def parar(self):
+        """
+        Interrompe a tarefa de leitura e cancela as requisições ainda pendentes.
+
+        Returns:
+            None
+        """
+        if self._tarefa:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+
+        for future in self.pendentes.values():
+            future.cancel()
+        self.pendentes.clear()
+
+    def registrar(self, correlation_id: str) -> asyncio.Future:
+        """
+        Registra uma requisição que aguarda resposta. Deve ser chamado antes do envio
+        da mensagem, para que uma resposta rápida não seja perdida.
+
+        Args:
+            correlation_id (str): Identificador da requisição.
+
+        Returns:
+            asyncio.Future: Future resolvido com a mensagem de resposta.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pendentes[correlation_id] = future
+        return future
+
+    def descartar(self, correlation_id: str):
+        """
+        Remove uma requisição pendente (por exemplo, quando o cliente desiste).
+
+        Args:
+            correlation_id (str): Identificador da requisição.
+
+        Returns:
+            None
+        """
+        self.pendentes.pop(correlation_id, None)
+
+    async def aguardar_resposta(self, correlation_id: str, timeout: float = None) -> dict:
+        """
+        Aguarda, sem bloquear o event loop, a resposta de uma requisição registrada.
+
+        Args:
+            correlation_id (str): Identificador da requisição.
+            timeout (float): Tempo máximo de espera em segundos (None aguarda indefinidamente).
+
+        Returns:
+            dict: Os campos da mensagem de resposta do worker.
+
+        Raises:
+            asyncio.TimeoutError: Se a resposta não chegar dentro do timeout.
+        """
+        future = self.pendentes.get(correlation_id)
+        if future is None:
+            future = self.registrar(correlation_id)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.descartar(correlation_id)
+
+    async def _entregar(self, stream: str, msg_id, msg: dict):
+        """
+        Resolve o future da requisição correspondente à mensagem de resposta. O future
+        continua registrado até que aguardar_resposta o descarte: a resposta que chega
+        antes de a requisição começar a aguardar não é perdida.
+
+        Args:
+            stream (str): Nome do stream de resposta.
+            msg_id: ID da mensagem no stream.
+            msg (dict): Campos da mensagem de resposta.
+
+        Returns:
+            None
+        """
+        correlation_id = msg.get(b'correlation_id', b'').decode('utf-8')
+        if not correlation_id:
+            logger.error(f"Resposta sem correlation_id em {stream}: {msg_id}")
+            return
+
+        future = self.pendentes.get(correlation_id)
+        if future is None:
+            # Job assíncrono, resposta de outra instância do gateway ou requisição abandonada
+            if self.sem_dono:
+                await self.sem_dono(correlation_id, msg)
+            return
+
+        if not future.done():
+            future.set_result(msg)
+        await self.redis_client.xdel(stream, msg_id)
+
+    async def _executar(self):
+        """
+        Loop de leitura: uma única leitura bloqueante cobre todos os streams de resposta.
+
+        Returns:
+            None
+        """
+        while True:
+            try:
+                respostas = await self.redis_client.xread(self.streams, block=1000)
+            except redis.RedisError as e:
+                logger.error(f"Erro ao ler respostas do Redis: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for stream, mensagens in respostas or []:
+                stream = stream.decode('utf-8')
+                for msg_id, msg in mensagens:
+                    self.streams[stream] = msg_id
+                    try:
+                        await self._entregar(stream, msg_id, msg)
+                    except Exception as e:
+                        logger.error(f"Erro ao entregar resposta {msg_id} de {stream}: {e}")
@@ -0,0 +1,156 @@
+import json
+import hashlib
+from config import settings, logger
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# Tamanho máximo aceito para o header Idempotency-Key (coluna vendas.chave_idempotencia)
+TAMANHO_MAXIMO_CHAVE = 255
+
+
+class ControleIdempotencia:
+    """
+    Classe que deduplica no gateway as requisições repetidas pelos clientes (retries):
+    a primeira requisição reserva a chave no Redis (SET NX com TTL) e, ao terminar,
+    grava nela a resposta; as repetições recebem a resposta gravada sem chegar aos workers.
+    """
+
+    def __init__(self, redis_client):
+        """
+        Inicializa o controle.
+
+        Args:
+            redis_client: Cliente Redis assíncrono.
+        """
+        self.redis_client = redis_client
+        self.ttl = settings.idempotencia.ttl
+        self.ttl_pendente = settings.idempotencia.ttl_pendente
+        self.ttl_conteudo = settings.idempotencia.ttl_conteudo
+        self.chave_conteudo = settings.idempotencia.chave_conteudo
+
+    @staticmethod
+    def chave(operacao: str, chave: str) -> str:
+        return f"idempotencia:{operacao}:{chave}"
+
+    def chave_efetiva(self, chave_cliente: str, corpo: bytes) -> str:
+        """
+        Chave repassada ao worker para que a venda não seja gravada duas vezes: o header
+        Idempotency-Key ou, na falta dele (e com settings.idempotencia.chave_conteudo),
+        o hash do corpo. Uma repetição depois de um 504 chega ao worker com a mesma
+        chave e não grava a venda de novo; para repetir de propósito uma compra com o
+        mesmo corpo, o cliente envia um Idempotency-Key próprio.
+
+        Args:
+            chave_cliente (str): Valor do header Idempotency-Key, ou None.
+            corpo (bytes): Corpo original da requisição.
+
+        Returns:
+            str: A chave, ou None se a requisição não tiver chave (o worker usa o correlation_id).
+        """
+        if chave_cliente:
+            return chave_cliente
+        if self.chave_conteudo:
+            return f"conteudo:{hashlib.sha256(corpo).hexdigest()}"
+        return None
+
+    async def _reservar(self, chave: str, impressao: str) -> dict:
+        """
+        Reserva a chave para esta requisição, de forma atômica.
+
+        Args:
+            chave (str): Chave Redis.
+            impressao (str): Hash do corpo da requisição.
+
+        Returns:
+            dict: None se a chave foi reservada; senão, o registro da requisição anterior.
+
+        Raises:
+            HTTPException: 503 se a chave não puder ser reservada nem lida (ela expira
+                entre o SET e o GET a cada tentativa); processar sem a reserva
+                desligaria a deduplicação.
+        """
+        registro = json.dumps({'status': 'pendente', 'impressao': impressao})
+        for _ in range(2):
+            if await self.redis_client.set(chave, registro, nx=True, ex=self.ttl_pendente):
+                return None
+            anterior = await self.redis_client.get(chave)
+            # A chave pode expirar entre o SET e o GET: nova tentativa de reserva
+            if anterior is not None:
+                return json.loads(anterior)
+        logger.warning(f"Não foi possível reservar a chave de idempotência {chave}")
+        raise HTTPException(status_code=503, detail="Não foi possível registrar a requisição",
+                            headers={'Retry-After': '1'})
+
+    @staticmethod
+    def _repete(anterior: dict, impressao: str) -> JSONResponse:
+        """
+        Responde a uma requisição repetida com a resposta gravada da primeira.
+
+        Raises:
+            HTTPException: 422 se a chave foi usada com outro corpo; 409 se a primeira
+                requisição ainda está em andamento.
+        """
+        if anterior['impressao'] != impressao:
+            raise HTTPException(
+                status_code=422, detail="Idempotency-Key já utilizada com outra requisição")
+        if anterior['status'] == 'pendente':
+            raise HTTPException(status_code=409, detail="Requisição com a mesma chave em processamento",
+                                headers={'Retry-After': '1'})
+
+        cabecalhos = dict(anterior.get('cabecalhos', {}), **{'Idempotent-Replayed': 'true'})
+        return JSONResponse(status_code=anterior['codigo'], content=anterior['resultado'],
+                            headers=cabecalhos)
+
+    async def executar(self, operacao: str, chave_cliente: str, corpo: bytes, processa):
+        """
+        Executa a requisição uma única vez por chave. A chave é o header Idempotency-Key
+        ou, na falta dele (e com settings.idempotencia.chave_conteudo), o hash do corpo,
+        que deduplica só as repetições feitas dentro de ttl_conteudo segundos.
+        Se o processamento falhar, a reserva é liberada para que o cliente possa repetir.
+
+        Args:
+            operacao (str): Nome da operação (separa as chaves de cada endpoint).
+            chave_cliente (str): Valor do header Idempotency-Key, ou None.
+            corpo (bytes): Corpo original da requisição.
+            processa: Função sem argumentos que retorna a corrotina do processamento.
+
+        Returns:
+            A resposta do processamento, ou JSONResponse com a resposta gravada nas repetições.
+
+        Raises:
+            HTTPException: 400 para uma chave inválida, 409 e 422 nas repetições (ver _repete),
+                503 se a chave não puder ser reservada (ver _reservar) e as levantadas pelo processamento.
+        """
+        impressao = hashlib.sha256(corpo).hexdigest()
+        if chave_cliente:
+            if len(chave_cliente) > TAMANHO_MAXIMO_CHAVE:
+                raise HTTPException(
+                    status_code=400, detail=f"Idempotency-Key excede {TAMANHO_MAXIMO_CHAVE} caracteres")
+            chave, ttl = self.chave(operacao, chave_cliente), self.ttl
+        elif self.chave_conteudo:
+            chave, ttl = self.chave(operacao, impressao), self.ttl_conteudo
+        else:
+            return await processa()
+
+        anterior = await self._reservar(chave, impressao)
+        if anterior is not None:
+            logger.info(f"Requisição repetida: {chave}")
+            return self._repete(anterior, impressao)
+
+        try:
+            resposta = await processa()
+        except BaseException:
+            await self.redis_client.delete(chave)
+            raise
+
+        registro = {'status': 'concluido', 'impressao': impressao}
+        if isinstance(resposta, JSONResponse):
+            registro['codigo'] = resposta.status_code
+            registro['resultado'] = json.loads(resposta.body)
+            if 'location' in resposta.headers:
+                registro['cabecalhos'] = {'Location': resposta.headers['location']}
+        else:
+            registro['codigo'] = 200
+            registro['resultado'] = resposta
+        await self.redis_client.set(chave, json.dumps(registro), ex=ttl)
+        return resposta
@@ -0,0 +1,160 @@
+import json
+import time
+import asyncio
+from config import settings, logger
+from fastapi import HTTPException
+
+
+class GerenciadorJobs:
+    """
+    Classe que registra os jobs do modo assíncrono em hashes Redis (job:<id>) e grava
+    neles o resultado devolvido pelo worker, com TTL, para consulta em GET /jobs/{id}.
+    """
+
+    def __init__(self, redis_client):
+        """
+        Inicializa o gerenciador.
+
+        Args:
+            redis_client: Cliente Redis assíncrono.
+        """
+        self.redis_client = redis_client
+        self.ttl_pendente = settings.jobs.ttl_pendente
+        self.ttl_resultado = settings.jobs.ttl_resultado
+        self.montadores = {}
+        # job_id -> evento do long-poll e quantidade de requisições aguardando por ele
+        self._eventos = {}
+        self._aguardando = {}
+
+    @staticmethod
+    def chave(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    def registrar_tipo(self, tipo: str, montador):
+        """
+        Associa um tipo de job à função que transforma a resposta do worker no corpo
+        da resposta HTTP (a mesma usada pelo modo síncrono).
+
+        Args:
+            tipo (str): Tipo do job (compra, streaming, comissao, remessa).
+            montador: Função `montador(msg) -> dict` que pode levantar HTTPException.
+
+        Returns:
+            None
+        """
+        self.montadores[tipo] = montador
+
+    async def criar(self, job_id: str, tipo: str, pipe=None):
+        """
+        Cria o registro de um job pendente. Deve ser chamado antes do envio ao worker.
+
+        Args:
+            job_id (str): Identificador do job (também usado como correlation_id).
+            tipo (str): Tipo do job.
+            pipe: Pipeline Redis opcional; quando informado, os comandos apenas são enfileirados.
+
+        Returns:
+            None
+        """
+        alvo = pipe if pipe is not None else self.redis_client.pipeline(transaction=False)
+        alvo.hset(self.chave(job_id), mapping={
+            'status': 'pendente', 'tipo': tipo, 'criado_em': time.time()})
+        alvo.expire(self.chave(job_id), self.ttl_pendente)
+        if pipe is None:
+            await alvo.execute()
+
+    async def concluir(self, job_id: str, msg: dict) -> bool:
+        """
+        Grava no job o resultado da resposta do worker. Respostas cujo correlation_id
+        não corresponde a um job pendente (ex.: já concluído por outra instância do
+        gateway) não são gravadas, mas acordam as consultas que aguardam o job nesta
+        instância, que releem o resultado. Uma resposta que não pode ser
+        lida (ex.: campo com codec inválido) conclui o job com erro 502, em vez de
+        deixá-lo pendente até expirar.
+
+        Args:
+            job_id (str): Identificador do job.
+            msg (dict): Campos da mensagem de resposta do worker.
+
+        Returns:
+            bool: True se a resposta pertencia a um job pendente.
+        """
+        chave = self.chave(job_id)
+        status, tipo = await self.redis_client.hmget(chave, 'status', 'tipo')
+        if status != b'pendente':
+            self._acorda(job_id)
+            return False
+
+        montador = self.montadores.get(tipo.decode('utf-8'))
+        try:
+            resultado = montador(msg)
+            campos = {'status': 'concluido', 'codigo': 200,
+                      'resultado': json.dumps(resultado)}
+        except HTTPException as e:
+            campos = {'status': 'erro', 'codigo': e.status_code,
+                      'resultado': json.dumps({'detail': e.detail})}
+        except Exception as e:
+            logger.error(f"Resposta inválida do worker para o job {job_id}: {e}")
+            campos = {'status': 'erro', 'codigo': 502,
+                      'resultado': json.dumps({'detail': "Resposta inválida do serviço"})}
+
+        campos['concluido_em'] = time.time()
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hset(chave, mapping=campos)
+        pipe.expire(chave, self.ttl_resultado)
+        await pipe.execute()
+        logger.info(f"Job {job_id} concluído: {campos['status']}")
+        self._acorda(job_id)
+        return True
+
+    def _acorda(self, job_id: str):
+        """
+        Libera as consultas com long-poll que aguardam o job nesta instância.
+        """
+        evento = self._eventos.pop(job_id, None)
+        self._aguardando.pop(job_id, None)
+        if evento:
+            evento.set()
+
+    async def consultar(self, job_id: str, aguardar: float = 0) -> dict:
+        """
+        Consulta um job. Com `aguardar`, faz long-poll: espera até esse número de
+        segundos pela conclusão antes de responder.
+
+        Args:
+            job_id (str): Identificador do job.
+            aguardar (float): Tempo máximo de espera em segundos.
+
+        Returns:
+            dict: Os dados do job, ou None se ele não existir (ou já tiver expirado).
+        """
+        job = await self._le(job_id)
+        if job is None or job['status'] != 'pendente' or not aguardar:
+            return job
+
+        # O evento é compartilhado pelas requisições que aguardam o mesmo job: só a
+        # última a desistir o remove, e as demais continuam sendo acordadas
+        evento = self._eventos.setdefault(job_id, asyncio.Event())
+        self._aguardando[job_id] = self._aguardando.get(job_id, 0) + 1
+        try:
+            await asyncio.wait_for(evento.wait(), min(aguardar, settings.jobs.aguardar_max))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if self._eventos.get(job_id) is evento:
+                self._aguardando[job_id] -= 1
+                if not self._aguardando[job_id]:
+                    del self._eventos[job_id], self._aguardando[job_id]
+        return await self._le(job_id)
+
+    async def _le(self, job_id: str) -> dict:
+        dados = await self.redis_client.hgetall(self.chave(job_id))
+        if not dados:
+            return None
+
+        dados = {k.decode('utf-8'): v.decode('utf-8') for k, v in dados.items()}
+        job = {'job_id': job_id, 'status': dados['status'], 'tipo': dados['tipo']}
+        if 'resultado' in dados:
+            job['codigo'] = int(dados['codigo'])
+            job['resultado'] = json.loads(dados['resultado'])
+        return job
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -69,7 +70,7 @@ class Streaming(BaseModel):
 class Comissao(BaseModel):
     mes: int
     ano: int
-    vendedor_id: int
+    vendedor_id: Optional[int] = None  # Sem vendedor, todos os vendedores do mês
 
     def clear(self):
         self.mes = ""
@@ -0,0 +1,164 @@
+import time
+import redis.asyncio as redis
+from config import settings, logger
+
+# Streams de requisição, um por worker
+STREAMS_REQUISICAO = ['stream_app1_app2', 'stream_app1_app3',
+                      'stream_app1_app4', 'stream_app1_app5', 'stream_app1_app6']
+
+# Campos que as retentativas e a dead-letter dos workers (tools/retentativas.py)
+# acrescentam às mensagens, removidos ao reprocessar uma dead-letter; o prazo
+# também, pois já venceu e faria o worker descartar a mensagem reprocessada
+CAMPOS_DLQ = (b'tentativas', b'id_origem', b'erro', b'falhou_em', b'prazo')
+
+
+def stream_dlq(stream: str) -> str:
+    return f"dlq:{stream}"
+
+
+def limite_stream(stream: str) -> int:
+    """
+    Retorna o MAXLEN aproximado da política de retenção do stream (settings.retencao),
+    o mesmo cálculo de tools/redis_streams.py.
+
+    Args:
+        stream (str): Nome do stream.
+
+    Returns:
+        int: Quantidade aproximada de entradas mantidas, ou None para não limitar.
+    """
+    retencao = settings.get('retencao', {})
+    return retencao.get('streams', {}).get(stream, retencao.get('maxlen')) or None
+
+
+def timeout_stream(stream: str) -> float:
+    """
+    Retorna quanto tempo o gateway aguarda a resposta de um worker (settings.prazos):
+    o valor do stream numa tabela [prazos.streams], ou o timeout padrão.
+
+    Args:
+        stream (str): Nome do stream de requisição.
+
+    Returns:
+        float: Timeout em segundos.
+    """
+    prazos = settings.get('prazos', {})
+    return prazos.get('streams', {}).get(stream, prazos.get('timeout', 10))
+
+
+def prazo(segundos: float) -> str:
+    """
+    Calcula o prazo absoluto carimbado nas mensagens (campo `prazo`), lido pelos
+    workers em tools/mensagens.py.
+
+    Args:
+        segundos (float): Tempo a partir de agora.
+
+    Returns:
+        str: Prazo em milissegundos desde a época.
+    """
+    return str(int((time.time() + segundos) * 1000))
+
+
+async def estado_streams(redis_client, streams: list) -> dict:
+    """
+    Levanta o tamanho, a memória ocupada e a posição dos consumer groups de cada
+    stream, para acompanhar a política de retenção, e as mensagens aguardando nova
+    tentativa ou paradas na dead-letter.
+
+    Args:
+        redis_client: Cliente Redis assíncrono.
+        streams (list): Nomes dos streams.
+
+    Returns:
+        dict: Por stream, o comprimento (XLEN), a memória em bytes (MEMORY USAGE),
+        o limite configurado, as retentativas agendadas, as dead-letters e, por grupo,
+        as mensagens pendentes, o lag e o último ID entregue.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for stream in streams:
+        pipe.xlen(stream)
+        pipe.memory_usage(stream)
+        pipe.xinfo_groups(stream)
+        pipe.zcard(f"retentativas:{stream}")
+        pipe.xlen(stream_dlq(stream))
+    resultados = await pipe.execute(raise_on_error=False)
+
+    estado = {}
+    for indice, stream in enumerate(streams):
+        comprimento, memoria, grupos, retentativas, dead_letters = resultados[5 * indice:5 * indice + 5]
+        # Stream ainda inexistente: XINFO GROUPS responde com erro
+        if isinstance(grupos, redis.ResponseError):
+            grupos = []
+        estado[stream] = {
+            'comprimento': comprimento,
+            'memoria_bytes': memoria or 0,
+            'limite': limite_stream(stream),
+            'retentativas': retentativas,
+            'dead_letters': dead_letters,
+            'grupos': {
+                grupo['name'].decode('utf-8'): {
+                    'pendentes': grupo['pending'],
+                    'lag': grupo.get('lag'),
+                    'ultimo_entregue': grupo['last-delivered-id'].decode('utf-8'),
+                } for grupo in grupos
+            },
+        }
+    return estado
+
+
+def _texto(campos: dict) -> dict:
+    return {campo.decode('utf-8'): valor.decode('utf-8', errors='replace') for campo, valor in campos.items()}
+
+
+async def lista_dead_letters(redis_client, stream: str, inicio: str = '-', quantidade: int = 100) -> list:
+    """
+    Lista as mensagens da dead-letter de um stream, das mais antigas para as mais novas.
+
+    Args:
+        redis_client: Cliente Redis assíncrono.
+        stream (str): Stream de requisição do worker.
+        inicio (str): ID a partir do qual listar (paginação).
+        quantidade (int): Máximo de mensagens.
+
+    Returns:
+        list: Mensagens com o ID na dead-letter e os campos como texto.
+    """
+    entradas = await redis_client.xrange(stream_dlq(stream), min=inicio, count=quantidade)
+    return [{'id': msg_id.decode('utf-8'), 'campos': _texto(campos)} for msg_id, campos in entradas]
+
+
+async def reprocessa_dead_letters(redis_client, stream: str, ids: list = None, quantidade: int = 100) -> int:
+    """
+    Devolve mensagens da dead-letter ao stream de requisição, sem os campos das
+    tentativas anteriores, e as remove da dead-letter numa única transação.
+
+    Args:
+        redis_client: Cliente Redis assíncrono.
+        stream (str): Stream de requisição do worker.
+        ids (list): IDs das mensagens na dead-letter; sem eles, as `quantidade` mais antigas.
+        quantidade (int): Máximo de mensagens quando os IDs não são informados.
+
+    Returns:
+        int: Quantidade de mensagens devolvidas.
+    """
+    dlq = stream_dlq(stream)
+    if ids:
+        pipe = redis_client.pipeline(transaction=False)
+        for msg_id in ids:
+            pipe.xrange(dlq, min=msg_id, max=msg_id)
+        entradas = [entrada for resultado in await pipe.execute() for entrada in resultado]
+    else:
+        entradas = await redis_client.xrange(dlq, count=quantidade)
+    if not entradas:
+        return 0
+
+    limite = limite_stream(stream)
+    pipe = redis_client.pipeline(transaction=True)
+    for _, campos in entradas:
+        pipe.xadd(stream, {campo: valor for campo, valor in campos.items() if campo not in CAMPOS_DLQ},
+                  maxlen=limite, approximate=True)
+    pipe.xdel(dlq, *[msg_id for msg_id, _ in entradas])
+    await pipe.execute()
+    logger.info(f"{len(entradas)} mensagens reprocessadas da dead-letter de {stream}")
+    return len(entradas)
@@ -0,0 +1,26 @@
+-- migracao: sem transacao
+-- Índices das consultas por período e das chaves estrangeiras. CONCURRENTLY não
+-- bloqueia as gravações em tabelas já populadas.
+
+-- calcular_comissao_geral: intervalo de datas de todos os vendedores. O INCLUDE
+-- permite responder só com o índice (index-only scan), sem ler a tabela
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_vendas_data_vendedor
+    ON vendas (data, vendedor_id) INCLUDE (quantidade, preco);
+
+-- calcular_comissao_vendedor: um vendedor, intervalo de datas
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_vendas_vendedor_data
+    ON vendas (vendedor_id, data) INCLUDE (quantidade, preco);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_vendas_cliente ON vendas (cliente_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_vendas_produto ON vendas (produto_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_guias_remessa_venda ON guias_remessa (venda_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_guias_royalty_venda ON guias_royalty (venda_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comissoes_venda ON comissoes (venda_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comissoes_vendedor ON comissoes (vendedor_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_associacao_cliente ON associacao (cliente_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_associacao_vendedor ON associacao (vendedor_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_detalhes_produtos_fisicos_produto ON detalhes_produtos_fisicos (produto_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_livros_produto ON livros (produto_id);
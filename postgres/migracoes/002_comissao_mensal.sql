@@ -0,0 +1,27 @@
+-- Totais de comissão por vendedor e mês, atualizados pela gravação de cada venda
+-- (insert_venda_completa) e lidos por calcular_comissao_geral/_vendedor. A chave
+-- começa por (ano, mes): a consulta de todos os vendedores do mês lê um trecho contíguo
+CREATE TABLE IF NOT EXISTS comissao_mensal (
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    vendedor_id INTEGER NOT NULL,
+    total_vendas BIGINT NOT NULL,
+    total_vendas_valor DOUBLE PRECISION NOT NULL,
+    total_recebimentos DOUBLE PRECISION NOT NULL,
+    atualizado_em TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (ano, mes, vendedor_id),
+    FOREIGN KEY (vendedor_id) REFERENCES vendedor(id)
+);
+
+-- Carga inicial a partir das vendas já gravadas (as migrações rodam antes dos workers)
+INSERT INTO comissao_mensal (ano, mes, vendedor_id, total_vendas, total_vendas_valor, total_recebimentos)
+SELECT CAST(EXTRACT(YEAR FROM vf."data") AS INTEGER),
+       CAST(EXTRACT(MONTH FROM vf."data") AS INTEGER),
+       vf.vendedor_id,
+       SUM(vf.quantidade),
+       SUM(CAST(vf.quantidade * vf.preco AS DOUBLE PRECISION)),
+       SUM(vf.quantidade * vf.preco * (v.porcentagem / 100))
+FROM vendas vf
+JOIN vendedor v ON v.id = vf.vendedor_id
+GROUP BY 1, 2, 3
+ON CONFLICT (ano, mes, vendedor_id) DO NOTHING;
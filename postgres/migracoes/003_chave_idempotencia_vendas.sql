@@ -0,0 +1,9 @@
+-- migracao: sem transacao
+-- Chave de idempotência das compras (header Idempotency-Key ou a chave derivada pelo
+-- app1): uma compra repetida com a mesma chave não grava a venda de novo. Bancos
+-- criados antes dela pelo init_banco.sql não têm a coluna.
+ALTER TABLE vendas ADD COLUMN IF NOT EXISTS chave_idempotencia VARCHAR(255);
+
+-- Única, para o ON CONFLICT de insert_venda_completa; várias vendas sem chave (NULL) são aceitas
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_vendas_chave_idempotencia
+    ON vendas (chave_idempotencia);
@@ -0,0 +1,159 @@
+-- Particionamento mensal (RANGE por data) de vendas e das tabelas que dependem dela:
+-- comissoes (data_pagamento), guias_royalty e guias_remessa (data_geracao). Essas datas
+-- são sempre a data da venda, então as partições de um mês das quatro tabelas andam
+-- juntas e podem ser arquivadas juntas (tools/particoes.py).
+--
+-- Num Postgres particionado, a chave primária e as UNIQUE precisam conter a chave de
+-- partição: a de vendas passa a ser (id, data) e as chaves estrangeiras das dependentes
+-- passam a ser (venda_id, <data>). A chave de idempotência, que precisa ser única entre
+-- todas as partições, vai para vendas_localizacao, que também diz em que data (e
+-- partição) está cada venda: as buscas por ID (gera_guia_remessa) e por chave de
+-- idempotência leem só a partição da venda.
+
+CREATE SCHEMA IF NOT EXISTS arquivo;
+
+CREATE TABLE vendas_localizacao (
+    venda_id INTEGER PRIMARY KEY,
+    data DATE NOT NULL,
+    chave_idempotencia VARCHAR(255) UNIQUE
+);
+
+INSERT INTO vendas_localizacao (venda_id, data, chave_idempotencia)
+SELECT id, data, chave_idempotencia FROM vendas;
+
+-- As tabelas atuais saem do caminho; as sequences dos IDs continuam as mesmas
+ALTER TABLE vendas RENAME TO vendas_antiga;
+ALTER TABLE comissoes RENAME TO comissoes_antiga;
+ALTER TABLE guias_royalty RENAME TO guias_royalty_antiga;
+ALTER TABLE guias_remessa RENAME TO guias_remessa_antiga;
+ALTER SEQUENCE vendas_id_seq OWNED BY NONE;
+ALTER SEQUENCE comissoes_id_seq OWNED BY NONE;
+ALTER SEQUENCE guias_royalty_id_seq OWNED BY NONE;
+ALTER SEQUENCE guias_remessa_id_seq OWNED BY NONE;
+
+CREATE TABLE vendas (
+    id INTEGER NOT NULL DEFAULT nextval('vendas_id_seq'),
+    data DATE NOT NULL,
+    cliente_id VARCHAR(20) NOT NULL,
+    vendedor_id INTEGER NOT NULL,
+    tipo_compra TEXT NOT NULL,
+    produto_id INTEGER NOT NULL,
+    quantidade INTEGER NOT NULL,
+    preco REAL NOT NULL,
+    tipo_pagamento TEXT NOT NULL,
+    -- Header Idempotency-Key da compra; a unicidade fica em vendas_localizacao
+    chave_idempotencia VARCHAR(255),
+    PRIMARY KEY (id, data),
+    FOREIGN KEY (produto_id) REFERENCES produtos(id)
+) PARTITION BY RANGE (data);
+
+CREATE TABLE guias_royalty (
+    id INTEGER NOT NULL DEFAULT nextval('guias_royalty_id_seq'),
+    venda_id INTEGER NOT NULL,
+    data_geracao DATE NOT NULL,
+    status TEXT NOT NULL,
+    valor TEXT NOT NULL,
+    PRIMARY KEY (id, data_geracao),
+    FOREIGN KEY (venda_id, data_geracao) REFERENCES vendas(id, data)
+) PARTITION BY RANGE (data_geracao);
+
+CREATE TABLE comissoes (
+    id INTEGER NOT NULL DEFAULT nextval('comissoes_id_seq'),
+    venda_id INTEGER NOT NULL,
+    vendedor_id INTEGER NOT NULL,
+    data_pagamento DATE NOT NULL,
+    valor REAL NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (id, data_pagamento),
+    FOREIGN KEY (venda_id, data_pagamento) REFERENCES vendas(id, data),
+    FOREIGN KEY (vendedor_id) REFERENCES vendedor(id)
+) PARTITION BY RANGE (data_pagamento);
+
+CREATE TABLE guias_remessa (
+    id INTEGER NOT NULL DEFAULT nextval('guias_remessa_id_seq'),
+    venda_id INTEGER NOT NULL,
+    cliente_id VARCHAR(20) NOT NULL,
+    data_geracao DATE NOT NULL,
+    status TEXT NOT NULL,
+    data_prevista_entrega DATE NOT NULL,
+    data_entrega DATE,
+    PRIMARY KEY (id, data_geracao),
+    FOREIGN KEY (venda_id, data_geracao) REFERENCES vendas(id, data)
+) PARTITION BY RANGE (data_geracao);
+
+-- Cria as partições dos meses de `inicio` a `fim` que ainda não existem (nem foram
+-- arquivadas no schema arquivo) e retorna os nomes das criadas. Usada pelo
+-- produto_fisico antes de gravar vendas e por tools/particoes.py.
+CREATE FUNCTION cria_particoes_vendas(inicio DATE, fim DATE) RETURNS SETOF TEXT AS $$
+DECLARE
+    mes DATE;
+    tabela TEXT;
+    particao TEXT;
+BEGIN
+    -- Workers concorrentes criando o mesmo mês: um cria, os demais encontram pronta
+    PERFORM pg_advisory_xact_lock(4810152);
+    FOR mes IN SELECT generate_series(date_trunc('month', inicio), date_trunc('month', fim), INTERVAL '1 month') LOOP
+        -- vendas primeiro: as partições das dependentes referenciam a tabela
+        FOREACH tabela IN ARRAY ARRAY['vendas', 'comissoes', 'guias_royalty', 'guias_remessa'] LOOP
+            particao := tabela || '_' || to_char(mes, 'YYYY_MM');
+            IF to_regclass(format('public.%I', particao)) IS NULL
+               AND to_regclass(format('arquivo.%I', particao)) IS NULL THEN
+                EXECUTE format('CREATE TABLE public.%I PARTITION OF public.%I FOR VALUES FROM (%L) TO (%L)',
+                               particao, tabela, mes, mes + INTERVAL '1 month');
+                RETURN NEXT particao;
+            END IF;
+        END LOOP;
+    END LOOP;
+END
+$$ LANGUAGE plpgsql;
+
+-- Meses com vendas gravadas e os próximos três
+SELECT count(*) FROM cria_particoes_vendas(
+    LEAST((SELECT min(data) FROM vendas_antiga), CURRENT_DATE),
+    CAST(CURRENT_DATE + INTERVAL '3 months' AS DATE));
+
+INSERT INTO vendas (id, data, cliente_id, vendedor_id, tipo_compra, produto_id, quantidade, preco, tipo_pagamento, chave_idempotencia)
+SELECT id, data, cliente_id, vendedor_id, tipo_compra, produto_id, quantidade, preco, tipo_pagamento, chave_idempotencia
+FROM vendas_antiga;
+
+INSERT INTO comissoes (id, venda_id, vendedor_id, data_pagamento, valor, status)
+SELECT id, venda_id, vendedor_id, data_pagamento, valor, status FROM comissoes_antiga;
+
+INSERT INTO guias_royalty (id, venda_id, data_geracao, status, valor)
+SELECT id, venda_id, data_geracao, status, valor FROM guias_royalty_antiga;
+
+INSERT INTO guias_remessa (id, venda_id, cliente_id, data_geracao, status, data_prevista_entrega, data_entrega)
+SELECT id, venda_id, cliente_id, data_geracao, status, data_prevista_entrega, data_entrega FROM guias_remessa_antiga;
+
+DROP TABLE comissoes_antiga, guias_royalty_antiga, guias_remessa_antiga, vendas_antiga;
+
+ALTER SEQUENCE vendas_id_seq OWNED BY vendas.id;
+ALTER SEQUENCE comissoes_id_seq OWNED BY comissoes.id;
+ALTER SEQUENCE guias_royalty_id_seq OWNED BY guias_royalty.id;
+ALTER SEQUENCE guias_remessa_id_seq OWNED BY guias_remessa.id;
+
+-- As vendas gravadas por outros caminhos (INSERT direto em vendas, carga em lote)
+-- também entram em vendas_localizacao; insert_venda_completa já grava a linha antes
+-- da venda, e aqui o conflito com ela é ignorado. Uma chave de idempotência repetida
+-- falha pela UNIQUE de vendas_localizacao.
+CREATE FUNCTION localiza_venda() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO vendas_localizacao (venda_id, data, chave_idempotencia)
+    VALUES (NEW.id, NEW.data, NEW.chave_idempotencia)
+    ON CONFLICT (venda_id) DO NOTHING;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER vendas_localizacao_insert AFTER INSERT ON vendas
+    FOR EACH ROW EXECUTE FUNCTION localiza_venda();
+
+-- Os índices da migração 001, agora criados em cada partição (e nas futuras)
+CREATE INDEX idx_vendas_data_vendedor ON vendas (data, vendedor_id) INCLUDE (quantidade, preco);
+CREATE INDEX idx_vendas_vendedor_data ON vendas (vendedor_id, data) INCLUDE (quantidade, preco);
+CREATE INDEX idx_vendas_cliente ON vendas (cliente_id);
+CREATE INDEX idx_vendas_produto ON vendas (produto_id);
+CREATE INDEX idx_guias_remessa_venda ON guias_remessa (venda_id);
+CREATE INDEX idx_guias_royalty_venda ON guias_royalty (venda_id);
+CREATE INDEX idx_comissoes_venda ON comissoes (venda_id);
+CREATE INDEX idx_comissoes_vendedor ON comissoes (vendedor_id);
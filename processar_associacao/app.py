@@ -1,4 +1,3 @@
-import json
 import asyncio
 import redis
 import pandas as pd
@@ -6,7 +5,12 @@ from tools.mailhog import Mailhog
 from config import settings, logger
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
-from tools.db_connection import PostgreSQLConnection
+from tools.mensagens import monta_resposta
+from tools.worker import WorkerStream
+from tools.esquemas import Associacao, ErroEsquema, decodifica, achata
+from tools.redis_streams import ConsumidorGrupo, publica
+from tools.retentativas import relanca_se_transitoria
+from tools.db_connection import AsyncPostgreSQLConnection
 from typing import Optional
 
 
@@ -21,8 +25,9 @@ class AssocProcess:
         """
         self.r = redis.Redis(host=settings.redis.host,
                              port=settings.redis.port)
-        self.last_id = '0-0'
-        self.db_connection = PostgreSQLConnection()
+        self.consumidor = ConsumidorGrupo(
+            self.r, 'stream_app1_app2', 'processar_associacao')
+        self.db_connection = AsyncPostgreSQLConnection()
         self.mailhog = Mailhog()
 
     async def envia_email_cliente(self, df: pd.DataFrame, tipo_servico: str) -> bool:
@@ -67,14 +72,15 @@ class AssocProcess:
                 return False
         except Exception as e:
             logger.error(f"Erro ao enviar email: {e}")
+            relanca_se_transitoria(e)
             return False
 
-    async def processar_associacao(self, df: pd.DataFrame) -> bool:
+    async def processar_associacao(self, dados: dict) -> bool:
         """
         Processa uma nova associação de cliente e envia um e-mail de confirmação.
 
         Args:
-            df (pd.DataFrame): DataFrame contendo os detalhes da associação.
+            dados (dict): Associação decodificada e achatada (ver tools.esquemas).
 
         Returns:
             bool: True se a associação foi processada com sucesso, False caso contrário.
@@ -82,55 +88,53 @@ class AssocProcess:
         await self.db_connection.connect()
         session = self.db_connection.session
 
-        if not all(col in df.columns for col in settings.colunas_obrigatorias.insert_colunas):
-            logger.error("DataFrame não contém todas as colunas necessárias")
-            await self.db_connection.close()
-            return False
-
         try:
-            for _, row in df.iterrows():
-
-                logger.info("Inserindo cliente no banco")
-
-                await self.db_connection.executa_insercao(
-                    session,
-                    settings.queries.nova_associacao,
-                    df,
-                    {"data": "data_geracao",
-                     "cliente_id": "cliente_id",
-                     "vendedor_id": "vendedor_id",
-                     "detalhes_compra.nome_plano": "plano",
-                     "detalhes_compra.ativo": "ativo"},
-                )
-
-                logger.info("Localizando dados do cliente e enviado email")
-                dados_cliente = await self.db_connection.executa_busca_retorna_df(
-                    session,
-                    settings.queries.select_associacao_cliente,
-                    df,
-                    {"cliente_id": "cpf"},
-                )
-
-                if await self.envia_email_cliente(dados_cliente, 'Assinatura'):
-                    logger.info("Email enviado com sucesso")
-                    return True
-                else:
-                    return False
+            logger.info("Inserindo cliente no banco")
+
+            await self.db_connection.executa_insercao(
+                session,
+                settings.queries.nova_associacao,
+                dados,
+                {"data": "data_geracao",
+                 "cliente_id": "cliente_id",
+                 "vendedor_id": "vendedor_id",
+                 "detalhes_compra.nome_plano": "plano",
+                 "detalhes_compra.ativo": "ativo"},
+            )
+
+            logger.info("Localizando dados do cliente e enviado email")
+            dados_cliente = await self.db_connection.executa_busca_retorna_df(
+                session,
+                settings.queries.select_associacao_cliente,
+                dados,
+                {"cliente_id": "cpf"},
+                chave="cpf",
+            )
+            if dados_cliente.empty:
+                logger.error(f"Cliente não encontrado: {dados['cliente_id']}")
+                return False
+
+            if await self.envia_email_cliente(dados_cliente, 'Assinatura'):
+                logger.info("Email enviado com sucesso")
+                return True
+            else:
+                return False
 
         except SQLAlchemyError as e:
-            session.rollback()
+            await session.rollback()
             logger.error(f"Erro ao processar compra: {e}")
+            relanca_se_transitoria(e)
             return False
 
         finally:
             await self.db_connection.close()
 
-    async def upgrade_associacao(self, df: pd.DataFrame) -> bool:
+    async def upgrade_associacao(self, dados: dict) -> bool:
         """
         Processa o upgrade de uma associação de cliente e envia um e-mail de confirmação.
 
         Args:
-            df (pd.DataFrame): DataFrame contendo os detalhes do upgrade de associação.
+            dados (dict): Associação decodificada e achatada (ver tools.esquemas).
 
         Returns:
             bool: True se o upgrade foi processado com sucesso, False caso contrário.
@@ -138,56 +142,54 @@ class AssocProcess:
         await self.db_connection.connect()
         session = self.db_connection.session
 
-        if not all(col in df.columns for col in settings.colunas_obrigatorias.upgrade_colunas):
-            logger.error("DataFrame não contém todas as colunas necessárias")
-            await self.db_connection.close()
-            return False
-
         try:
-            for _, row in df.iterrows():
-                logger.info(f"Processando upgrade de associação para o cliente {
-                            row['cliente_id']}")
-                dados_cliente = await self.db_connection.executa_busca_retorna_df(
-                    session,
-                    settings.queries.select_cliente,
-                    df,
-                    {"cliente_id": "cpf"},
-                )
-
-                if not dados_cliente.empty:
-                    logger.info(f"Cliente encontrado: {row['cliente_id']}")
-
-                    if dados_cliente['ativo'].str.contains('true', case=False, na=False).any():
-
-                        await self.db_connection.executa_insercao(
-                            session,
-                            settings.queries.update_associacao,
-                            df,
-                            {"cliente_id": "cliente_id",
-                             "detalhes_compra.nome_plano": "plano"
-                             },
-                        )
-
-                        if await self.envia_email_cliente(dados_cliente, 'Upgrade'):
-                            logger.info("Email enviado com sucesso")
-                            return True
-                        else:
-                            return False
+            logger.info(f"Processando upgrade de associação para o cliente {
+                        dados['cliente_id']}")
+            dados_cliente = await self.db_connection.executa_busca_retorna_df(
+                session,
+                settings.queries.select_cliente,
+                dados,
+                {"cliente_id": "cpf"},
+            )
+
+            if not dados_cliente.empty:
+                logger.info(f"Cliente encontrado: {dados['cliente_id']}")
+
+                if dados_cliente['ativo'].str.contains('true', case=False, na=False).any():
+
+                    await self.db_connection.executa_insercao(
+                        session,
+                        settings.queries.update_associacao,
+                        dados,
+                        {"cliente_id": "cliente_id",
+                         "detalhes_compra.nome_plano": "plano"
+                         },
+                    )
+
+                    if await self.envia_email_cliente(dados_cliente, 'Upgrade'):
+                        logger.info("Email enviado com sucesso")
+                        return True
+                    else:
+                        return False
+
+            logger.info(f"Cliente não encontrado ou em situação inválida: {dados['cliente_id']}")
+            return False
 
         except SQLAlchemyError as e:
-            session.rollback()
+            await session.rollback()
             logger.error(f"Erro ao processar compra: {e}")
+            relanca_se_transitoria(e)
             return False
 
         finally:
             await self.db_connection.close()
 
-    async def ativacao_associacao(self, df: pd.DataFrame) -> bool:
+    async def ativacao_associacao(self, dados: dict) -> bool:
         """
         Processa a ativação de uma associação de cliente e envia um e-mail de confirmação.
 
         Args:
-            df (pd.DataFrame): DataFrame contendo os detalhes da ativação de associação.
+            dados (dict): Associação decodificada e achatada (ver tools.esquemas).
 
         Returns:
             bool: True se a ativação foi processada com sucesso, False caso contrário.
@@ -195,107 +197,102 @@ class AssocProcess:
         await self.db_connection.connect()
         session = self.db_connection.session
 
-        missing_cols = [
-            col for col in settings.colunas_obrigatorias.reativacao_colunas if col not in df.columns]
-        if missing_cols:
-            logger.error(f"DataFrame não contém as seguintes colunas necessárias: {
-                         ', '.join(missing_cols)}")
-            await self.db_connection.close()
-            return False
-
         try:
-            for _, row in df.iterrows():
-                logger.info(f"Processando ativação associação {
-                            row['cliente_id']}")
-
-                dados_cliente = await self.db_connection.executa_busca_retorna_df(
-                    session,
-                    settings.queries.select_cliente,
-                    df,
-                    {"cliente_id": "cpf"},
-                )
-
-                if not dados_cliente.empty:
-                    logger.info(f"Cliente encontrado: {row['cliente_id']}")
-                    if not dados_cliente['ativo'].str.contains('sim', case=False, na=False).any():
-
-                        await self.db_connection.executa_insercao(
-                            session,
-                            settings.queries.ativacao_associacao,
-                            df,
-                            {"cliente_id": "cliente_id",
-                             "detalhes_compra.ativo": "ativo"
-                             },
-                        )
-
-                        if await self.envia_email_cliente(dados_cliente, 'Ativação'):
-                            logger.info("Email enviado com sucesso")
-                            return True
-                        else:
-                            return False
+            logger.info(f"Processando ativação associação {
+                        dados['cliente_id']}")
+
+            dados_cliente = await self.db_connection.executa_busca_retorna_df(
+                session,
+                settings.queries.select_cliente,
+                dados,
+                {"cliente_id": "cpf"},
+            )
+
+            if not dados_cliente.empty:
+                logger.info(f"Cliente encontrado: {dados['cliente_id']}")
+                if not dados_cliente['ativo'].str.contains('sim', case=False, na=False).any():
+
+                    await self.db_connection.executa_insercao(
+                        session,
+                        settings.queries.ativacao_associacao,
+                        dados,
+                        {"cliente_id": "cliente_id",
+                         "detalhes_compra.ativo": "ativo"
+                         },
+                    )
+
+                    if await self.envia_email_cliente(dados_cliente, 'Ativação'):
+                        logger.info("Email enviado com sucesso")
+                        return True
+                    else:
+                        return False
+
+            logger.info(f"Cliente não encontrado ou em situação inválida: {dados['cliente_id']}")
+            return False
 
         except SQLAlchemyError as e:
-            session.rollback()
+            await session.rollback()
             logger.error(f"Erro ao processar compra: {e}")
+            relanca_se_transitoria(e)
             return False
 
         finally:
             await self.db_connection.close()
 
-    async def process_message(self, message):
+    async def processa_mensagem(self, msg_id, msg):
         """
         Processa uma mensagem recebida do stream Redis.
 
         Args:
-            message: Mensagem recebida do stream Redis.
+            msg_id: ID da mensagem no stream Redis.
+            msg (dict): Campos da mensagem recebida.
+
+        Returns:
+            None
         """
-        stream, message_data = message
-
-        for msg_id, msg in message_data:
-            json_data = msg[b'data'].decode('utf-8')
-            json_dict = json.loads(json_data)
-            df = pd.json_normalize(json_dict)
-
-            if (df['tipo_assinatura'] == 'nova_associacao').all():
-                if await self.processar_associacao(df):
-                    logger.info("Associação criada com sucesso")
-                    self.r.xadd('stream_app2_app1', {'status': 'true'})
-                    logger.info("Confirmação enviada para app1.")
-                else:
-                    logger.info("Problemas na associação - Verifique o log")
-                    self.r.xadd('stream_app2_app1', {'status': 'false'})
-                    logger.info("Erro enviada para app1.")
-            elif (df['tipo_assinatura'] == 'upgrade_associacao').all():
-                if await self.upgrade_associacao(df):
-                    logger.info("Associação criada com sucesso")
-                    self.r.xadd('stream_app2_app1', {'status': 'true'})
-                    logger.info("Confirmação enviada para app1.")
-                else:
-                    logger.info("Problemas na associação - Verifique o log")
-                    self.r.xadd('stream_app2_app1', {'status': 'false'})
-                    logger.info("Erro enviada para app1.")
+        try:
+            dados = achata(decodifica(Associacao, msg[b'data']))
+        except ErroEsquema as e:
+            logger.error(f"Mensagem de associação inválida: {e}")
+            publica(self.r, 'stream_app2_app1', monta_resposta(msg, {'status': 'false'}))
+            return
+
+        if dados['tipo_assinatura'] == 'nova_associacao':
+            if await self.processar_associacao(dados):
+                logger.info("Associação criada com sucesso")
+                publica(self.r, 'stream_app2_app1', monta_resposta(msg, {'status': 'true'}))
+                logger.info("Confirmação enviada para app1.")
+            else:
+                logger.info("Problemas na associação - Verifique o log")
+                publica(self.r, 'stream_app2_app1', monta_resposta(msg, {'status': 'false'}))
+                logger.info("Erro enviada para app1.")
+        elif dados['tipo_assinatura'] == 'upgrade_associacao':
+            if await self.upgrade_associacao(dados):
+                logger.info("Associação criada com sucesso")
+                publica(self.r, 'stream_app2_app1', monta_resposta(msg, {'status': 'true'}))
+                logger.info("Confirmação enviada para app1.")
+            else:
+                logger.info("Problemas na associação - Verifique o log")
+                publica(self.r, 'stream_app2_app1', monta_resposta(msg, {'status': 'false'}))
+                logger.info("Erro enviada para app1.")
+        else:
+            if await self.ativacao_associacao(dados):
+                logger.info("Associação criada com sucesso")
+                publica(self.r, 'stream_app2_app1', monta_resposta(msg, {'status': 'true'}))
+                logger.info("Confirmação enviada para app1.")
             else:
-                if await self.ativacao_associacao(df):
-                    logger.info("Associação criada com sucesso")
-                    self.r.xadd('stream_app2_app1', {'status': 'true'})
-                    logger.info("Confirmação enviada para app1.")
-                else:
-                    logger.info("Problemas na associação - Verifique o log")
-                    self.r.xadd('stream_app2_app1', {'status': 'false'})
-                    logger.info("Erro enviada para app1.")
-            self.last_id = msg_id
+                logger.info("Problemas na associação - Verifique o log")
+                publica(self.r, 'stream_app2_app1', monta_resposta(msg, {'status': 'false'}))
+                logger.info("Erro enviada para app1.")
 
     async def main(self):
         """
         Método principal que lê mensagens do stream Redis e processa as associações.
         """
-        while True:
-            messages = self.r.xread(
-                {'stream_app1_app2': self.last_id}, block=1000)
-            if messages:
-                for message in messages:
-                    await self.process_message(message)
-            await asyncio.sleep(1)
+        await self.db_connection.aquecer()
+        await WorkerStream(self.consumidor, self.processa_mensagem,
+                           metricas=self.db_connection.estatisticas,
+                           stream_resposta='stream_app2_app1').executar()
 
 
 if __name__ == '__main__':
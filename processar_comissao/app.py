@@ -1,5 +1,7 @@
+import sys
 import json
 import time
+import argparse
 import redis
 import asyncio
 import numpy as np
@@ -9,7 +11,12 @@ from typing import Optional, Dict
 from config import settings, logger
 from datetime import datetime, timedelta
 from sqlalchemy.exc import SQLAlchemyError
-from tools.db_connection import PostgreSQLConnection
+from tools.mensagens import monta_resposta
+from tools.worker import WorkerStream
+from tools.esquemas import Comissao, ErroEsquema, decodifica, achata
+from tools.redis_streams import ConsumidorGrupo, publica
+from tools.retentativas import relanca_se_transitoria
+from tools.db_connection import AsyncPostgreSQLConnection
 
 
 class CalculoComissaoVendas():
@@ -21,100 +28,139 @@ class CalculoComissaoVendas():
         """
         Inicializa o objeto CalculoComissaoVendas, configurando a conexão Redis e PostgreSQL.
         """
-        self.last_id = '0-0'
-        self.db_connection = PostgreSQLConnection()
+        self.db_connection = AsyncPostgreSQLConnection()
         self.r = redis.Redis(host=settings.redis.host,
                              port=settings.redis.port)
+        self.consumidor = ConsumidorGrupo(
+            self.r, 'stream_app1_app5', 'processar_comissao')
 
-    async def comissao_vendedores(self, df: pd.DataFrame) -> Optional[Dict[int, Dict[str, float]]]:
+    async def comissao_vendedores(self, dados: dict) -> Optional[Dict[int, Dict[str, float]]]:
         """
-        Calcula a comissão dos vendedores com base nos dados fornecidos.
+        Calcula a comissão dos vendedores com base nos dados fornecidos, a partir dos
+        totais por vendedor e mês (comissao_mensal) mantidos pela gravação das vendas.
 
         Args:
-            df (pd.DataFrame): DataFrame contendo os detalhes das vendas.
+            dados (dict): Filtro decodificado (ver tools.esquemas): mes, ano e vendedor_id.
 
         Returns:
             Optional[Dict[int, Dict[str, float]]]: Um dicionário contendo as comissões dos vendedores ou None se houver um erro.
         """
+        parametros = {'ano': int(dados['ano']), 'mes': int(dados['mes'])}
+        if not 1 <= parametros['mes'] <= 12:
+            logger.error(f"Mês inválido para o cálculo de comissões: {parametros['mes']}")
+            return None
+
+        # Sem vendedor, a consulta de todos os vendedores do mês
+        query = settings.queries.calcular_comissao_geral
+        if dados.get('vendedor_id') is not None:
+            parametros['vendedor_id'] = int(dados['vendedor_id'])
+            query = settings.queries.calcular_comissao_vendedor
+
         await self.db_connection.connect()
         session = self.db_connection.session
 
-        resultados = {}
-
         try:
-            for _, row in df.iterrows():
-
-                logger.info("Iniciando busca de dados na tabela comissão")
-                resultado_busca = await self.db_connection.executa_busca_retorna_df(
-                    session,
-                    settings.queries.calcular_comissao_geral,
-                    df,
-                    {
-                        "vendedor_id": "vendedor_id",
-                        "mes": "mes",
-                        'ano': 'ano'
-                    }
-                )
+            logger.info("Iniciando busca de dados na tabela comissão")
+            resultado_busca = await self.db_connection.executa_busca_retorna_df(
+                session, query, parametros, {parametro: parametro for parametro in parametros})
             resultados = resultado_busca.to_dict(orient='records')
 
             return resultados if resultados else None
 
         except SQLAlchemyError as e:
             logger.error(f"Erro ao calcular comissões: {e}")
+            relanca_se_transitoria(e)
             return None
 
         finally:
             await self.db_connection.close()
 
-    async def process_message(self, message):
+    async def verifica_rollup(self, corrigir: bool = False) -> list:
+        """
+        Recalcula os totais de comissao_mensal a partir de vendas e lista os que
+        divergem. Com `corrigir`, reconstrói a tabela na mesma transação, com ela
+        bloqueada para gravação: as vendas gravadas durante a reconstrução aguardam e
+        somam seus totais depois dela. Os meses arquivados (sem vendas na tabela)
+        ficam de fora e mantêm seus totais.
+
+        Args:
+            corrigir (bool): Reconstrói comissao_mensal quando houver divergências.
+
+        Returns:
+            list: As divergências (ano, mes, vendedor_id e os totais de cada lado).
+        """
+        await self.db_connection.connect()
+        session = self.db_connection.session
+        try:
+            if corrigir:
+                await session.execute(text("LOCK TABLE comissao_mensal IN EXCLUSIVE MODE"))
+            resultado = await session.execute(text(settings.queries.diferencas_comissao_mensal))
+            diferencas = [dict(linha) for linha in resultado.mappings()]
+            for diferenca in diferencas:
+                logger.warning(f"comissao_mensal divergente: {diferenca}")
+
+            if corrigir and diferencas:
+                await session.execute(text(settings.queries.limpa_comissao_mensal))
+                await session.execute(text(settings.queries.reconstroi_comissao_mensal))
+                logger.info(f"comissao_mensal reconstruída ({len(diferencas)} divergências corrigidas)")
+            await session.commit()
+            return diferencas
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await self.db_connection.close()
+
+    async def processa_mensagem(self, msg_id, msg):
         """
         Processa uma mensagem recebida do stream Redis.
 
         Args:
-            message: Mensagem recebida do stream Redis.
+            msg_id: ID da mensagem no stream Redis.
+            msg (dict): Campos da mensagem recebida.
+
+        Returns:
+            None
         """
-        stream, message_data = message
-
-        for msg_id, msg in message_data:
-            json_data = msg[b'data'].decode('utf-8')
-            json_dict = json.loads(json_data)
-
-            df = pd.json_normalize(json_dict)
-            df = df.astype(
-                {"ano": "int16", "mes": "int16", "vendedor_id": "int16"})
-            vendedores = await self.comissao_vendedores(df)
-            if vendedores is not None:
-                logger.info(
-                    "Comissão calculada com sucesso")
-                # Enviar confirmação para app1
-                vendedores_json = json.dumps(vendedores)
-                self.r.xadd('stream_app5_app1', {
-                    'status': 'true', 'vendedores': vendedores_json})
-                logger.info("Confirmação enviada para app1.")
-            else:
-                logger.info(
-                    "Erro ao calcular comissões.")
-                # Enviar confirmação para app1
-                self.r.xadd('stream_app5_app1', {'status': 'false'})
-                logger.info("Confirmação enviada para app1.")
-
-            # Atualizar o ID da última mensagem processada
-            self.last_id = msg_id
+        try:
+            vendedores = await self.comissao_vendedores(achata(decodifica(Comissao, msg[b'data'])))
+        except ErroEsquema as e:
+            logger.error(f"Mensagem de comissão inválida: {e}")
+            vendedores = None
+        if vendedores is not None:
+            logger.info(
+                "Comissão calculada com sucesso")
+            # Enviar confirmação para app1
+            publica(self.r, 'stream_app5_app1', monta_resposta(
+                msg, {'status': 'true'}, {'vendedores': vendedores}))
+            logger.info("Confirmação enviada para app1.")
+        else:
+            logger.info(
+                "Erro ao calcular comissões.")
+            # Enviar confirmação para app1
+            publica(self.r, 'stream_app5_app1', monta_resposta(msg, {'status': 'false'}))
+            logger.info("Confirmação enviada para app1.")
 
     async def main(self):
         """
         Método principal que lê mensagens do stream Redis e processa as comissões dos vendedores.
         """
-        while True:
-            messages = self.r.xread(
-                {'stream_app1_app5': self.last_id}, block=1000)
-            if messages:
-                for message in messages:
-                    await self.process_message(message)
-            # Pequena pausa para evitar loop de CPU intensa
-            await asyncio.sleep(1)
+        await self.db_connection.aquecer()
+        await WorkerStream(self.consumidor, self.processa_mensagem,
+                           metricas=self.db_connection.estatisticas,
+                           stream_resposta='stream_app5_app1').executar()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Worker de cálculo de comissões")
+    parser.add_argument('--verifica-rollup', action='store_true',
+                        help="compara comissao_mensal com as vendas e termina (código 1 se divergir)")
+    parser.add_argument('--corrige', action='store_true',
+                        help="com --verifica-rollup, reconstrói comissao_mensal a partir das vendas")
+    argumentos = parser.parse_args()
+
     calculo_comissao_vendas = CalculoComissaoVendas()
+    if argumentos.verifica_rollup:
+        diferencas = asyncio.run(calculo_comissao_vendas.verifica_rollup(argumentos.corrige))
+        sys.exit(1 if diferencas and not argumentos.corrige else 0)
     asyncio.run(calculo_comissao_vendas.main())
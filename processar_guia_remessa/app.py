@@ -8,7 +8,12 @@ from typing import Optional, Dict
 from config import settings, logger
 from datetime import datetime, timedelta
 from sqlalchemy.exc import SQLAlchemyError
-from tools.db_connection import PostgreSQLConnection
+from tools.mensagens import monta_resposta
+from tools.worker import WorkerStream
+from tools.esquemas import Remessa, ErroEsquema, decodifica, achata
+from tools.redis_streams import ConsumidorGrupo, publica
+from tools.retentativas import relanca_se_transitoria
+from tools.db_connection import AsyncPostgreSQLConnection
 
 
 class GerarGuiaRemessa:
@@ -22,18 +27,19 @@ class GerarGuiaRemessa:
         """
         self.r = redis.Redis(host=settings.redis.host,
                              port=settings.redis.port)
-        self.last_id = '0-0'
-        self.db_connection = PostgreSQLConnection()
+        self.consumidor = ConsumidorGrupo(
+            self.r, 'stream_app1_app6', 'processar_guia_remessa')
+        self.db_connection = AsyncPostgreSQLConnection()
 
-    def convert_to_json(self, df):
+    def monta_guia(self, df: pd.DataFrame) -> dict:
         """
-        Converte um DataFrame em um JSON formatado.
+        Monta a guia de remessa a partir da primeira linha do DataFrame.
 
         Args:
             df (pd.DataFrame): DataFrame contendo os dados da guia de remessa.
 
         Returns:
-            str: JSON formatado contendo os dados da guia de remessa.
+            dict: Os dados da guia de remessa.
         """
         data = {}
 
@@ -67,11 +73,19 @@ class GerarGuiaRemessa:
         data['transportadora'] = df['remetente_transpor'].values[0]
         data['condicoes_pagamento'] = df['condicoes_pagamento'].values[0]
         data['observacoes'] = df['remetente_observ'].values[0]
+        return data
 
-        logger.info("Converta o dicionário para JSON")
-        json_data = json.dumps(data, indent=4)
+    def convert_to_json(self, df: pd.DataFrame) -> str:
+        """
+        Converte um DataFrame em um JSON compacto com os dados da guia de remessa.
 
-        return json_data
+        Args:
+            df (pd.DataFrame): DataFrame contendo os dados da guia de remessa.
+
+        Returns:
+            str: JSON contendo os dados da guia de remessa.
+        """
+        return json.dumps(self.monta_guia(df), ensure_ascii=False, separators=(',', ':'))
 
     def adiciona_to_json(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -100,84 +114,81 @@ class GerarGuiaRemessa:
 
         return df
 
-    async def gera_guira_remessa(self, df: pd.DataFrame) -> json:
+    async def gera_guira_remessa(self, dados: dict) -> Optional[dict]:
         """
         Gera a guia de remessa com base nos dados fornecidos.
 
         Args:
-            df (pd.DataFrame): DataFrame contendo os detalhes da venda.
+            dados (dict): Remessa decodificada (ver tools.esquemas), com o código da venda.
 
         Returns:
-            json: JSON contendo os dados da guia de remessa ou None se não houver dados.
+            Optional[dict]: Os dados da guia de remessa ou None se não houver dados.
         """
         await self.db_connection.connect()
         session = self.db_connection.session
         try:
-            for _, row in df.iterrows():
-
-                logger.info("Iniciando geração da guia de remessa e royalts")
-                remessa_royalt = await self.db_connection.executa_busca_retorna_df(
-                    session,
-                    settings.queries.gera_guia_remessa,
-                    df,
-                    {
-                        'codigo_venda': 'codigo_venda'
-                    }
-                )
+            logger.info("Iniciando geração da guia de remessa e royalts")
+            remessa_royalt = await self.db_connection.executa_busca_retorna_df(
+                session,
+                settings.queries.gera_guia_remessa,
+                dados,
+                {
+                    'codigo_venda': 'codigo_venda'
+                },
+                chave='codigo_venda'
+            )
 
             if not remessa_royalt.empty:
                 logger.info("Gerando a guia ...")
                 remessa_royalt = self.adiciona_to_json(remessa_royalt)
-                json_data = self.convert_to_json(remessa_royalt)
+                guia = self.monta_guia(remessa_royalt)
                 logger.info("Guia remessa criada!")
-                return json_data
+                return guia
             else:
                 return None
 
         except SQLAlchemyError as e:
             logger.error(f"Erro ao criar guia remessa: {e}")
+            relanca_se_transitoria(e)
             return None
         finally:
             await self.db_connection.close()
 
-    async def process_message(self, message):
+    async def processa_mensagem(self, msg_id, msg):
         """
         Processa uma mensagem recebida do stream Redis.
 
         Args:
-            message: Mensagem recebida do stream Redis.
+            msg_id: ID da mensagem no stream Redis.
+            msg (dict): Campos da mensagem recebida.
+
+        Returns:
+            None
         """
-        stream, message_data = message
-
-        for msg_id, msg in message_data:
-            json_data = msg[b'data'].decode('utf-8')
-            json_dict = json.loads(json_data)
-            df = pd.json_normalize(json_dict)
-            df = df.astype({"codigo_venda": "int16"})
-            remesa = await self.gera_guira_remessa(df)
-
-            if remesa is not None:
-                logger.info("A guia de remessa gerada com sucesso")
-                self.r.xadd('stream_app6_app1', {
-                    'status': 'true', 'remessa': remesa})
-                logger.info("Confirmação enviada para app1.")
-            else:
-                logger.info("Erro ao calcular comissões.")
-                self.r.xadd('stream_app6_app1', {'status': 'false'})
-                logger.info("Confirmação enviada para app1.")
-            self.last_id = msg_id
+        try:
+            remesa = await self.gera_guira_remessa(achata(decodifica(Remessa, msg[b'data'])))
+        except ErroEsquema as e:
+            logger.error(f"Mensagem de remessa inválida: {e}")
+            remesa = None
+
+        if remesa is not None:
+            logger.info("A guia de remessa gerada com sucesso")
+            publica(self.r, 'stream_app6_app1', monta_resposta(
+                msg, {'status': 'true'}, {'remessa': remesa}))
+            logger.info("Confirmação enviada para app1.")
+        else:
+            logger.info("Erro ao calcular comissões.")
+            publica(self.r, 'stream_app6_app1', monta_resposta(msg, {'status': 'false'}))
+            logger.info("Confirmação enviada para app1.")
 
     async def main(self):
         """
         Método principal que lê mensagens do stream Redis e gera guias de remessa.
         """
-        while True:
-            messages = self.r.xread(
-                {'stream_app1_app6': self.last_id}, block=1000)
-            if messages:
-                for message in messages:
-                    await self.process_message(message)
-            await asyncio.sleep(1)
+        await self.db_connection.aquecer()
+        await WorkerStream(self.consumidor, self.processa_mensagem,
+                           metricas=self.db_connection.estatisticas,
+                           stream_resposta='stream_app6_app1').executar()
 
 
 if __name__ == '__main__':
@@ -7,7 +7,12 @@ from typing import Optional, Dict
 from tools.mailhog import Mailhog
 from config import settings, logger
 from sqlalchemy.exc import SQLAlchemyError
-from tools.db_connection import PostgreSQLConnection
+from tools.mensagens import monta_resposta
+from tools.worker import WorkerStream
+from tools.esquemas import Streaming, ErroEsquema, decodifica, achata
+from tools.redis_streams import ConsumidorGrupo, publica
+from tools.retentativas import relanca_se_transitoria
+from tools.db_connection import AsyncPostgreSQLConnection
 
 
 class VideoProcessor:
@@ -21,8 +26,9 @@ class VideoProcessor:
         """
         self.r = redis.Redis(host=settings.redis.host,
                              port=settings.redis.port)
-        self.last_id = '0-0'
-        self.db_connection = PostgreSQLConnection()
+        self.consumidor = ConsumidorGrupo(
+            self.r, 'stream_app1_app4', 'processar_streaming')
+        self.db_connection = AsyncPostgreSQLConnection()
         self.mailhog = Mailhog()
 
     async def envia_email_cliente(self, df_cliente: pd.DataFrame, df_video: pd.DataFrame) -> Optional[dict]:
@@ -63,14 +69,15 @@ class VideoProcessor:
                 return None
         except Exception as e:
             logger.error(f"Erro ao enviar email: {e}")
+            relanca_se_transitoria(e)
             return None
 
-    async def envio_video(self, df: pd.DataFrame) -> Optional[dict]:
+    async def envio_video(self, dados: dict) -> Optional[dict]:
         """
         Processa a solicitação de vídeo, localiza os dados do cliente e do vídeo, e envia um e-mail com os detalhes.
 
         Args:
-            df (pd.DataFrame): DataFrame contendo as informações da solicitação de vídeo.
+            dados (dict): Solicitação decodificada e achatada (ver tools.esquemas).
 
         Returns:
             Optional[dict]: Dicionário com o CPF do cliente e os detalhes dos vídeos, ou None se o processamento falhar.
@@ -79,74 +86,68 @@ class VideoProcessor:
         await self.db_connection.connect()
         session = self.db_connection.session
 
-        if not all(col in df.columns for col in settings.colunas_obrigatorias.required_columns):
-            logger.error("DataFrame não contém todas as colunas necessárias")
-            await self.db_connection.close()
-            return None
-
         try:
-            for _, row in df.iterrows():
-                logger.info("Localizando dados do vídeo solicitado")
-                dados_video = await self.db_connection.executa_busca_retorna_df(
-                    session,
-                    settings.queries.select_streaming,
-                    df,
-                    {"detalhes_compra.id_streaming": "id_steaming"},
-                )
-
-                logger.info("Localizando dados do cliente")
-
-                dados_cliente = await self.db_connection.executa_busca_retorna_df(
-                    session,
-                    settings.queries.select_email_cliente,
-                    df,
-                    {"cliente_id": "cpf"},
-                )
-                logger.info(f"Cliente: {dados_cliente}")
-
-                if not dados_video.empty and not dados_cliente.empty:
-                    logger.info(
-                        "Dados do cliente e video localizados! Preparando o envio...")
-                    retorno_dados = await self.envia_email_cliente(dados_cliente, dados_video)
-                    if retorno_dados and retorno_dados.get('videos'):
-                        logger.info("Email enviado com sucesso")
-                        return retorno_dados
-                    else:
-                        return None
+            logger.info("Localizando dados do vídeo solicitado")
+            dados_video = await self.db_connection.executa_busca_retorna_df(
+                session,
+                settings.queries.select_streaming,
+                dados,
+                {"detalhes_compra.id_streaming": "id_steaming"},
+            )
+
+            logger.info("Localizando dados do cliente")
+
+            dados_cliente = await self.db_connection.executa_busca_retorna_df(
+                session,
+                settings.queries.select_email_cliente,
+                dados,
+                {"cliente_id": "cpf"},
+                chave="cpf",
+            )
+            logger.info(f"Cliente: {dados_cliente}")
+
+            if not dados_video.empty and not dados_cliente.empty:
+                logger.info(
+                    "Dados do cliente e video localizados! Preparando o envio...")
+                retorno_dados = await self.envia_email_cliente(dados_cliente, dados_video)
+                if retorno_dados and retorno_dados.get('videos'):
+                    logger.info("Email enviado com sucesso")
+                    return retorno_dados
+            return None
         except SQLAlchemyError as e:
-            session.rollback()
+            await session.rollback()
             logger.error(f"Erro ao processar Streaming: {e}")
+            relanca_se_transitoria(e)
             return None
         finally:
             await self.db_connection.close()
 
-    async def process_message(self, message):
+    async def processa_mensagem(self, msg_id, msg):
         """
-        Processa as mensagens recebidas do Redis, executa o envio de vídeo e atualiza o status no Redis.
+        Processa uma mensagem recebida do Redis, executa o envio de vídeo e atualiza o status no Redis.
 
         Args:
-            message: Mensagem recebida do Redis.
+            msg_id: ID da mensagem no stream Redis.
+            msg (dict): Campos da mensagem recebida.
 
         Returns:
             None
         """
-        stream, message_data = message
-        for msg_id, msg in message_data:
-            json_data = msg[b'data'].decode('utf-8')
-            json_dict = json.loads(json_data)
-            df = pd.json_normalize(json_dict)
-
-            return_final = await self.envio_video(df)
-            if return_final:
-                logger.info("Videos enviado com sucesso")
-                self.r.xadd('stream_app4_app1', {
-                            'status': 'true', 'video': str(return_final)})
-                logger.info("Confirmação enviada para app1.")
-            else:
-                logger.info("Problemas na associação - Verifique o log")
-                self.r.xadd('stream_app4_app1', {'status': 'false'})
-                logger.info("Erro enviada para app1.")
-            self.last_id = msg_id
+        try:
+            return_final = await self.envio_video(achata(decodifica(Streaming, msg[b'data'])))
+        except ErroEsquema as e:
+            logger.error(f"Mensagem de streaming inválida: {e}")
+            return_final = None
+
+        if return_final:
+            logger.info("Videos enviado com sucesso")
+            publica(self.r, 'stream_app4_app1', monta_resposta(
+                msg, {'status': 'true'}, {'video': return_final}))
+            logger.info("Confirmação enviada para app1.")
+        else:
+            logger.info("Problemas na associação - Verifique o log")
+            publica(self.r, 'stream_app4_app1', monta_resposta(msg, {'status': 'false'}))
+            logger.info("Erro enviada para app1.")
 
     async def main(self):
         """
@@ -155,13 +156,10 @@ class VideoProcessor:
         Returns:
             None
         """
-        while True:
-            messages = self.r.xread(
-                {'stream_app1_app4': self.last_id}, block=1000)
-            if messages:
-                for message in messages:
-                    await self.process_message(message)
-            await asyncio.sleep(1)
+        await self.db_connection.aquecer()
+        await WorkerStream(self.consumidor, self.processa_mensagem,
+                           metricas=self.db_connection.estatisticas,
+                           stream_resposta='stream_app4_app1').executar()
 
 
 if __name__ == "__main__":
@@ -5,9 +5,33 @@ import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 from config import settings, logger
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from sqlalchemy.exc import SQLAlchemyError
-from tools.db_connection import PostgreSQLConnection
+from tools.mensagens import monta_resposta
+from tools.worker import WorkerStream
+from tools.lote import AgrupadorLote
+from tools.esquemas import Compra, ErroEsquema, decodifica, achata
+from tools.redis_streams import ConsumidorGrupo, publica
+from tools.retentativas import relanca_se_transitoria
+from tools.cache_relatorios import invalida_comissao, mes_da_venda
+from tools.particoes import CRIA_PARTICOES, cria_particoes
+from tools.db_connection import AsyncPostgreSQLConnection, engine
+
+MAPEAMENTO_VENDA_COMPLETA = {
+    'data': 'data',
+    'cliente_id': 'cliente_id',
+    'vendedor_id': 'vendedor_id',
+    'tipo_compra': 'tipo_compra',
+    'detalhes_compra.produto_id': 'produto_id',
+    'detalhes_compra.quantidade': 'quantidade',
+    'detalhes_compra.preco': 'preco',
+    'detalhes_compra.tipo_pagamento': 'tipo_pagamento',
+    'detalhes_compra.tipo_produto': 'tipo_produto',
+    'detalhes_compra.valor_royalty': 'valor_royalty',
+    'status': 'status',
+    'data_prevista_entrega': 'data_prevista_entrega',
+    'chave_idempotencia': 'chave_idempotencia'
+}
 
 
 class VendaProcessor:
@@ -21,8 +45,17 @@ class VendaProcessor:
         """
         self.r = redis.Redis(host=settings.redis.host,
                              port=settings.redis.port)
-        self.last_id = '0-0'
-        self.db_connection = PostgreSQLConnection()
+        self.consumidor = ConsumidorGrupo(
+            self.r, 'stream_app1_app3', 'produto_fisico')
+        self.db_connection = AsyncPostgreSQLConnection()
+        # Meses cujas partições (vendas é particionada por mês) este processo já garantiu
+        self.meses_com_particao = set()
+        # Group commit opcional: vendas de várias mensagens gravadas numa só transação
+        self.agrupador = None
+        if settings.lote_vendas.ativo:
+            self.agrupador = AgrupadorLote(self.insere_vendas_lote,
+                                           settings.lote_vendas.max_itens,
+                                           settings.lote_vendas.max_espera_ms)
 
     async def connect_db(self):
         """
@@ -42,192 +75,205 @@ class VendaProcessor:
         """
         await self.db_connection.close()
 
-    async def insere_dados_banco(self, df: pd.DataFrame, queries: str, parameters: dict) -> int:
-
-        await self.connect_db()
-        session = self.db_connection.session
+    def prepara_venda(self, venda: dict) -> dict:
+        """
+        Acrescenta à venda os campos calculados usados por insert_venda_completa.
 
-        try:
-            for _, row in df.iterrows():
+        Args:
+            venda (dict): Venda decodificada e achatada (ver tools.esquemas).
 
-                logger.info(f"Inserir dados na tabela: {queries}")
-                id_retorno = await self.db_connection.executa_insercao_retorna_id(
-                    session,
-                    queries,
-                    df,
-                    parameters
-                )
+        Returns:
+            dict: Cópia da venda pronta para a gravação.
+        """
+        venda = dict(venda)
+        venda.setdefault('chave_idempotencia', None)
+        venda['status'] = "Fechado"
+        venda['data_prevista_entrega'] = datetime.now() + timedelta(days=15)
+        return venda
 
-                if id_retorno is not None:
-                    logger.info(f"Venda ID: {id_retorno}")
-                    return id_retorno
+    async def garante_particoes(self, session, vendas: list):
+        """
+        Cria as partições dos meses das vendas que ainda não existem: as dos próximos
+        meses são criadas com antecedência, mas uma venda pode ter data retroativa.
+        Cada mês é consultado no banco uma vez por processo. Uma falha não transitória
+        é apenas registrada; a gravação da venda falha em seguida se faltar a partição.
 
-                else:
-                    logger.error("Falha ao inserir e obter ID")
-                    return None
+        Args:
+            session (AsyncSession): Sessão assíncrona do SQLAlchemy.
+            vendas (list): Vendas a gravar.
 
+        Returns:
+            None
+        """
+        meses = {mes_da_venda(venda['data']) for venda in vendas} - self.meses_com_particao
+        if not meses:
+            return
+        try:
+            for ano, mes in sorted(meses):
+                inicio = date(ano, mes, 1)
+                await session.execute(text(CRIA_PARTICOES), {'inicio': inicio, 'fim': inicio})
+            await session.commit()
         except SQLAlchemyError as e:
-            session.rollback()
-            logger.error(f"Erro ao processar dados: {e}")
-            return None
-
-        finally:
-            await self.close_db()
+            await session.rollback()
+            logger.error(f"Erro ao criar as partições de vendas: {e}")
+            relanca_se_transitoria(e)
+            return
+        self.meses_com_particao |= meses
 
-    async def insere_venda_livro(self, df: pd.DataFrame) -> int:
+    async def busca_venda_idempotente(self, chave: str) -> dict:
         """
-        Insere dados de venda de livros no banco de dados e atualiza tabelas relacionadas.
+        Busca a venda já gravada com a chave de idempotência da compra.
 
         Args:
-            df (pd.DataFrame): DataFrame contendo os dados da venda.
+            chave (str): Chave de idempotência repassada pelo app1, ou o correlation_id da mensagem.
 
         Returns:
-            int: ID da venda inserida, ou None se a inserção falhar.
+            dict: IDs da venda gravada (venda_id, comissao_id, royalty_id, remessa_id), ou None.
         """
-
-        if not all(col in df.columns for col in settings.colunas_obrigatorias.colunas_exigidas_vendas):
-            logger.error("DataFrame não contém todas as colunas necessárias")
+        await self.connect_db()
+        session = self.db_connection.session
+        try:
+            df = await self.db_connection.executa_busca_retorna_df(
+                session,
+                settings.queries.busca_venda_idempotente,
+                {'chave_idempotencia': chave},
+                {'chave_idempotencia': 'chave_idempotencia'})
+        finally:
             await self.close_db()
+
+        if df.empty:
             return None
+        return {coluna: None if pd.isna(valor) else int(valor)
+                for coluna, valor in df.iloc[0].items()}
 
-        venda_id = await self.insere_dados_banco(df,
-                                                 settings.queries.insert_livros,
-                                                 {
-                                                     "detalhes_compra.tipo_pagamento": "tipo_pagamento",
-                                                     "detalhes_compra.preco": "preco",
-                                                     "detalhes_compra.quantidade": "quantidade",
-                                                     "detalhes_compra.produto_id": "produto_id",
-                                                     "tipo_compra": "tipo_compra",
-                                                     "vendedor_id": "vendedor_id",
-                                                     "cliente_id": "cliente_id",
-                                                     'data': 'data'
-                                                 })
-        if venda_id is not None:
-            logger.info(f"Venda ID: {venda_id}")
-            return venda_id
+    async def insere_venda_completa(self, venda: dict) -> dict:
+        """
+        Grava a venda inteira numa única instrução e transação: a venda, a comissão e a
+        guia de royalty (livros) ou de remessa (demais produtos). Ou tudo é gravado, ou nada.
+        Uma venda cuja chave de idempotência já existe não é gravada (ON CONFLICT).
 
-        else:
-            logger.error("Falha ao inserir venda e obter ID")
-            return None
+        Args:
+            venda (dict): Venda decodificada e achatada (ver tools.esquemas).
 
-    async def insere_venda_comissao(self, df: pd.DataFrame, venda_id: int) -> bool:
-        logger.info("Inserir na tabela comissoes")
-        df_temp = df.copy()
-        df_temp['venda_id'] = venda_id
-        df_temp['status'] = "Fechado"
-
-        id_comissao = await self.insere_dados_banco(df_temp,
-                                                    settings.queries.insert_comissoes,
-                                                    {
-                                                        "venda_id": "venda_id",
-                                                        "vendedor_id": "vendedor_id",
-                                                        "data": "data_pagamento",
-                                                        "detalhes_compra.preco": "valor",
-                                                        "status": "status"
-                                                    })
-        if id_comissao is not None:
-            logger.info(f"Comissao ID: {id_comissao}")
-            return id_comissao
+        Returns:
+            dict: IDs gerados (venda_id, comissao_id, royalty_id, remessa_id), ou None se a gravação falhar.
+        """
+        await self.connect_db()
+        session = self.db_connection.session
+        try:
+            await self.garante_particoes(session, [venda])
+            ids = await self.db_connection.executa_insercao_retorna_linha(
+                session,
+                settings.queries.insert_venda_completa,
+                self.prepara_venda(venda),
+                MAPEAMENTO_VENDA_COMPLETA)
+        finally:
+            await self.close_db()
 
-        else:
-            logger.error("Falha ao inserir comissão e obter ID")
+        if ids is None:
+            logger.error("Falha ao gravar a venda")
             return None
 
-    async def insere_venda_royalty_remessa(self, df: pd.DataFrame, venda_id: int) -> int:
+        logger.info(f"Venda gravada: {ids}")
+        return ids
+
+    async def insere_vendas_lote(self, vendas: list) -> list:
         """
-        Insere dados de royalty ou remessa no banco de dados e atualiza tabelas relacionadas.
+        Grava as vendas de várias mensagens numa única transação (um commit por lote).
+        Se o lote falhar por um erro permanente, as vendas são gravadas uma a uma, para
+        que só as vendas com problema sejam recusadas; um erro transitório é relançado
+        para o lote inteiro, que nada gravou, ser reprocessado.
 
         Args:
-            df (pd.DataFrame): DataFrame contendo os dados da venda.
-            venda_id (int): ID da venda inserida, ou None se a inserção falhar.
+            vendas (list): Lista de vendas decodificadas e achatadas.
 
         Returns:
-            int: ID da royalty ou remessa inserida, ou None se a inserção falhar.
-        """
-        df_temp = df.copy()
-        df_temp['venda_id'] = venda_id
-        df_temp['status'] = "Fechado"
-
-        logger.info("Inserir na tabela Royalty ou Remessa")
-
-        if df.iloc[0]['detalhes_compra.tipo_produto'] == 'livro':
-            id_comissao = await self.insere_dados_banco(df_temp,
-                                                        settings.queries.insert_guias_royalty,
-                                                        {
-                                                            "venda_id": "venda_id",
-                                                            'data': 'data_geracao',
-                                                            'status': 'status',
-                                                            'detalhes_compra.valor_royalty': 'valor'
-                                                        })
-            if id_comissao is not None:
-                logger.info(f"Royalty ID: {id_comissao}")
-                return id_comissao
-
-            else:
-                logger.error("Falha ao inserir Royalty e obter ID")
-                return None
-
-        else:
+            list: Para cada venda, na mesma ordem, os IDs gerados, None se a gravação
+                falhar ou a exceção levantada ao gravá-la uma a uma.
 
-            df_temp['data_prevista_entrega'] = datetime.now() + \
-                timedelta(days=15)
-
-            id_comissao = await self.insere_dados_banco(df_temp,
-                                                        settings.queries.insert_guias_remessa,
-                                                        {
-                                                            'venda_id': 'venda_id',
-                                                            'cliente_id': 'cliente_id',
-                                                            'data': 'data_geracao',
-                                                            'status': 'status',
-                                                            'data_prevista_entrega': 'data_prevista_entrega'
-                                                        })
-            if id_comissao is not None:
-                logger.info(f"Remessa ID: {id_comissao}")
-                return id_comissao
+        Raises:
+            FalhaTransitoria: Se o lote falhar por um erro transitório.
+        """
+        if not vendas:
+            return []
 
-            else:
-                logger.error("Falha ao inserir Remessa e obter ID")
-                return None
+        await self.connect_db()
+        session = self.db_connection.session
+        try:
+            await self.garante_particoes(session, vendas)
+            linhas = await self.db_connection.executa_transacao_retorna_linhas(
+                session,
+                settings.queries.insert_venda_completa,
+                [self.prepara_venda(venda) for venda in vendas],
+                MAPEAMENTO_VENDA_COMPLETA)
+            logger.info(f"Lote de {len(vendas)} vendas gravado")
+            return linhas
+        except Exception as e:
+            logger.error(f"Falha ao gravar o lote de vendas: {e}")
+            relanca_se_transitoria(e)
+            logger.info("Gravando as vendas do lote uma a uma")
+        finally:
+            await self.close_db()
 
-            return venda_id
+        # Cada venda tem o seu resultado: um erro numa delas não afeta as já gravadas
+        resultados = []
+        for venda in vendas:
+            try:
+                resultados.append(await self.insere_venda_completa(venda))
+            except Exception as e:
+                resultados.append(e)
+        return resultados
 
-    async def process_message(self, message):
+    async def processa_mensagem(self, msg_id, msg):
         """
-        Processa mensagens recebidas do Redis, insere dados da venda e atualiza o status no Redis.
+        Processa uma mensagem recebida do Redis, insere dados da venda e atualiza o status no Redis.
 
         Args:
-            message: Mensagem recebida do Redis.
+            msg_id: ID da mensagem no stream Redis.
+            msg (dict): Campos da mensagem recebida.
 
         Returns:
             None
         """
-        stream, message_data = message
-
-        for msg_id, msg in message_data:
-            json_data = msg[b'data'].decode('utf-8')
-            json_dict = json.loads(json_data)
-            df = pd.json_normalize(json_dict)
-
-            venda_id = await self.insere_venda_livro(df)
-            if venda_id is not None:
-                retorno_id = await self.insere_venda_comissao(df, venda_id)
-                if venda_id is not None:
-                    retorno_id = await self.insere_venda_royalty_remessa(df, venda_id)
-
-            if venda_id and retorno_id:
-                logger.info(
-                    "Venda de Produto fisico inserida com sucesso no banco de dados")
-                self.r.xadd('stream_app3_app1', {
-                    'status': 'true', 'venda_id': str(venda_id)})
-                logger.info(f"Confirmação id venda: {
-                            venda_id} enviada para app1.")
+        try:
+            venda = achata(decodifica(Compra, msg[b'data']))
+        except ErroEsquema as e:
+            logger.error(f"Mensagem de venda inválida: {e}")
+            venda = None
+
+        chave = msg.get(b'idempotency_key', b'').decode('utf-8') or None
+        if venda is None:
+            ids = None
+        elif chave and (ids := await self.busca_venda_idempotente(chave)):
+            logger.info(f"Venda com a chave {chave} já gravada: {ids}")
+        else:
+            # Sem chave do app1, o correlation_id: uma mensagem reentregue não grava a
+            # venda de novo (ON CONFLICT), e a busca abaixo encontra a primeira gravação
+            chave = chave or msg.get(b'correlation_id', b'').decode('utf-8') or None
+            venda['chave_idempotencia'] = chave
+            if self.agrupador:
+                ids = await self.agrupador.adiciona(venda)
             else:
-                logger.info(
-                    "Erro ao inserir a venda de Produto fisico no banco de dados.")
-                self.r.xadd('stream_app3_app1', {'status': 'false'})
-                logger.info("Confirmação enviada para app1.")
-
-            self.last_id = msg_id
+                ids = await self.insere_venda_completa(venda)
+            if ids is None and chave:
+                # Outra mensagem com a mesma chave gravou a venda antes (ON CONFLICT)
+                ids = await self.busca_venda_idempotente(chave)
+        venda_id = ids['venda_id'] if ids else None
+
+        if venda_id:
+            logger.info(
+                "Venda de Produto fisico inserida com sucesso no banco de dados")
+            # Antes da resposta: quem recebe a confirmação já consulta a comissão atualizada
+            invalida_comissao(self.r, venda['data'])
+            publica(self.r, 'stream_app3_app1', monta_resposta(msg, {
+                'status': 'true', 'venda_id': str(venda_id)}))
+            logger.info(f"Confirmação id venda: {
+                        venda_id} enviada para app1.")
+        else:
+            logger.info(
+                "Erro ao inserir a venda de Produto fisico no banco de dados.")
+            publica(self.r, 'stream_app3_app1', monta_resposta(msg, {'status': 'false'}))
+            logger.info("Confirmação enviada para app1.")
 
     async def main(self):
         """
@@ -236,13 +282,14 @@ class VendaProcessor:
         Returns:
             None
         """
-        while True:
-            messages = self.r.xread(
-                {'stream_app1_app3': self.last_id}, block=1000)
-            if messages:
-                for message in messages:
-                    await self.process_message(message)
-            await asyncio.sleep(1)
+        await self.db_connection.aquecer()
+        try:
+            await asyncio.to_thread(cria_particoes, engine)
+        except SQLAlchemyError as e:
+            logger.error(f"Erro ao criar as partições dos próximos meses: {e}")
+        await WorkerStream(self.consumidor, self.processa_mensagem,
+                           metricas=self.db_connection.estatisticas,
+                           stream_resposta='stream_app3_app1').executar()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,25 @@
+from pathlib import Path
+import pytest
+import fakeredis
+from dynaconf import Dynaconf
+from app1 import admissao, cache, idempotencia, jobs
+
+# As seções do gateway (jobs, admissao, cache, idempotencia) só existem em app1/settings.toml
+settings_app1 = Dynaconf(settings_files=[str(Path(__file__).parents[2] / 'app1' / 'settings.toml')])
+
+
+@pytest.fixture(autouse=True)
+def configuracao_app1(monkeypatch):
+    for modulo in (admissao, cache, idempotencia, jobs):
+        monkeypatch.setattr(modulo, 'settings', settings_app1)
+    return settings_app1
+
+
+@pytest.fixture
+def servidor_redis():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_client(servidor_redis):
+    return fakeredis.FakeAsyncRedis(server=servidor_redis)
@@ -0,0 +1,139 @@
+import pytest
+from types import SimpleNamespace
+from fastapi import HTTPException
+from app1.admissao import ControleAdmissao
+
+
+class TestesControleAdmissao:
+
+    @pytest.fixture
+    def controle(self, redis_client):
+        controle = ControleAdmissao(redis_client)
+        controle.limites = {'leitura': SimpleNamespace(max_em_andamento=1, max_backlog=3),
+                            'escrita': SimpleNamespace(max_em_andamento=2, max_backlog=5)}
+        return controle
+
+    @staticmethod
+    async def enfileira(redis_client, stream, quantidade):
+        for i in range(quantidade):
+            await redis_client.xadd(stream, {'data': str(i)})
+
+    def test_classe(self):
+        assert ControleAdmissao.classe('stream_app1_app5') == 'leitura'
+        assert ControleAdmissao.classe('stream_app1_app6') == 'leitura'
+        assert ControleAdmissao.classe('stream_app1_app3') == 'escrita'
+
+    @pytest.mark.asyncio
+    async def test_admite_e_libera_ao_fim_do_bloco(self, controle):
+        async with controle.admitir('stream_app1_app3'):
+            assert controle.em_andamento['stream_app1_app3'] == 1
+        assert controle.em_andamento['stream_app1_app3'] == 0
+
+    @pytest.mark.asyncio
+    async def test_excecao_no_bloco_libera(self, controle):
+        with pytest.raises(RuntimeError):
+            async with controle.admitir('stream_app1_app3'):
+                raise RuntimeError('falha')
+        assert controle.em_andamento['stream_app1_app3'] == 0
+
+    @pytest.mark.asyncio
+    async def test_limite_em_andamento_429(self, controle, configuracao_app1):
+        async with controle.admitir('stream_app1_app3'), controle.admitir('stream_app1_app3'):
+            with pytest.raises(HTTPException) as erro:
+                async with controle.admitir('stream_app1_app3'):
+                    pass
+            # O limite é por stream
+            async with controle.admitir('stream_app1_app4'):
+                pass
+
+        assert erro.value.status_code == 429
+        assert erro.value.headers == {'Retry-After': str(configuracao_app1.admissao.retry_after)}
+        assert controle.recusadas == {'stream_app1_app3': 1}
+        assert controle.em_andamento['stream_app1_app3'] == 0
+
+    @pytest.mark.asyncio
+    async def test_leitura_tem_limite_proprio(self, controle):
+        async with controle.admitir('stream_app1_app5'):
+            with pytest.raises(HTTPException) as erro:
+                async with controle.admitir('stream_app1_app6'), controle.admitir('stream_app1_app5'):
+                    pass
+        assert erro.value.status_code == 429
+
+    @pytest.mark.asyncio
+    async def test_backlog_sem_consumer_group_503(self, controle, redis_client, configuracao_app1):
+        await self.enfileira(redis_client, 'stream_app1_app3', 5)
+
+        with pytest.raises(HTTPException) as erro:
+            async with controle.admitir('stream_app1_app3'):
+                pass
+
+        assert erro.value.status_code == 503
+        assert erro.value.headers == {'Retry-After': str(configuracao_app1.admissao.retry_after)}
+        assert controle.em_andamento.get('stream_app1_app3', 0) == 0
+
+    @pytest.mark.asyncio
+    async def test_lote_conta_todas_as_mensagens(self, controle, redis_client):
+        await self.enfileira(redis_client, 'stream_app1_app3', 2)
+
+        async with controle.admitir('stream_app1_app3', quantidade=3):
+            pass
+        with pytest.raises(HTTPException) as erro:
+            async with controle.admitir('stream_app1_app3', quantidade=4):
+                pass
+        assert erro.value.status_code == 503
+
+    @pytest.mark.asyncio
+    async def test_backlog_soma_lag_e_pendentes(self, controle, redis_client):
+        await self.enfileira(redis_client, 'stream_app1_app3', 6)
+        await redis_client.xgroup_create('stream_app1_app3', 'produto_fisico', id='0')
+        await redis_client.xgroup_create('stream_app1_app3', 'auditoria', id='0')
+        mensagens = await redis_client.xreadgroup('produto_fisico', 'c1', {'stream_app1_app3': '>'}, count=4)
+        await redis_client.xack('stream_app1_app3', 'produto_fisico', mensagens[0][1][0][0])
+        await redis_client.xreadgroup('auditoria', 'c1', {'stream_app1_app3': '>'}, count=5)
+
+        # produto_fisico: 2 não entregues + 3 pendentes; auditoria: 1 + 5 (o mais atrasado)
+        assert await controle.backlog('stream_app1_app3', 5) == 6
+
+    @pytest.mark.asyncio
+    async def test_lag_nulo_conta_entradas_nao_entregues(self, controle, redis_client):
+        await self.enfileira(redis_client, 'stream_app1_app3', 5)
+        await redis_client.xgroup_create('stream_app1_app3', 'produto_fisico', id='0')
+        mensagens = await redis_client.xreadgroup('produto_fisico', 'c1', {'stream_app1_app3': '>'}, count=1)
+        grupo = {'lag': None, 'last-delivered-id': mensagens[0][1][0][0]}
+
+        assert await controle._lag('stream_app1_app3', grupo, 10) == 4
+        assert await controle._lag('stream_app1_app3', grupo, 2) == 2
+        assert await controle._lag('stream_app1_app3', dict(grupo, lag=7), 10) == 7
+
+    @pytest.mark.asyncio
+    async def test_backlog_lido_no_maximo_a_cada_intervalo(self, controle, redis_client):
+        await self.enfileira(redis_client, 'stream_app1_app3', 2)
+        assert await controle.backlog('stream_app1_app3', 5) == 2
+
+        await self.enfileira(redis_client, 'stream_app1_app3', 2)
+        assert await controle.backlog('stream_app1_app3', 5) == 2
+
+        controle.intervalo_backlog = 0
+        assert await controle.backlog('stream_app1_app3', 5) == 4
+
+    @pytest.mark.asyncio
+    async def test_erro_redis_mantem_ultimo_backlog(self, controle, redis_client, servidor_redis):
+        await self.enfileira(redis_client, 'stream_app1_app3', 2)
+        assert await controle.backlog('stream_app1_app3', 5) == 2
+
+        await self.enfileira(redis_client, 'stream_app1_app3', 2)
+        controle.intervalo_backlog = 0
+        servidor_redis.connected = False
+        assert await controle.backlog('stream_app1_app3', 5) == 2
+        async with controle.admitir('stream_app1_app3'):
+            pass
+
+    @pytest.mark.asyncio
+    async def test_estado(self, controle, redis_client):
+        await self.enfileira(redis_client, 'stream_app1_app5', 3)
+        with pytest.raises(HTTPException):
+            async with controle.admitir('stream_app1_app5'):
+                pass
+
+        assert controle.estado() == {'stream_app1_app5': {
+            'classe': 'leitura', 'em_andamento': 0, 'backlog': 3, 'recusadas': 1}}
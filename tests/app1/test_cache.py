@@ -0,0 +1,160 @@
+import json
+import asyncio
+import pytest
+from datetime import date
+from unittest.mock import AsyncMock
+from app1.cache import CacheRelatorios, calcula_etag, etag_confere
+
+COMISSAO = {'vendedor_id': 1, 'comissao': 150.0}
+
+
+def test_calcula_etag_independe_da_ordem_das_chaves():
+    assert calcula_etag({'a': 1, 'b': 2}) == calcula_etag({'b': 2, 'a': 1})
+    assert calcula_etag({'a': 1}) != calcula_etag({'a': 2})
+    assert calcula_etag({'a': 1}).startswith('"')
+
+
+def test_etag_confere():
+    etag = calcula_etag(COMISSAO)
+    assert not etag_confere(None, etag)
+    assert not etag_confere('"outra"', etag)
+    assert etag_confere(etag, etag)
+    assert etag_confere(f'"outra", W/{etag}', etag)
+    assert etag_confere('*', etag)
+
+
+class TestesCacheRelatorios:
+
+    @pytest.fixture
+    def cache(self, redis_client):
+        return CacheRelatorios(redis_client)
+
+    @pytest.fixture
+    def mes_corrente(self):
+        hoje = date.today()
+        return hoje.year, hoje.month
+
+    @pytest.mark.asyncio
+    async def test_comissao_calculada_uma_vez_e_lida_do_cache(self, cache, redis_client, mes_corrente):
+        calcula = AsyncMock(return_value=COMISSAO)
+        ano, mes = mes_corrente
+
+        registro = await cache.comissao(ano, mes, 1, calcula)
+        assert await cache.comissao(ano, mes, 1, calcula) == registro
+
+        calcula.assert_awaited_once()
+        assert registro == {'etag': calcula_etag(COMISSAO), 'dados': COMISSAO}
+        chave = f"cache:comissao:{ano}-{mes:02d}:0"
+        assert json.loads(await redis_client.hget(chave, '1')) == registro
+        assert 0 < await redis_client.ttl(chave) <= cache.ttl_mes_aberto
+
+    @pytest.mark.asyncio
+    async def test_comissao_de_todos_os_vendedores(self, cache, redis_client):
+        await cache.comissao(2024, 7, None, AsyncMock(return_value=[COMISSAO]))
+        assert await redis_client.hexists('cache:comissao:2024-07:0', 'todos')
+
+    @pytest.mark.asyncio
+    async def test_mes_encerrado_sem_expiracao(self, cache, redis_client):
+        await cache.comissao(2024, 7, 1, AsyncMock(return_value=COMISSAO))
+        assert await redis_client.ttl('cache:comissao:2024-07:0') == -1
+
+    @pytest.mark.asyncio
+    async def test_nova_geracao_recalcula(self, cache, redis_client):
+        calcula = AsyncMock(side_effect=[COMISSAO, dict(COMISSAO, comissao=200.0)])
+
+        antes = await cache.comissao(2024, 7, 1, calcula)
+        # Venda gravada no mês pelo produto_fisico (tools/cache_relatorios.py)
+        await redis_client.incr('cache:comissao:geracao:2024-07')
+        depois = await cache.comissao(2024, 7, 1, calcula)
+
+        assert calcula.await_count == 2
+        assert depois['dados']['comissao'] == 200.0
+        assert depois['etag'] != antes['etag']
+
+    @pytest.mark.asyncio
+    async def test_remessa_expira_a_meia_noite(self, cache, redis_client):
+        calcula = AsyncMock(return_value={'codigo_venda': 5})
+
+        await cache.remessa(5, calcula)
+        await cache.remessa(5, calcula)
+
+        calcula.assert_awaited_once()
+        assert 0 < await redis_client.ttl('cache:remessa:5') <= 86400
+
+    @pytest.mark.asyncio
+    async def test_singleflight_junta_requisicoes_concorrentes(self, cache):
+        liberado = asyncio.Event()
+        chamadas = 0
+
+        async def calcula():
+            nonlocal chamadas
+            chamadas += 1
+            await liberado.wait()
+            return COMISSAO
+
+        tarefas = [asyncio.create_task(cache.comissao(2024, 7, 1, calcula)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        liberado.set()
+        registros = await asyncio.gather(*tarefas)
+
+        assert chamadas == 1
+        assert registros == [{'etag': calcula_etag(COMISSAO), 'dados': COMISSAO}] * 3
+        assert cache._em_andamento == {}
+
+    @pytest.mark.asyncio
+    async def test_singleflight_repassa_excecao_e_nao_grava(self, cache, redis_client):
+        liberado = asyncio.Event()
+
+        async def falha():
+            await liberado.wait()
+            raise TimeoutError('worker não respondeu')
+
+        tarefas = [asyncio.create_task(cache.remessa(5, falha)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        liberado.set()
+        resultados = await asyncio.gather(*tarefas, return_exceptions=True)
+
+        assert all(isinstance(resultado, TimeoutError) for resultado in resultados)
+        assert cache._em_andamento == {}
+        assert not await redis_client.exists('cache:remessa:5')
+
+    @pytest.mark.asyncio
+    async def test_cancelamento_de_um_cliente_nao_interrompe_os_demais(self, cache):
+        liberado = asyncio.Event()
+
+        async def calcula():
+            await liberado.wait()
+            return COMISSAO
+
+        primeira = asyncio.create_task(cache.comissao(2024, 7, 1, calcula))
+        segunda = asyncio.create_task(cache.comissao(2024, 7, 1, calcula))
+        await asyncio.sleep(0.01)
+        primeira.cancel()
+        liberado.set()
+
+        assert (await segunda)['dados'] == COMISSAO
+        assert primeira.cancelled()
+
+    def test_resposta_200_com_etag(self):
+        registro = {'etag': calcula_etag(COMISSAO), 'dados': COMISSAO}
+
+        resposta = CacheRelatorios.resposta(registro, None, 'private, no-cache')
+
+        assert resposta.status_code == 200
+        assert json.loads(resposta.body) == COMISSAO
+        assert resposta.headers['ETag'] == registro['etag']
+        assert resposta.headers['Cache-Control'] == 'private, no-cache'
+
+    def test_resposta_304_sem_corpo(self):
+        registro = {'etag': calcula_etag(COMISSAO), 'dados': COMISSAO}
+
+        resposta = CacheRelatorios.resposta(registro, registro['etag'], 'private, no-cache')
+
+        assert resposta.status_code == 304
+        assert resposta.body == b''
+        assert resposta.headers['ETag'] == registro['etag']
+
+    def test_cache_control_comissao(self, cache, mes_corrente, configuracao_app1):
+        assert cache.cache_control_comissao(*mes_corrente) == 'private, no-cache'
+        assert cache.cache_control_comissao(2024, 7) == \
+            f"private, max-age={configuracao_app1.cache.max_age_fechado}"
@@ -0,0 +1,185 @@
+import sys
+import asyncio
+import importlib
+import pytest
+import pytest_asyncio
+import config
+from pathlib import Path
+from unittest.mock import AsyncMock
+from fastapi import HTTPException
+from app1.admissao import ControleAdmissao
+from app1.despachante import DespachanteRespostas, novo_correlation_id
+
+DIRETORIO_APP1 = Path(__file__).parents[2] / 'app1'
+# Módulos do gateway importados pelo app.py sem o prefixo do pacote
+MODULOS_GATEWAY = ('app', 'admissao', 'cache', 'codec', 'despachante', 'idempotencia',
+                   'jobs', 'models', 'streams')
+
+
+def test_novo_correlation_id():
+    correlation_id = novo_correlation_id()
+    assert len(correlation_id) == 32 and int(correlation_id, 16) >= 0
+    assert novo_correlation_id() != correlation_id
+
+
+class TestesDespachanteRespostas:
+
+    @pytest.fixture
+    def sem_dono(self):
+        return AsyncMock()
+
+    @pytest_asyncio.fixture
+    async def despachante(self, redis_client, sem_dono):
+        despachante = DespachanteRespostas(redis_client, ['stream_app3_app1', 'stream_app4_app1'],
+                                           sem_dono=sem_dono)
+        await despachante.iniciar()
+        yield despachante
+        await despachante.parar()
+
+    @pytest.mark.asyncio
+    async def test_entrega_resposta_pelo_correlation_id(self, despachante, redis_client):
+        despachante.registrar('c1')
+        despachante.registrar('c2')
+        await redis_client.xadd('stream_app4_app1', {'correlation_id': 'c2', 'status': 'ok'})
+        await redis_client.xadd('stream_app3_app1', {'correlation_id': 'c1', 'status': 'erro'})
+
+        resposta_c1 = await despachante.aguardar_resposta('c1', timeout=1)
+        resposta_c2 = await despachante.aguardar_resposta('c2', timeout=1)
+
+        assert resposta_c1[b'status'] == b'erro'
+        assert resposta_c2[b'status'] == b'ok'
+        assert despachante.pendentes == {}
+        # Respostas entregues são removidas do stream
+        assert await redis_client.xlen('stream_app3_app1') == 0
+        assert await redis_client.xlen('stream_app4_app1') == 0
+
+    @pytest.mark.asyncio
+    async def test_ignora_respostas_anteriores_ao_inicio(self, redis_client, sem_dono):
+        await redis_client.xadd('stream_app3_app1', {'correlation_id': 'antiga', 'status': 'ok'})
+        despachante = DespachanteRespostas(redis_client, ['stream_app3_app1'], sem_dono=sem_dono)
+        await despachante.iniciar()
+        try:
+            despachante.registrar('c1')
+            await redis_client.xadd('stream_app3_app1', {'correlation_id': 'c1', 'status': 'ok'})
+            await despachante.aguardar_resposta('c1', timeout=1)
+        finally:
+            await despachante.parar()
+
+        sem_dono.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_resposta_sem_requisicao_vai_para_sem_dono(self, despachante, redis_client, sem_dono):
+        await redis_client.xadd('stream_app3_app1', {'correlation_id': 'job1', 'status': 'ok'})
+        despachante.registrar('c1')
+        await redis_client.xadd('stream_app3_app1', {'correlation_id': 'c1', 'status': 'ok'})
+
+        await despachante.aguardar_resposta('c1', timeout=1)
+
+        sem_dono.assert_awaited_once()
+        assert sem_dono.await_args.args == ('job1', {b'correlation_id': b'job1', b'status': b'ok'})
+        # Pode ser a resposta de outra instância do gateway: continua no stream
+        assert await redis_client.xlen('stream_app3_app1') == 1
+
+    @pytest.mark.asyncio
+    async def test_erro_ao_entregar_nao_interrompe_a_leitura(self, despachante, redis_client, sem_dono):
+        sem_dono.side_effect = RuntimeError('falha')
+        await redis_client.xadd('stream_app3_app1', {'status': 'ok'})
+        await redis_client.xadd('stream_app3_app1', {'correlation_id': 'job1', 'status': 'ok'})
+        despachante.registrar('c1')
+        await redis_client.xadd('stream_app3_app1', {'correlation_id': 'c1', 'status': 'ok'})
+
+        assert (await despachante.aguardar_resposta('c1', timeout=1))[b'status'] == b'ok'
+        sem_dono.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_timeout_descarta_requisicao(self, despachante):
+        despachante.registrar('c1')
+
+        with pytest.raises(asyncio.TimeoutError):
+            await despachante.aguardar_resposta('c1', timeout=0.05)
+
+        assert despachante.pendentes == {}
+
+    @pytest.mark.asyncio
+    async def test_resposta_depois_do_timeout_vai_para_sem_dono(self, despachante, redis_client, sem_dono):
+        with pytest.raises(asyncio.TimeoutError):
+            await despachante.aguardar_resposta('c1', timeout=0.05)
+        despachante.registrar('c2')
+        await redis_client.xadd('stream_app3_app1', {'correlation_id': 'c1', 'status': 'ok'})
+        await redis_client.xadd('stream_app3_app1', {'correlation_id': 'c2', 'status': 'ok'})
+
+        await despachante.aguardar_resposta('c2', timeout=1)
+
+        assert sem_dono.await_args.args[0] == 'c1'
+
+    @pytest.mark.asyncio
+    async def test_parar_cancela_pendentes(self, redis_client):
+        despachante = DespachanteRespostas(redis_client, ['stream_app3_app1'])
+        await despachante.iniciar()
+        future = despachante.registrar('c1')
+
+        await despachante.parar()
+
+        assert future.cancelled()
+        assert despachante.pendentes == {}
+        assert despachante._tarefa.done()
+
+
+class TestesEnviarEAguardar:
+
+    @pytest.fixture
+    def gateway(self, monkeypatch, configuracao_app1):
+        """
+        Importa app1/app.py, que usa imports sem o pacote e lê as configurações do
+        gateway na importação; os módulos importados assim são descarregados ao final.
+        """
+        monkeypatch.syspath_prepend(str(DIRETORIO_APP1))
+        monkeypatch.setattr(config, 'settings', configuracao_app1)
+        yield importlib.import_module('app')
+        for nome in MODULOS_GATEWAY:
+            sys.modules.pop(nome, None)
+
+    @pytest_asyncio.fixture
+    async def processador(self, gateway, redis_client, monkeypatch):
+        processador = gateway.Processador()
+        processador.redis_client = redis_client
+        processador.admissao = ControleAdmissao(redis_client)
+        processador.despachante = gateway.DespachanteRespostas(redis_client, gateway.STREAMS_RESPOSTA)
+        monkeypatch.setattr(gateway, 'timeout_stream', lambda stream: 0.2)
+        await processador.despachante.iniciar()
+        yield processador
+        await processador.despachante.parar()
+
+    @staticmethod
+    async def worker(redis_client, stream_requisicao, stream_resposta):
+        """
+        Responde à primeira mensagem do stream ecoando o correlation_id, como os workers.
+        """
+        while not (mensagens := await redis_client.xrange(stream_requisicao)):
+            await asyncio.sleep(0.01)
+        msg = mensagens[0][1]
+        await redis_client.xadd(stream_resposta, {'correlation_id': msg[b'correlation_id'],
+                                                  'status': 'ok', 'data': msg[b'data']})
+        return msg
+
+    @pytest.mark.asyncio
+    async def test_resposta_do_worker(self, processador, redis_client):
+        worker = asyncio.create_task(self.worker(redis_client, 'stream_app1_app3', 'stream_app3_app1'))
+
+        resposta = await processador.enviar_e_aguardar('stream_app1_app3', '{"id": 1}', 'chave1')
+
+        msg = await worker
+        assert resposta[b'data'] == b'{"id": 1}'
+        assert msg[b'idempotency_key'] == b'chave1'
+        assert b'prazo' in msg
+        assert processador.despachante.pendentes == {}
+        assert processador.admissao.em_andamento['stream_app1_app3'] == 0
+
+    @pytest.mark.asyncio
+    async def test_sem_resposta_504(self, processador):
+        with pytest.raises(HTTPException) as erro:
+            await processador.enviar_e_aguardar('stream_app1_app3', '{"id": 1}')
+
+        assert erro.value.status_code == 504
+        assert processador.despachante.pendentes == {}
+        assert processador.admissao.em_andamento['stream_app1_app3'] == 0
@@ -0,0 +1,131 @@
+import json
+import hashlib
+import pytest
+from unittest.mock import AsyncMock
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from app1.idempotencia import ControleIdempotencia
+
+CORPO = b'{"cliente_id": "123.456.789-00", "vendedor_id": 1}'
+
+
+class TestesControleIdempotencia:
+
+    @pytest.fixture
+    def controle(self, redis_client):
+        return ControleIdempotencia(redis_client)
+
+    @pytest.fixture
+    def processa(self):
+        return AsyncMock(return_value=JSONResponse(
+            status_code=201, content={'id': 7}, headers={'Location': '/vendas/7'}))
+
+    def test_chave_efetiva(self, controle):
+        assert controle.chave_efetiva('abc', CORPO) == 'abc'
+        assert controle.chave_efetiva(None, CORPO) == f"conteudo:{hashlib.sha256(CORPO).hexdigest()}"
+        # Só o corpo entra na chave: a repetição depois de um 504 chega ao worker com a mesma
+        assert controle.chave_efetiva(None, CORPO) == controle.chave_efetiva(None, CORPO)
+
+        controle.chave_conteudo = False
+        assert controle.chave_efetiva(None, CORPO) is None
+
+    @pytest.mark.asyncio
+    async def test_primeira_requisicao_grava_resposta(self, controle, redis_client, processa):
+        resposta = await controle.executar('compra', 'abc', CORPO, processa)
+
+        assert resposta.status_code == 201
+        registro = json.loads(await redis_client.get('idempotencia:compra:abc'))
+        assert registro == {'status': 'concluido', 'impressao': hashlib.sha256(CORPO).hexdigest(),
+                            'codigo': 201, 'resultado': {'id': 7},
+                            'cabecalhos': {'Location': '/vendas/7'}}
+        assert 0 < await redis_client.ttl('idempotencia:compra:abc') <= controle.ttl
+
+    @pytest.mark.asyncio
+    async def test_repeticao_devolve_resposta_gravada(self, controle, processa):
+        await controle.executar('compra', 'abc', CORPO, processa)
+        resposta = await controle.executar('compra', 'abc', CORPO, processa)
+
+        processa.assert_awaited_once()
+        assert resposta.status_code == 201
+        assert json.loads(resposta.body) == {'id': 7}
+        assert resposta.headers['Idempotent-Replayed'] == 'true'
+        assert resposta.headers['Location'] == '/vendas/7'
+
+    @pytest.mark.asyncio
+    async def test_repeticao_sem_chave_usa_hash_do_corpo(self, controle, redis_client):
+        processa = AsyncMock(return_value={'status': 'ok'})
+
+        await controle.executar('compra', None, CORPO, processa)
+        resposta = await controle.executar('compra', None, CORPO, processa)
+
+        processa.assert_awaited_once()
+        assert json.loads(resposta.body) == {'status': 'ok'}
+        chave = f"idempotencia:compra:{hashlib.sha256(CORPO).hexdigest()}"
+        assert 0 < await redis_client.ttl(chave) <= controle.ttl_conteudo
+
+    @pytest.mark.asyncio
+    async def test_sem_chave_nem_chave_conteudo_nao_deduplica(self, controle):
+        controle.chave_conteudo = False
+        processa = AsyncMock(return_value={'status': 'ok'})
+
+        await controle.executar('compra', None, CORPO, processa)
+        await controle.executar('compra', None, CORPO, processa)
+
+        assert processa.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_chave_com_outro_corpo_422(self, controle, processa):
+        await controle.executar('compra', 'abc', CORPO, processa)
+
+        with pytest.raises(HTTPException) as erro:
+            await controle.executar('compra', 'abc', b'{"vendedor_id": 2}', processa)
+
+        assert erro.value.status_code == 422
+        processa.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_primeira_em_andamento_409(self, controle, redis_client, processa):
+        impressao = hashlib.sha256(CORPO).hexdigest()
+        await redis_client.set('idempotencia:compra:abc',
+                               json.dumps({'status': 'pendente', 'impressao': impressao}))
+
+        with pytest.raises(HTTPException) as erro:
+            await controle.executar('compra', 'abc', CORPO, processa)
+
+        assert erro.value.status_code == 409
+        assert erro.value.headers == {'Retry-After': '1'}
+        processa.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_chave_longa_400(self, controle, processa):
+        with pytest.raises(HTTPException) as erro:
+            await controle.executar('compra', 'x' * 256, CORPO, processa)
+
+        assert erro.value.status_code == 400
+        processa.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_falha_no_processamento_libera_reserva(self, controle, redis_client, processa):
+        falha = AsyncMock(side_effect=HTTPException(status_code=504, detail="Timeout"))
+
+        with pytest.raises(HTTPException):
+            await controle.executar('compra', 'abc', CORPO, falha)
+        assert await redis_client.get('idempotencia:compra:abc') is None
+
+        resposta = await controle.executar('compra', 'abc', CORPO, processa)
+        assert resposta.status_code == 201
+        processa.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_reserva_impossivel_503(self, controle, redis_client, processa):
+        # A chave expira entre o SET NX e o GET nas duas tentativas
+        redis_client.set = AsyncMock(return_value=None)
+        redis_client.get = AsyncMock(return_value=None)
+
+        with pytest.raises(HTTPException) as erro:
+            await controle.executar('compra', 'abc', CORPO, processa)
+
+        assert erro.value.status_code == 503
+        assert erro.value.headers == {'Retry-After': '1'}
+        assert redis_client.set.await_count == 2
+        processa.assert_not_awaited()
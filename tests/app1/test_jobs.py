@@ -0,0 +1,137 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app1.jobs import GerenciadorJobs
+
+
+def monta_compra(msg):
+    if msg[b'status'] == b'erro':
+        raise HTTPException(status_code=409, detail="Venda duplicada")
+    return {'venda_id': int(msg[b'venda_id'])}
+
+
+class TestesGerenciadorJobs:
+
+    @pytest.fixture
+    def jobs(self, redis_client):
+        jobs = GerenciadorJobs(redis_client)
+        jobs.registrar_tipo('compra', monta_compra)
+        return jobs
+
+    @pytest.mark.asyncio
+    async def test_criar_registra_job_pendente(self, jobs, redis_client):
+        await jobs.criar('j1', 'compra')
+
+        assert await jobs.consultar('j1') == {'job_id': 'j1', 'status': 'pendente', 'tipo': 'compra'}
+        assert 0 < await redis_client.ttl('job:j1') <= jobs.ttl_pendente
+
+    @pytest.mark.asyncio
+    async def test_criar_no_pipeline_so_grava_na_execucao(self, jobs, redis_client):
+        pipe = redis_client.pipeline(transaction=False)
+
+        await jobs.criar('j1', 'compra', pipe)
+        assert await jobs.consultar('j1') is None
+
+        await pipe.execute()
+        assert (await jobs.consultar('j1'))['status'] == 'pendente'
+
+    @pytest.mark.asyncio
+    async def test_consultar_job_inexistente(self, jobs):
+        assert await jobs.consultar('j1') is None
+        assert await jobs.consultar('j1', aguardar=1) is None
+
+    @pytest.mark.asyncio
+    async def test_concluir_grava_resultado(self, jobs, redis_client):
+        await jobs.criar('j1', 'compra')
+
+        assert await jobs.concluir('j1', {b'status': b'ok', b'venda_id': b'7'})
+
+        assert await jobs.consultar('j1') == {'job_id': 'j1', 'status': 'concluido', 'tipo': 'compra',
+                                              'codigo': 200, 'resultado': {'venda_id': 7}}
+        assert 0 < await redis_client.ttl('job:j1') <= jobs.ttl_resultado
+
+    @pytest.mark.asyncio
+    async def test_concluir_com_erro_do_montador(self, jobs):
+        await jobs.criar('j1', 'compra')
+
+        await jobs.concluir('j1', {b'status': b'erro'})
+
+        job = await jobs.consultar('j1')
+        assert (job['status'], job['codigo'], job['resultado']) == ('erro', 409, {'detail': "Venda duplicada"})
+
+    @pytest.mark.asyncio
+    async def test_resposta_invalida_conclui_com_502(self, jobs):
+        await jobs.criar('j1', 'compra')
+
+        assert await jobs.concluir('j1', {b'status': b'ok'})
+
+        job = await jobs.consultar('j1')
+        assert (job['status'], job['codigo']) == ('erro', 502)
+
+    @pytest.mark.asyncio
+    async def test_concluir_ignora_job_inexistente_ou_ja_concluido(self, jobs, redis_client):
+        assert not await jobs.concluir('j1', {b'status': b'ok', b'venda_id': b'7'})
+        assert not await redis_client.exists('job:j1')
+
+        await jobs.criar('j2', 'compra')
+        await jobs.concluir('j2', {b'status': b'ok', b'venda_id': b'7'})
+        assert not await jobs.concluir('j2', {b'status': b'erro'})
+        assert (await jobs.consultar('j2'))['resultado'] == {'venda_id': 7}
+
+    @pytest.mark.asyncio
+    async def test_long_poll_acorda_todas_as_consultas(self, jobs):
+        await jobs.criar('j1', 'compra')
+        consultas = [asyncio.create_task(jobs.consultar('j1', aguardar=5)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert jobs._aguardando == {'j1': 2}
+
+        await jobs.concluir('j1', {b'status': b'ok', b'venda_id': b'7'})
+        resultados = await asyncio.wait_for(asyncio.gather(*consultas), 1)
+
+        assert [job['status'] for job in resultados] == ['concluido', 'concluido']
+        assert jobs._eventos == {} and jobs._aguardando == {}
+
+    @pytest.mark.asyncio
+    async def test_long_poll_expira_com_job_pendente(self, jobs):
+        await jobs.criar('j1', 'compra')
+
+        job = await jobs.consultar('j1', aguardar=0.05)
+
+        assert job['status'] == 'pendente'
+        assert jobs._eventos == {} and jobs._aguardando == {}
+
+    @pytest.mark.asyncio
+    async def test_long_poll_limitado_por_aguardar_max(self, jobs, configuracao_app1, monkeypatch):
+        monkeypatch.setattr(configuracao_app1.jobs, 'aguardar_max', 0.05)
+        await jobs.criar('j1', 'compra')
+
+        job = await asyncio.wait_for(jobs.consultar('j1', aguardar=60), 1)
+
+        assert job['status'] == 'pendente'
+
+    @pytest.mark.asyncio
+    async def test_consulta_que_desiste_nao_remove_evento_das_demais(self, jobs):
+        await jobs.criar('j1', 'compra')
+        longa = asyncio.create_task(jobs.consultar('j1', aguardar=5))
+
+        assert (await jobs.consultar('j1', aguardar=0.05))['status'] == 'pendente'
+        assert jobs._aguardando == {'j1': 1}
+
+        await jobs.concluir('j1', {b'status': b'ok', b'venda_id': b'7'})
+        assert (await asyncio.wait_for(longa, 1))['status'] == 'concluido'
+
+    @pytest.mark.asyncio
+    async def test_job_concluido_por_outra_instancia_acorda_long_poll(self, jobs, redis_client):
+        outra_instancia = GerenciadorJobs(redis_client)
+        outra_instancia.registrar_tipo('compra', monta_compra)
+        await jobs.criar('j1', 'compra')
+        consulta = asyncio.create_task(jobs.consultar('j1', aguardar=5))
+        await asyncio.sleep(0.01)
+
+        msg = {b'status': b'ok', b'venda_id': b'7'}
+        assert await outra_instancia.concluir('j1', msg)
+        # O despachante desta instância também lê a resposta e a repassa a concluir
+        assert not await jobs.concluir('j1', msg)
+
+        assert (await asyncio.wait_for(consulta, 1))['status'] == 'concluido'
+        assert jobs._eventos == {}
@@ -3,6 +3,9 @@ import pytest
 import asyncio
 import pandas as pd
 from tools.mailhog import Mailhog
+from tools.retentativas import FalhaTransitoria
+from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from tools.esquemas import Associacao, decodifica, achata
 from unittest.mock import AsyncMock, patch, MagicMock
 from processar_associacao.app import AssocProcess
 
@@ -33,7 +36,7 @@ class TestAssocProcess:
 
     @pytest.fixture
     def mock_db_connection_no_data(self):
-        with patch('processar_associacao.app.PostgreSQLConnection') as MockDBConnection:
+        with patch('processar_associacao.app.AsyncPostgreSQLConnection') as MockDBConnection:
             instance = MockDBConnection.return_value
             instance.executa_busca_retorna_df = AsyncMock(
                 return_value=pd.DataFrame())
@@ -44,7 +47,7 @@ class TestAssocProcess:
 
     @pytest.fixture
     def mock_db_connection(self):
-        with patch('processar_streaming.app.PostgreSQLConnection') as MockDBConnection:
+        with patch('processar_streaming.app.AsyncPostgreSQLConnection') as MockDBConnection:
             instance = MockDBConnection.return_value
             instance.executa_busca_retorna_df = AsyncMock(return_value=pd.DataFrame([{
                 'nome': 'John Doe', 'email': 'john.doe@example.com', 'cpf': '901.234.567-89'
@@ -55,7 +58,7 @@ class TestAssocProcess:
 
     @pytest.fixture
     def mock_db_connection_with_error(self):
-        with patch('processar_associacao.app.PostgreSQLConnection') as MockDBConnection:
+        with patch('processar_associacao.app.AsyncPostgreSQLConnection') as MockDBConnection:
             instance = MockDBConnection.return_value
             instance.executa_insercao = AsyncMock(
                 side_effect=Exception("Erro na inserção"))
@@ -99,6 +102,10 @@ class TestAssocProcess:
             }
         ]
 
+    @pytest.fixture
+    def dados_associacao(self, associacao_json):
+        return achata(decodifica(Associacao, associacao_json[0]))
+
     @pytest.fixture
     def df_associacao_json(self):
         data = [
@@ -146,7 +153,7 @@ class TestAssocProcess:
         tipo_servico = "Assinatura"
         df_entrada = pd.DataFrame([{'nome': nome, 'email': email}])
         processor = AssocProcess()
-        with patch('tools.mailhog.Mailhog.send_email', return_value=False):
+        with patch.object(processor.mailhog, 'send_email', return_value=False):
             result = await processor.envia_email_cliente(df_entrada, tipo_servico)
             assert result is False
 
@@ -168,33 +175,41 @@ class TestAssocProcess:
             assert "Erro ao enviar email: Erro simulado ao enviar e-mail" in caplog.text
 
     @pytest.mark.asyncio
-    async def test_processar_associacao_falha(self, mock_db_connection_with_error, associacao_json):
+    async def test_envia_email_cliente_falha_transitoria_relancada(self, mock_mailhog):
+        df_entrada = pd.DataFrame([{'nome': "Sue Kim", 'email': "kunit@kemoni.aw"}])
+        processor = AssocProcess()
+
+        # Servidor SMTP indisponível: a mensagem é reprocessada em vez de respondida com erro
+        with patch.object(processor.mailhog, 'send_email', side_effect=FalhaTransitoria("SMTP indisponível")):
+            with pytest.raises(FalhaTransitoria):
+                await processor.envia_email_cliente(df_entrada, "Assinatura")
+
+    @pytest.mark.asyncio
+    async def test_processar_associacao_falha(self, mock_db_connection_with_error, dados_associacao):
         processor = AssocProcess()
-        df_associacao = pd.json_normalize(associacao_json)
         with patch.object(processor, 'db_connection', mock_db_connection_with_error):
             with pytest.raises(Exception, match="Erro na inserção"):
-                await processor.processar_associacao(df_associacao)
+                await processor.processar_associacao(dados_associacao)
 
     @pytest.mark.asyncio
-    async def test_processar_associacao_erro_busca(self, mock_db_connection_with_error, associacao_json):
+    async def test_processar_associacao_erro_busca(self, mock_db_connection_with_error, dados_associacao):
         processor = AssocProcess()
-        df_associacao = pd.json_normalize(associacao_json)
         with patch.object(processor, 'db_connection', mock_db_connection_with_error):
             with pytest.raises(Exception, match="Erro na inserção"):
-                await processor.processar_associacao(df_associacao)
+                await processor.processar_associacao(dados_associacao)
 
     @pytest.mark.asyncio
     async def test_processar_associacao_coluna_faltando(self, mock_db_connection, associacao_json):
         processor = AssocProcess()
-        df_associacao = pd.DataFrame([{
-            "data": "2024-08-1",
-            "cliente_id": "456.789.012-34",
-            "tipo_assinatura": "nova_associacao",
-            "detalhes_compra": {"nome_plano": "Básico", "ativo": "True"},
-        }])
-        with patch.object(processor, 'db_connection', mock_db_connection):
-            resultado = await processor.processar_associacao(df_associacao)
-            assert resultado is False
+        json_dict = dict(associacao_json[0])
+        del json_dict['vendedor_id']
+        msg_id, msg = b'1', {b'data': json.dumps(json_dict).encode('utf-8')}
+        with patch.object(processor, 'processar_associacao', new_callable=AsyncMock) as mock_processar:
+            with patch.object(processor.r, 'xadd') as mock_xadd:
+                await processor.processa_mensagem(msg_id, msg)
+        mock_processar.assert_not_called()
+        mock_xadd.assert_called_once_with(
+            'stream_app2_app1', {'status': 'false'}, maxlen=10000, approximate=True)
 
     @pytest.mark.asyncio
     async def test_process_message_mensagem_desconhecida(self, mock_db_connection):
@@ -205,48 +220,40 @@ class TestAssocProcess:
             "tipo_assinatura": "desconhecida",
             "detalhes_compra": {"nome_plano": "Plus"}
         }
-        message = ('stream_app1_app2', [
-                   (b'1', {b'data': json.dumps(json_dict).encode('utf-8')})])
+        msg_id, msg = b'1', {b'data': json.dumps(json_dict).encode('utf-8')}
         processor = AssocProcess()
         with patch.object(processor, 'db_connection', mock_db_connection):
             with patch.object(processor.r, 'xadd') as mock_xadd:
-                await processor.process_message(message)
+                await processor.processa_mensagem(msg_id, msg)
                 mock_xadd.assert_called_once_with(
-                    'stream_app2_app1', {'status': 'false'})
+                    'stream_app2_app1', {'status': 'false'}, maxlen=10000, approximate=True)
 
     @pytest.mark.asyncio
-    async def test_upgrade_associacao_cliente_inativo(self, mock_db_connection, upgrade_json):
-        df_upgrade = pd.DataFrame([{
-            "data": "2024-08-1",
-            "cliente_id": "456.789.012-34",
-            "vendedor_id": "1",
-            "tipo_assinatura": "upgrade_associacao",
-            "detalhes_compra": {"nome_plano": "Plus"}
-        }])
+    async def test_upgrade_associacao_cliente_nao_encontrado(self, mock_db_connection_no_data, upgrade_json):
         processor = AssocProcess()
-        with patch.object(processor, 'db_connection', mock_db_connection):
-            resultado = await processor.upgrade_associacao(df_upgrade)
+        with patch.object(processor, 'db_connection', mock_db_connection_no_data):
+            resultado = await processor.upgrade_associacao(
+                achata(decodifica(Associacao, upgrade_json[0])))
             assert resultado is False
+        mock_db_connection_no_data.executa_insercao.assert_not_called()
 
     @pytest.mark.asyncio
     async def test_processar_associacao_coluna_obrigatoria_faltando(self, mock_db_connection, associacao_json):
-        df_associacao = pd.DataFrame([{
-            "data": "2024-08-1",
-            "cliente_id": "456.789.012-34",
-            "vendedor_id": "1",
-            "tipo_assinatura": "nova_associacao"
-            # "detalhes_compra" está faltando
-        }])
+        json_dict = dict(associacao_json[0])
+        del json_dict['detalhes_compra']
+        msg_id, msg = b'1', {b'data': json.dumps(json_dict).encode('utf-8')}
         processor = AssocProcess()
         with patch.object(processor, 'db_connection', mock_db_connection):
-            resultado = await processor.processar_associacao(df_associacao)
-            assert resultado is False
+            with patch.object(processor.r, 'xadd') as mock_xadd:
+                await processor.processa_mensagem(msg_id, msg)
+        mock_db_connection.connect.assert_not_called()
+        mock_xadd.assert_called_once_with(
+            'stream_app2_app1', {'status': 'false'}, maxlen=10000, approximate=True)
 
     @pytest.mark.asyncio
     async def test_process_message_associacao(self, mock_db_connection, associacao_json):
         json_dict = associacao_json[0]
-        message = ('stream_app1_app2', [
-                   (b'1', {b'data': json.dumps(json_dict).encode('utf-8')})])
+        msg_id, msg = b'1', {b'data': json.dumps(json_dict).encode('utf-8')}
         processor = AssocProcess()
 
         # Mock do Redis
@@ -257,7 +264,7 @@ class TestAssocProcess:
 
             # Mock do método processar_associacao
             with patch.object(processor, 'processar_associacao', new_callable=AsyncMock) as mock_processar_associacao:
-                await processor.process_message(message)
+                await processor.processa_mensagem(msg_id, msg)
                 mock_processar_associacao.assert_called_once()
 
     @pytest.mark.asyncio
@@ -270,32 +277,46 @@ class TestAssocProcess:
             mock_send_email.assert_called_once()
 
     @pytest.mark.asyncio
-    async def test_processar_associacao_falha_insercao(self, mock_db_connection_with_error, df_associacao_json):
+    async def test_processar_associacao_falha_insercao(self, mock_db_connection_with_error, dados_associacao):
         processor = AssocProcess()
+        mock_db_connection_with_error.executa_insercao.side_effect = SQLAlchemyError(
+            "Erro na inserção")
+        mock_db_connection_with_error.session.rollback = AsyncMock()
         with patch.object(processor, 'db_connection', mock_db_connection_with_error):
-            result = await processor.processar_associacao(df_associacao_json)
+            result = await processor.processar_associacao(dados_associacao)
 
         assert result is False
 
     @pytest.mark.asyncio
-    async def test_upgrade_associacao_cliente_inativo(self, mock_db_connection):
-        df_upgrade = pd.DataFrame([{
-            "data": "2024-08-1",
-            "cliente_id": "456.789.012-34",
-            "vendedor_id": "1",
-            "tipo_assinatura": "upgrade_associacao",
-            "detalhes_compra": {"nome_plano": "Plus", "ativo": "False"}
-        }])
+    async def test_processar_associacao_falha_transitoria_relancada(self, mock_db_connection_with_error,
+                                                                    dados_associacao):
+        processor = AssocProcess()
+        # Conexão perdida com o banco: a mensagem é reprocessada em vez de respondida com erro
+        mock_db_connection_with_error.executa_insercao.side_effect = OperationalError(
+            "INSERT", {}, Exception("conexão perdida"))
+        mock_db_connection_with_error.session.rollback = AsyncMock()
+        with patch.object(processor, 'db_connection', mock_db_connection_with_error):
+            with pytest.raises(FalhaTransitoria):
+                await processor.processar_associacao(dados_associacao)
+
+    @pytest.mark.asyncio
+    async def test_upgrade_associacao_cliente_inativo(self, mock_db_connection, upgrade_json):
+        mock_db_connection.executa_busca_retorna_df = AsyncMock(return_value=pd.DataFrame([{
+            'nome': 'John Doe', 'email': 'john.doe@example.com', 'ativo': 'false'
+        }]))
+        mock_db_connection.executa_insercao = AsyncMock()
         processor = AssocProcess()
         with patch.object(processor, 'db_connection', mock_db_connection):
-            resultado = await processor.upgrade_associacao(df_upgrade)
+            resultado = await processor.upgrade_associacao(
+                achata(decodifica(Associacao, upgrade_json[0])))
             assert resultado is False
+        mock_db_connection.executa_insercao.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_processar_associacao_sem_dados(self, mock_db_connection_no_data, df_associacao_json):
+    async def test_processar_associacao_sem_dados(self, mock_db_connection_no_data, dados_associacao):
         processor = AssocProcess()
         with patch.object(processor, 'db_connection', mock_db_connection_no_data):
-            resultado = await processor.processar_associacao(df_associacao_json)
+            resultado = await processor.processar_associacao(dados_associacao)
             assert resultado is False, f"Resultado esperado False, mas recebeu {
                 resultado}"
 
@@ -307,14 +328,18 @@ class TestAssocProcess:
 
     @pytest.mark.asyncio
     async def test_upgrade_associacao_dados_invalidos(self, mock_db_connection):
-        df_upgrade = pd.DataFrame([{
+        json_dict = {
             "data": "2024-08-1",
             "cliente_id": "456.789.012-34",
             "vendedor_id": "1",
             "tipo_assinatura": "upgrade_associacao",
             "detalhes_compra": {"nome_plano": "Plus"}
-        }])  # 'ativo' missing
+        }  # 'ativo' missing
+        msg_id, msg = b'1', {b'data': json.dumps(json_dict).encode('utf-8')}
         processor = AssocProcess()
-        with patch.object(processor, 'db_connection', mock_db_connection):
-            resultado = await processor.upgrade_associacao(df_upgrade)
-            assert resultado is False
+        with patch.object(processor, 'upgrade_associacao', new_callable=AsyncMock) as mock_upgrade:
+            with patch.object(processor.r, 'xadd') as mock_xadd:
+                await processor.processa_mensagem(msg_id, msg)
+        mock_upgrade.assert_not_called()
+        mock_xadd.assert_called_once_with(
+            'stream_app2_app1', {'status': 'false'}, maxlen=10000, approximate=True)
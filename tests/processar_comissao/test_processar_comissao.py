@@ -4,13 +4,15 @@ from redis import Redis
 from sqlalchemy.exc import SQLAlchemyError
 from unittest.mock import AsyncMock, MagicMock, patch
 from processar_comissao.app import CalculoComissaoVendas
+from tools.codec import decodifica_campo
+from config import settings
 
 
 class TestesCalculoComissoes:
 
     @pytest.fixture
     def mock_db_connection(self):
-        with patch('processar_comissao.app.PostgreSQLConnection') as MockDBConnection:
+        with patch('processar_comissao.app.AsyncPostgreSQLConnection') as MockDBConnection:
             instance = MockDBConnection.return_value
             instance.connect = AsyncMock()
             instance.close = AsyncMock()
@@ -22,13 +24,8 @@ class TestesCalculoComissoes:
         return CalculoComissaoVendas()
 
     @pytest.fixture
-    def entrada_dataframe(self):
-        data = {
-            'ano': [2024],
-            'mes': [7],
-            'vendedor_id': [1]
-        }
-        return pd.DataFrame(data)
+    def filtro(self):
+        return {'ano': 2024, 'mes': 7, 'vendedor_id': 1}
 
     @pytest.fixture
     def dicionario_de_saida(self):
@@ -38,60 +35,113 @@ class TestesCalculoComissoes:
         ]
 
     @pytest.mark.asyncio
-    async def test_comissao_vendedores_sucesso(self, comissao, entrada_dataframe, dicionario_de_saida, mock_db_connection):
+    async def test_comissao_vendedores_sucesso(self, comissao, filtro, dicionario_de_saida, mock_db_connection):
 
         with patch.object(comissao.db_connection, 'connect', new_callable=AsyncMock), \
                 patch.object(comissao.db_connection, 'close', new_callable=AsyncMock), \
                 patch.object(comissao.db_connection, 'executa_busca_retorna_df', new_callable=AsyncMock) as mock_executa_busca:
             mock_executa_busca.return_value = pd.DataFrame(dicionario_de_saida)
-            resultado = await comissao.comissao_vendedores(entrada_dataframe)
+            resultado = await comissao.comissao_vendedores(filtro)
         assert resultado == dicionario_de_saida
         mock_executa_busca.assert_called_once()
+        _, query, parametros, _ = mock_executa_busca.call_args.args
+        assert query == settings.queries.calcular_comissao_vendedor
+        assert parametros == {'ano': 2024, 'mes': 7, 'vendedor_id': 1}
 
     @pytest.mark.asyncio
-    async def test_comissao_vendedores_Null(self, comissao, entrada_dataframe, mock_db_connection):
+    async def test_comissao_todos_vendedores(self, comissao, mock_db_connection):
+        with patch.object(comissao.db_connection, 'connect', new_callable=AsyncMock), \
+                patch.object(comissao.db_connection, 'close', new_callable=AsyncMock), \
+                patch.object(comissao.db_connection, 'executa_busca_retorna_df', new_callable=AsyncMock) as mock_executa_busca:
+            mock_executa_busca.return_value = pd.DataFrame()
+            await comissao.comissao_vendedores({'ano': 2024, 'mes': 12, 'vendedor_id': None})
+        _, query, parametros, _ = mock_executa_busca.call_args.args
+        assert query == settings.queries.calcular_comissao_geral
+        assert parametros == {'ano': 2024, 'mes': 12}
+
+    @pytest.mark.asyncio
+    async def test_comissao_mes_invalido(self, comissao, mock_db_connection):
+        with patch.object(comissao.db_connection, 'executa_busca_retorna_df', new_callable=AsyncMock) as mock_executa_busca:
+            assert await comissao.comissao_vendedores({'ano': 2024, 'mes': 13, 'vendedor_id': 1}) is None
+        mock_executa_busca.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_verifica_rollup_corrige_divergencias(self, comissao):
+        resultado = MagicMock()
+        resultado.mappings.return_value = [
+            {'ano': 2024, 'mes': 7, 'vendedor_id': 1, 'rollup_total_vendas': 3, 'vendas_total_vendas': 4}]
+        session = MagicMock(execute=AsyncMock(return_value=resultado), commit=AsyncMock(), rollback=AsyncMock())
+        comissao.db_connection = MagicMock(connect=AsyncMock(), close=AsyncMock(), session=session)
+
+        diferencas = await comissao.verifica_rollup(corrigir=True)
+
+        assert [d['vendedor_id'] for d in diferencas] == [1]
+        executadas = [str(chamada.args[0]) for chamada in session.execute.call_args_list]
+        assert executadas[0].startswith('LOCK TABLE comissao_mensal')
+        assert executadas[-2:] == [settings.queries.limpa_comissao_mensal,
+                                   settings.queries.reconstroi_comissao_mensal]
+        session.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_comissao_vendedores_Null(self, comissao, filtro, mock_db_connection):
 
         with patch.object(comissao.db_connection, 'connect', new_callable=AsyncMock), \
                 patch.object(comissao.db_connection, 'close', new_callable=AsyncMock), \
                 patch.object(comissao.db_connection, 'executa_busca_retorna_df', new_callable=AsyncMock) as mock_executa_busca:
             mock_executa_busca.return_value = pd.DataFrame()
-            resultado = await comissao.comissao_vendedores(entrada_dataframe)
+            resultado = await comissao.comissao_vendedores(filtro)
         assert resultado == None
         mock_executa_busca.assert_called_once()
 
     @pytest.mark.asyncio
     async def test_process_message(self, comissao, mocker):
         # Criar uma mensagem de teste
-        message = ('stream_app1_app5', [
-            (b'1234567890', {
-             b'data': b'{"ano": 2022, "mes": 12, "vendedor_id": 1}'})
-        ])
+        msg_id, msg = b'1234567890', {b'data': b'{"ano": 2022, "mes": 12, "vendedor_id": 1}'}
 
         mocker.patch.object(comissao, 'comissao_vendedores', return_value=[
                             {'vendedor_id': 1, 'comissao': 100.0}])
 
         mocker.patch.object(comissao.r, 'xadd')
-        await comissao.process_message(message)
+        await comissao.processa_mensagem(msg_id, msg)
         comissao.comissao_vendedores.assert_called_once()
-        comissao.r.xadd.assert_called_once_with('stream_app5_app1', {
-            'status': 'true', 'vendedores': '[{"vendedor_id": 1, "comissao": 100.0}]'})
+        comissao.r.xadd.assert_called_once()
+        stream, campos = comissao.r.xadd.call_args.args
+        assert stream == 'stream_app5_app1'
+        assert campos['status'] == 'true'
+        resposta = {chave.encode('utf-8'): valor if isinstance(valor, bytes) else valor.encode('utf-8')
+                    for chave, valor in campos.items()}
+        assert decodifica_campo(resposta, 'vendedores') == [
+            {'vendedor_id': 1, 'comissao': 100.0}]
+
+    @pytest.mark.asyncio
+    async def test_process_message_todos_vendedores(self, comissao, mock_db_connection, mocker):
+        # Sem vendedor_id na mensagem, as comissões de todos os vendedores do mês
+        msg_id, msg = b'1234567890', {b'data': b'{"ano": 2024, "mes": 7}'}
+        mocker.patch.object(comissao.r, 'xadd')
+        with patch.object(comissao.db_connection, 'connect', new_callable=AsyncMock), \
+                patch.object(comissao.db_connection, 'close', new_callable=AsyncMock), \
+                patch.object(comissao.db_connection, 'executa_busca_retorna_df', new_callable=AsyncMock) as mock_executa_busca:
+            mock_executa_busca.return_value = pd.DataFrame([{'id': 1}, {'id': 2}])
+            await comissao.processa_mensagem(msg_id, msg)
+
+        _, query, parametros, _ = mock_executa_busca.call_args.args
+        assert query == settings.queries.calcular_comissao_geral
+        assert parametros == {'ano': 2024, 'mes': 7}
+        assert comissao.r.xadd.call_args.args[1]['status'] == 'true'
 
     @ pytest.mark.asyncio
     async def test_process_message_error(self, comissao, mocker):
         # Criar uma mensagem de teste
-        message = ('stream_app1_app5', [
-            (b'1234567890', {
-                b'data': b'{"ano": 2022, "mes": 12, "vendedor_id": 1}'})
-        ])
+        msg_id, msg = b'1234567890', {b'data': b'{"ano": 2022, "mes": 12, "vendedor_id": 1}'}
         mocker.patch.object(comissao, 'comissao_vendedores', return_value=None)
         mocker.patch.object(comissao.r, 'xadd')
-        await comissao.process_message(message)
+        await comissao.processa_mensagem(msg_id, msg)
         comissao.comissao_vendedores.assert_called_once()
         comissao.r.xadd.assert_called_once_with(
-            'stream_app5_app1', {'status': 'false'})
+            'stream_app5_app1', {'status': 'false'}, maxlen=10000, approximate=True)
 
     @ pytest.mark.asyncio
-    async def test_comissao_vendedores_erro_sqlalchemy(self, comissao, entrada_dataframe, mock_db_connection):
+    async def test_comissao_vendedores_erro_sqlalchemy(self, comissao, filtro, mock_db_connection):
         with patch.object(comissao.db_connection, 'connect', new_callable=AsyncMock) as mock_connect, \
                 patch.object(comissao.db_connection, 'close', new_callable=AsyncMock), \
                 patch.object(comissao.db_connection, 'executa_busca_retorna_df', new_callable=AsyncMock) as mock_executa_busca, \
@@ -100,7 +150,7 @@ class TestesCalculoComissoes:
             mock_executa_busca.side_effect = SQLAlchemyError(
                 "Erro na consulta")
             mock_connect.return_value.__aenter__.return_value = mock_db_connection
-            resultado = await comissao.comissao_vendedores(entrada_dataframe)
+            resultado = await comissao.comissao_vendedores(filtro)
             assert resultado is None
             mock_executa_busca.assert_called_once()
             mock_logger.error.assert_called_once_with(
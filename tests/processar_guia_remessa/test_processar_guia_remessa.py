@@ -134,7 +134,7 @@ class TesteGerarGuiaRemessa:
                 patch.object(guiaremessa.db_connection, 'close', new_callable=AsyncMock), \
                 patch.object(guiaremessa.db_connection, 'executa_busca_retorna_df', new_callable=AsyncMock) as mock_executa_busca, \
                 patch.object(guiaremessa, 'adiciona_to_json', return_value=entrada_dataframe) as mock_adiciona_to_json, \
-                patch.object(guiaremessa, 'convert_to_json', return_value=dicionario_de_saida) as mock_convert_to_json:
+                patch.object(guiaremessa, 'monta_guia', return_value=dicionario_de_saida) as mock_monta_guia:
 
             # Simular o retorno do método executa_busca_retorna_df
             mock_executa_busca.return_value = entrada_dataframe
@@ -146,7 +146,7 @@ class TesteGerarGuiaRemessa:
         assert resultado == dicionario_de_saida
         mock_executa_busca.assert_called_once()
         mock_adiciona_to_json.assert_called_once_with(entrada_dataframe)
-        mock_convert_to_json.assert_called_once_with(entrada_dataframe)
+        mock_monta_guia.assert_called_once_with(entrada_dataframe)
 
     @pytest.mark.asyncio
     async def test_gera_guia_remessa_vazio(self, guiaremessa):
@@ -3,6 +3,7 @@ import pandas as pd
 import pytest
 from processar_streaming.app import VideoProcessor
 from tools.mailhog import Mailhog
+from tools.esquemas import Streaming, decodifica, achata
 from unittest.mock import AsyncMock, patch, MagicMock
 
 
@@ -15,6 +16,11 @@ def json_entrada():
     }
 
 
+@pytest.fixture
+def dados_entrada(json_entrada):
+    return achata(decodifica(Streaming, json_entrada))
+
+
 @pytest.fixture
 def json_saida():
     return {
@@ -35,7 +41,7 @@ def mock_mailhog():
 
 @pytest.fixture
 def mock_mailhog_with_error():
-    with patch('tools.mailhog.Mailhog') as MockMailhog:
+    with patch('processar_streaming.app.Mailhog') as MockMailhog:
         mock_instance = MockMailhog.return_value
         mock_instance.send_email = MagicMock(
             side_effect=Exception("Erro ao enviar e-mail"))
@@ -44,7 +50,7 @@ def mock_mailhog_with_error():
 
 @pytest.fixture
 def mock_db_connection():
-    with patch('processar_streaming.app.PostgreSQLConnection') as MockDBConnection:
+    with patch('processar_streaming.app.AsyncPostgreSQLConnection') as MockDBConnection:
         instance = MockDBConnection.return_value
         instance.executa_busca_retorna_df = AsyncMock(return_value=pd.DataFrame([{
             'nome': 'John Doe', 'email': 'john.doe@example.com', 'cpf': '901.234.567-89'
@@ -103,10 +109,10 @@ async def test_send_email_with_error(mock_mailhog_with_error):
 @pytest.mark.asyncio
 async def test_processa_compra_entrada(json_entrada):
     processor = VideoProcessor()
-    with patch.object(VideoProcessor, 'process_message', return_value={'status': 'success'}) as mock_processa:
-        resultado = await processor.process_message(json_entrada)
+    with patch.object(VideoProcessor, 'processa_mensagem', return_value={'status': 'success'}) as mock_processa:
+        resultado = await processor.processa_mensagem(b'1', json_entrada)
         assert resultado['status'] == 'success'
-        mock_processa.assert_called_once_with(json_entrada)
+        mock_processa.assert_called_once_with(b'1', json_entrada)
 
 
 @pytest.mark.asyncio
@@ -125,28 +131,31 @@ async def test_envia_email_cliente_erro_rede():
 @pytest.mark.asyncio
 async def test_process_message_entrada(json_entrada):
     processor = VideoProcessor()
-    # Mocking methods that will be called within process_message
-    with patch.object(VideoProcessor, 'process_message', return_value={'status': 'success'}) as mock_processa:
-        resultado = await processor.process_message(json_entrada)
+    # Mocking methods that will be called within processa_mensagem
+    with patch.object(VideoProcessor, 'processa_mensagem', return_value={'status': 'success'}) as mock_processa:
+        resultado = await processor.processa_mensagem(b'1', json_entrada)
         assert resultado['status'] == 'success'
-        mock_processa.assert_called_once_with(json_entrada)
+        mock_processa.assert_called_once_with(b'1', json_entrada)
 
 
 @pytest.mark.asyncio
 async def test_envio_video_df_incompleto():
     processor = VideoProcessor()
-    df_incompleto = pd.DataFrame([{'detalhes_compra.id_streaming': '2'}])
-    resultado = await processor.envio_video(df_incompleto)
-    assert resultado is None
+    processor.envio_video = AsyncMock()
+    processor.r = MagicMock()
+    msg_id, msg = b'1', {b'data': json.dumps({'detalhes_compra': {'id_streaming': '2'}}).encode('utf-8')}
+    await processor.processa_mensagem(msg_id, msg)
+    processor.envio_video.assert_not_called()
+    processor.r.xadd.assert_called_once_with(
+        'stream_app4_app1', {'status': 'false'}, maxlen=10000, approximate=True)
 
 
 @pytest.mark.asyncio
-async def test_envio_video_dados_completos(json_entrada, mock_mailhog, mock_db_connection):
+async def test_envio_video_dados_completos(dados_entrada, mock_mailhog, mock_db_connection):
     processor = VideoProcessor()
-    df_entrada = pd.json_normalize(json_entrada)
     with patch.object(VideoProcessor, 'envia_email_cliente', return_value={'cpf': '901.234.567-89', 'videos': [{'nome': 'Primeiros Socorros', 'link': 'https://www.youtube.com/watch?v=789012'}]}):
         with patch.object(processor, 'db_connection', mock_db_connection):
-            resultado = await processor.envio_video(df_entrada)
+            resultado = await processor.envio_video(dados_entrada)
             assert resultado is not None
             assert 'cpf' in resultado
             assert 'videos' in resultado
@@ -171,20 +180,29 @@ async def test_fechar_conexao_bd(mock_db_connection):
 @pytest.mark.asyncio
 async def test_processa_video_dados_incompletos(mock_mailhog, mock_db_connection):
     processor = VideoProcessor()
-    df_incompleto = pd.DataFrame([{'data': '2024-08-1'}])
+    processor.r = MagicMock()
+    msg_id, msg = b'1', {b'data': b'{"data": "2024-08-1"}'}
     with patch.object(processor, 'db_connection', mock_db_connection):
         with patch.object(processor, 'mailhog', mock_mailhog):
-            resultado = await processor.envio_video(df_incompleto)
-            assert resultado is None
+            await processor.processa_mensagem(msg_id, msg)
+    mock_db_connection.executa_busca_retorna_df.assert_not_called()
+    mock_mailhog.send_email.assert_not_called()
+    processor.r.xadd.assert_called_once_with(
+        'stream_app4_app1', {'status': 'false'}, maxlen=10000, approximate=True)
 
 
 @pytest.mark.asyncio
-async def test_processa_video_com_erro_no_envio_email(mock_mailhog_with_error, mock_db_connection, json_saida):
+async def test_processa_video_com_erro_no_envio_email(mock_mailhog_with_error, mock_db_connection, dados_entrada):
     processor = VideoProcessor()
-    df_entrada = pd.json_normalize(json_saida)
+    mock_db_connection.executa_busca_retorna_df = AsyncMock(side_effect=[
+        pd.DataFrame([{'nome': 'Primeiros Socorros',
+                       'link': 'https://www.youtube.com/watch?v=789012'}]),
+        pd.DataFrame([{'nome': 'John Doe', 'email': 'john.doe@example.com',
+                       'cpf': '901.234.567-89'}]),
+    ])
     with patch.object(processor, 'db_connection', mock_db_connection):
         with patch.object(processor, 'mailhog', mock_mailhog_with_error):
-            resultado = await processor.envio_video(df_entrada)
+            resultado = await processor.envio_video(dados_entrada)
             assert resultado is None
 
 
@@ -214,7 +232,7 @@ async def test_envia_email_cliente_com_excecao(mock_mailhog_with_error):
 
 
 @pytest.mark.asyncio
-async def test_falha_no_processamento_video(mock_db_connection, mock_mailhog):
+async def test_falha_no_processamento_video(mock_db_connection, mock_mailhog, dados_entrada):
     processor = VideoProcessor()
     mock_db_connection.executa_busca_retorna_df = AsyncMock(return_value=pd.DataFrame({
         'nome': ['João'],
@@ -222,15 +240,9 @@ async def test_falha_no_processamento_video(mock_db_connection, mock_mailhog):
         'cpf': ['123.456.789-00'],
         'link': ['http://example.com/video']
     }))
-    with patch.object(processor, 'mailhog', mock_mailhog):
-        processor.gera_link_video = AsyncMock(
-            side_effect=Exception("Erro na geração do link"))
-        detalhes_compra = {'id_streaming': ['2']}
-        df = pd.DataFrame({
-            'cliente_id': ['901.234.567-89'],
-            'data': ['2024-08-01'],
-            'detalhes_compra': [detalhes_compra]
-        })
-
-        resultado = await processor.envio_video(df)
-        assert resultado is None
+    mock_mailhog.send_email = MagicMock(return_value=False)
+    with patch.object(processor, 'db_connection', mock_db_connection):
+        with patch.object(processor, 'mailhog', mock_mailhog):
+            resultado = await processor.envio_video(dados_entrada)
+            assert resultado is None
+    mock_mailhog.send_email.assert_called_once()
@@ -1,11 +1,12 @@
 import json
 import pytest
-import pandas as pd
 from redis import Redis
 from config import settings
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, OperationalError
 from unittest.mock import AsyncMock, MagicMock, patch
 from produto_fisico.app import VendaProcessor
+from tools.esquemas import Compra, decodifica, achata
+from tools.retentativas import FalhaTransitoria
 
 
 class TestesProdutosFisicos:
@@ -15,216 +16,263 @@ class TestesProdutosFisicos:
         return VendaProcessor()
 
     @pytest.fixture
-    def df_entrada_livro(self):
-        json_data = '''
-        {
+    def mensagem_livro(self):
+        return json.dumps({
             "data": "2024-07-25",
             "cliente_id": "123.456.789-00",
             "vendedor_id": "1",
             "tipo_compra": "produto_fisico",
             "detalhes_compra": {
                 "produto_id": "8",
-                "tipo_produto": "livro",  
+                "tipo_produto": "livro",
                 "quantidade": 1,
                 "preco": 150.00,
                 "nome_produto": "The Two Towers",
                 "tipo_pagamento": "PIX",
-                "especificacoes": "null",  
-                "garantia": 0,  
-                "autor": "J.R.R. Tolkien",  
-                "isbn": "978-0-618-00224-4",
-                "valor_royalty" : "6%"   
-                }
+                "valor_royalty": "6%"
             }
-        '''
+        }).encode('utf-8')
 
-        dict_data = json.loads(json_data)
-        df = pd.json_normalize(dict_data)
-        return df
+    @pytest.fixture
+    def venda_livro(self, mensagem_livro):
+        return achata(decodifica(Compra, mensagem_livro))
 
     @pytest.fixture
-    def df_entrada_produto(self):
-        json_data = '''
-        {
-            "data": "2024-07-29",
-            "cliente_id": "901.234.567-89",
-            "vendedor_id": "1",
-            "tipo_compra": "produto_fisico",
-            "detalhes_compra": {
-                "produto_id": "1",
-                "tipo_produto": "laptop",
-                "quantidade": 1,
-                "preco": 1500.00,
-                "nome_produto": "laptop LeNovo",
-                "tipo_pagamento": "Cartão",
-                "especificacoes": "4gb memoria, placa de video, processador intel",
-                "garantia": 24,
-                "autor": "null",
-                "isbn": "null",
-                "valor_royalty" : "null"
-            }
+    def venda_produto(self, venda_livro):
+        return dict(venda_livro, **{'detalhes_compra.tipo_produto': 'laptop',
+                                    'detalhes_compra.valor_royalty': None})
+
+    @pytest.mark.asyncio
+    async def test_process_message_sucesso(self, compra_fisica, mensagem_livro):
+        # Mockando a gravação da venda completa
+        compra_fisica.insere_venda_completa = AsyncMock(return_value={
+            'venda_id': 1, 'comissao_id': 1, 'royalty_id': 1, 'remessa_id': None})
+
+        # Mockando o Redis
+        redis_mock = MagicMock()
+        compra_fisica.r = redis_mock
+
+        message_data = {
+            b'data': mensagem_livro
         }
-        '''
-        dict_data = json.loads(json_data)
-        df = pd.json_normalize(dict_data)
-        return df
+        msg_id, msg = b'msg_id_1', message_data
+        await compra_fisica.processa_mensagem(msg_id, msg)
+        compra_fisica.insere_venda_completa.assert_called_once()
+        venda = compra_fisica.insere_venda_completa.call_args.args[0]
+        assert venda['detalhes_compra.produto_id'] == 8
+        assert venda['detalhes_compra.garantia'] is None
+        redis_mock.xadd.assert_called_once_with(
+            'stream_app3_app1', {'status': 'true', 'venda_id': '1'}, maxlen=10000, approximate=True
+        )
+        # A venda invalida o cache de comissões do mês
+        redis_mock.incr.assert_called_once_with('cache:comissao:geracao:2024-07')
 
     @pytest.mark.asyncio
-    async def test_insere_livro_sucesso(self, compra_fisica, df_entrada_livro):
+    async def test_process_message_ecoa_correlation_id(self, compra_fisica, mensagem_livro):
+        compra_fisica.insere_venda_completa = AsyncMock(return_value={
+            'venda_id': 1, 'comissao_id': 1, 'royalty_id': None, 'remessa_id': 1})
 
-        with patch.object(compra_fisica.db_connection, 'connect', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'close', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'executa_insercao_retorna_id', new_callable=AsyncMock) as mock_executa_insert:
-            mock_executa_insert.return_value = 7
-            resultado = await compra_fisica.insere_venda_livro(df_entrada_livro)
-        assert resultado == 7
-        mock_executa_insert.assert_called_once()
+        redis_mock = MagicMock()
+        compra_fisica.r = redis_mock
+
+        message_data = {
+            b'data': mensagem_livro,
+            b'correlation_id': b'abc123'
+        }
+        msg_id, msg = b'msg_id_1', message_data
+        await compra_fisica.processa_mensagem(msg_id, msg)
+        redis_mock.xadd.assert_called_once_with(
+            'stream_app3_app1', {'status': 'true', 'venda_id': '1',
+                                 'correlation_id': b'abc123'}, maxlen=10000, approximate=True
+        )
 
     @pytest.mark.asyncio
-    async def test_insere_livro_sem_id(self, compra_fisica, df_entrada_livro):
-        with patch.object(compra_fisica.db_connection, 'connect', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'close', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'executa_insercao_retorna_id', new_callable=AsyncMock) as mock_executa_insert:
-            mock_executa_insert.return_value = None
-            resultado = await compra_fisica.insere_venda_livro(df_entrada_livro)
-            assert resultado is None
-            mock_executa_insert.assert_called_once()
+    async def test_process_message_falha_gravacao(self, compra_fisica, mensagem_livro):
+        compra_fisica.insere_venda_completa = AsyncMock(return_value=None)
+        redis_mock = MagicMock()
+        compra_fisica.r = redis_mock
+
+        msg_id, msg = b'msg_id_1', {b'data': mensagem_livro}
+        await compra_fisica.processa_mensagem(msg_id, msg)
+        redis_mock.xadd.assert_called_once_with(
+            'stream_app3_app1', {'status': 'false'}, maxlen=10000, approximate=True)
+        redis_mock.incr.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_insere_comissao_sucesso(self, compra_fisica, df_entrada_livro):
+    async def test_process_message_chave_ja_gravada(self, compra_fisica, mensagem_livro):
+        compra_fisica.busca_venda_idempotente = AsyncMock(return_value={
+            'venda_id': 5, 'comissao_id': 5, 'royalty_id': 5, 'remessa_id': None})
+        compra_fisica.insere_venda_completa = AsyncMock()
+        redis_mock = MagicMock()
+        compra_fisica.r = redis_mock
 
-        with patch.object(compra_fisica.db_connection, 'connect', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'close', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'executa_insercao_retorna_id', new_callable=AsyncMock) as mock_executa_insert:
-            mock_executa_insert.return_value = 7
-            resultado = await compra_fisica.insere_venda_comissao(df_entrada_livro, 7)
-        assert resultado == 7
-        mock_executa_insert.assert_called_once()
+        msg_id, msg = b'msg_id_1', {b'data': mensagem_livro,
+                                    b'idempotency_key': b'pedido-5'}
+        await compra_fisica.processa_mensagem(msg_id, msg)
+        compra_fisica.busca_venda_idempotente.assert_awaited_once_with('pedido-5')
+        compra_fisica.insere_venda_completa.assert_not_called()
+        redis_mock.xadd.assert_called_once_with(
+            'stream_app3_app1', {'status': 'true', 'venda_id': '5'}, maxlen=10000, approximate=True)
+
+    @pytest.mark.asyncio
+    async def test_process_message_chave_gravada_por_outra_mensagem(self, compra_fisica, mensagem_livro):
+        # A busca não encontra a venda, mas o INSERT colide (ON CONFLICT) com uma gravação concorrente
+        compra_fisica.busca_venda_idempotente = AsyncMock(side_effect=[None, {
+            'venda_id': 6, 'comissao_id': 6, 'royalty_id': 6, 'remessa_id': None}])
+        compra_fisica.insere_venda_completa = AsyncMock(return_value=None)
+        redis_mock = MagicMock()
+        compra_fisica.r = redis_mock
+
+        msg_id, msg = b'msg_id_1', {b'data': mensagem_livro,
+                                    b'idempotency_key': b'pedido-6'}
+        await compra_fisica.processa_mensagem(msg_id, msg)
+        venda = compra_fisica.insere_venda_completa.call_args.args[0]
+        assert venda['chave_idempotencia'] == 'pedido-6'
+        redis_mock.xadd.assert_called_once_with(
+            'stream_app3_app1', {'status': 'true', 'venda_id': '6'}, maxlen=10000, approximate=True)
 
     @pytest.mark.asyncio
-    async def test_insere_comissao_none(self, compra_fisica, df_entrada_livro):
+    async def test_process_message_sem_chave_usa_correlation_id(self, compra_fisica, mensagem_livro):
+        # Reentrega de uma mensagem já gravada: o INSERT colide pela chave (ON CONFLICT)
+        compra_fisica.busca_venda_idempotente = AsyncMock(return_value={
+            'venda_id': 8, 'comissao_id': 8, 'royalty_id': 8, 'remessa_id': None})
+        compra_fisica.insere_venda_completa = AsyncMock(return_value=None)
+        redis_mock = MagicMock()
+        compra_fisica.r = redis_mock
+
+        msg_id, msg = b'msg_id_1', {b'data': mensagem_livro, b'correlation_id': b'abc123'}
+        await compra_fisica.processa_mensagem(msg_id, msg)
+        venda = compra_fisica.insere_venda_completa.call_args.args[0]
+        assert venda['chave_idempotencia'] == 'abc123'
+        # Sem chave do app1, a busca só acontece depois da colisão
+        compra_fisica.busca_venda_idempotente.assert_awaited_once_with('abc123')
+        redis_mock.xadd.assert_called_once_with(
+            'stream_app3_app1', {'status': 'true', 'venda_id': '8', 'correlation_id': b'abc123'},
+            maxlen=10000, approximate=True)
 
+    @pytest.mark.asyncio
+    async def test_insere_venda_completa_parametros(self, compra_fisica, venda_livro):
+        ids = {'venda_id': 7, 'comissao_id': 3, 'royalty_id': 2, 'remessa_id': None}
         with patch.object(compra_fisica.db_connection, 'connect', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'close', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'executa_insercao_retorna_id', new_callable=AsyncMock) as mock_executa_insert:
-            mock_executa_insert.return_value = None
-            resultado = await compra_fisica.insere_venda_comissao(df_entrada_livro, 7)
-        assert resultado is None
-        mock_executa_insert.assert_called_once()
+                patch.object(compra_fisica.db_connection, 'close', new_callable=AsyncMock) as mock_close, \
+                patch.object(compra_fisica, 'garante_particoes', new_callable=AsyncMock) as mock_particoes, \
+                patch.object(compra_fisica.db_connection, 'executa_insercao_retorna_linha', new_callable=AsyncMock) as mock_grava:
+            mock_grava.return_value = ids
+            resultado = await compra_fisica.insere_venda_completa(venda_livro)
+
+        assert resultado == ids
+        assert mock_particoes.call_args.args[1] == [venda_livro]
+        mock_grava.assert_called_once()
+        _, query, venda, mapeamento = mock_grava.call_args.args
+        assert query == settings.queries.insert_venda_completa
+        assert venda['status'] == 'Fechado'
+        assert set(mapeamento) <= set(venda)
+        assert mapeamento['detalhes_compra.tipo_produto'] == 'tipo_produto'
+        mock_close.assert_awaited_once()
 
     @pytest.mark.asyncio
-    async def test_insere_royalty_remessa_livro_sucesso(self, compra_fisica, df_entrada_livro):
+    async def test_garante_particoes_uma_vez_por_mes(self, compra_fisica, venda_livro):
+        session = MagicMock(execute=AsyncMock(), commit=AsyncMock(), rollback=AsyncMock())
+        vendas = [venda_livro, dict(venda_livro, data='2024-07-02'), dict(venda_livro, data='2023-12-31')]
 
-        with patch.object(compra_fisica.db_connection, 'connect', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'close', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'executa_insercao_retorna_id', new_callable=AsyncMock) as mock_executa_insert:
-            mock_executa_insert.return_value = 7
-            resultado = await compra_fisica.insere_venda_royalty_remessa(df_entrada_livro, 7)
-        assert resultado == 7
-        mock_executa_insert.assert_called_once()
+        await compra_fisica.garante_particoes(session, vendas)
+        await compra_fisica.garante_particoes(session, vendas[:2])
+
+        # Um mês por chamada à função do banco, e nenhuma consulta para os meses já garantidos
+        meses = [chamada.args[1]['inicio'].isoformat() for chamada in session.execute.call_args_list]
+        assert meses == ['2023-12-01', '2024-07-01']
+        session.commit.assert_awaited_once()
+        assert compra_fisica.meses_com_particao == {(2023, 12), (2024, 7)}
 
     @pytest.mark.asyncio
-    async def test_insere_royalty_remessa_livro_none(self, compra_fisica, df_entrada_livro):
+    async def test_garante_particoes_falha_nao_guarda_o_mes(self, compra_fisica, venda_livro):
+        session = MagicMock(execute=AsyncMock(side_effect=SQLAlchemyError("sem permissão")),
+                            commit=AsyncMock(), rollback=AsyncMock())
+
+        await compra_fisica.garante_particoes(session, [venda_livro])
+
+        session.rollback.assert_awaited_once()
+        assert compra_fisica.meses_com_particao == set()
+
+    @pytest.mark.asyncio
+    async def test_process_message_campos_faltando(self, compra_fisica):
+        compra_fisica.insere_venda_completa = AsyncMock()
+        redis_mock = MagicMock()
+        compra_fisica.r = redis_mock
+
+        msg_id, msg = b'msg_id_1', {b'data': b'{"data": "2024-07-25"}'}
+        await compra_fisica.processa_mensagem(msg_id, msg)
 
+        # A mensagem fora do esquema é recusada sem acessar o banco
+        compra_fisica.insere_venda_completa.assert_not_called()
+        redis_mock.xadd.assert_called_once_with(
+            'stream_app3_app1', {'status': 'false'}, maxlen=10000, approximate=True)
+
+    @pytest.mark.asyncio
+    async def test_insere_vendas_lote_uma_transacao(self, compra_fisica, venda_livro, venda_produto):
+        linhas = [{'venda_id': 1}, {'venda_id': 2}]
         with patch.object(compra_fisica.db_connection, 'connect', new_callable=AsyncMock), \
                 patch.object(compra_fisica.db_connection, 'close', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'executa_insercao_retorna_id', new_callable=AsyncMock) as mock_executa_insert:
-            mock_executa_insert.return_value = None
-            resultado = await compra_fisica.insere_venda_royalty_remessa(df_entrada_livro, 7)
-        assert resultado is None
-        mock_executa_insert.assert_called_once()
+                patch.object(compra_fisica, 'garante_particoes', new_callable=AsyncMock), \
+                patch.object(compra_fisica.db_connection, 'executa_transacao_retorna_linhas', new_callable=AsyncMock) as mock_lote:
+            mock_lote.return_value = linhas
+            resultado = await compra_fisica.insere_vendas_lote([venda_livro, venda_produto])
+
+        assert resultado == linhas
+        mock_lote.assert_awaited_once()
+        assert [venda['status'] for venda in mock_lote.call_args.args[2]] == ['Fechado', 'Fechado']
 
     @pytest.mark.asyncio
-    async def test_insere_royalty_remessa_produto_sucesso(self, compra_fisica, df_entrada_produto):
+    async def test_insere_vendas_lote_falha_grava_uma_a_uma(self, compra_fisica, venda_livro, venda_produto):
         with patch.object(compra_fisica.db_connection, 'connect', new_callable=AsyncMock), \
                 patch.object(compra_fisica.db_connection, 'close', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'executa_insercao_retorna_id', new_callable=AsyncMock) as mock_executa_insert:
-            mock_executa_insert.return_value = 7
-            resultado = await compra_fisica.insere_venda_royalty_remessa(df_entrada_produto, 7)
-        assert resultado == 7
-        mock_executa_insert.assert_called_once()
+                patch.object(compra_fisica, 'garante_particoes', new_callable=AsyncMock), \
+                patch.object(compra_fisica.db_connection, 'executa_transacao_retorna_linhas', new_callable=AsyncMock) as mock_lote:
+            mock_lote.side_effect = SQLAlchemyError("Erro no lote")
+            compra_fisica.insere_venda_completa = AsyncMock(side_effect=[{'venda_id': 5}, None])
+            resultado = await compra_fisica.insere_vendas_lote([venda_livro, venda_produto])
+
+        assert resultado == [{'venda_id': 5}, None]
+        assert compra_fisica.insere_venda_completa.await_count == 2
 
     @pytest.mark.asyncio
-    async def test_insere_royalty_remessa_produto_none(self, compra_fisica, df_entrada_produto):
+    async def test_insere_vendas_lote_uma_a_uma_continua_apos_erro(self, compra_fisica, venda_livro, venda_produto):
+        erro = FalhaTransitoria("conexão perdida")
         with patch.object(compra_fisica.db_connection, 'connect', new_callable=AsyncMock), \
                 patch.object(compra_fisica.db_connection, 'close', new_callable=AsyncMock), \
-                patch.object(compra_fisica.db_connection, 'executa_insercao_retorna_id', new_callable=AsyncMock) as mock_executa_insert:
-            mock_executa_insert.return_value = None
-            resultado = await compra_fisica.insere_venda_royalty_remessa(df_entrada_produto, 7)
-        assert resultado is None
-        mock_executa_insert.assert_called_once()
+                patch.object(compra_fisica, 'garante_particoes', new_callable=AsyncMock), \
+                patch.object(compra_fisica.db_connection, 'executa_transacao_retorna_linhas', new_callable=AsyncMock) as mock_lote:
+            mock_lote.side_effect = SQLAlchemyError("Erro no lote")
+            compra_fisica.insere_venda_completa = AsyncMock(side_effect=[erro, {'venda_id': 6}])
+            resultado = await compra_fisica.insere_vendas_lote([venda_livro, venda_produto])
 
-    @pytest.mark.asyncio
-    async def test_insere_dados_banco_sucesso(self, compra_fisica):
-        db_connection_mock = AsyncMock()
-        db_connection_mock.executa_insercao_retorna_id.return_value = 1
-        session_mock = AsyncMock()
-        db_connection_mock.session = session_mock
-        compra_fisica.db_connection = db_connection_mock
-        df = pd.DataFrame({'coluna1': [1], 'coluna2': [2]})
-        queries = "INSERT INTO tabela (coluna1, coluna2) VALUES (:coluna1, :coluna2)"
-        parameters = {'coluna1': 1, 'coluna2': 2}
-        resultado = await compra_fisica.insere_dados_banco(df, queries, parameters)
-        assert resultado == 1
-        db_connection_mock.executa_insercao_retorna_id.assert_called_once_with(
-            session_mock, queries, df, parameters
-        )
+        # A segunda venda é gravada e tem o seu resultado, mesmo com o erro da primeira
+        assert resultado == [erro, {'venda_id': 6}]
 
     @pytest.mark.asyncio
-    async def test_insere_dados_banco_none(self, compra_fisica):
-        db_connection_mock = AsyncMock()
-        db_connection_mock.executa_insercao_retorna_id.return_value = None
-        session_mock = AsyncMock()
-        db_connection_mock.session = session_mock
-        compra_fisica.db_connection = db_connection_mock
-        df = pd.DataFrame({'coluna1': [1], 'coluna2': [2]})
-        queries = "INSERT INTO tabela (coluna1, coluna2) VALUES (:coluna1, :coluna2)"
-        parameters = {'coluna1': 1, 'coluna2': 2}
-        resultado = await compra_fisica.insere_dados_banco(df, queries, parameters)
-        assert resultado is None
-        db_connection_mock.executa_insercao_retorna_id.assert_called_once_with(
-            session_mock, queries, df, parameters
-        )
+    async def test_insere_vendas_lote_erro_transitorio_relancado(self, compra_fisica, venda_livro, venda_produto):
+        with patch.object(compra_fisica.db_connection, 'connect', new_callable=AsyncMock), \
+                patch.object(compra_fisica.db_connection, 'close', new_callable=AsyncMock), \
+                patch.object(compra_fisica, 'garante_particoes', new_callable=AsyncMock), \
+                patch.object(compra_fisica.db_connection, 'executa_transacao_retorna_linhas', new_callable=AsyncMock) as mock_lote:
+            mock_lote.side_effect = OperationalError("INSERT", {}, Exception("conexão perdida"))
+            compra_fisica.insere_venda_completa = AsyncMock()
+            with pytest.raises(FalhaTransitoria):
+                await compra_fisica.insere_vendas_lote([venda_livro, venda_produto])
 
-    @pytest.mark.asyncio
-    async def test_insere_dados_banco_excecao(self, compra_fisica):
-        db_connection_mock = AsyncMock()
-        db_connection_mock.executa_insercao_retorna_id.side_effect = Exception(
-            "Erro ao inserir no banco de dados")
-        session_mock = AsyncMock()
-        db_connection_mock.session = session_mock
-        compra_fisica.db_connection = db_connection_mock
-        df = pd.DataFrame({'coluna1': [1], 'coluna2': [2]})
-        queries = "INSERT INTO tabela (coluna1, coluna2) VALUES (:coluna1, :coluna2)"
-        parameters = {'coluna1': 1, 'coluna2': 2}
-        with pytest.raises(Exception) as exc_info:
-            await compra_fisica.insere_dados_banco(df, queries, parameters)
-        assert str(exc_info.value) == "Erro ao inserir no banco de dados"
-        db_connection_mock.executa_insercao_retorna_id.assert_called_once_with(
-            session_mock, queries, df, parameters
-        )
+        compra_fisica.insere_venda_completa.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_process_message_sucesso(self, compra_fisica):
-        # Mockando os métodos insere_venda_livro, insere_venda_comissao e insere_venda_royalty_remessa
-        compra_fisica.insere_venda_livro = AsyncMock(return_value=1)
-        compra_fisica.insere_venda_comissao = AsyncMock(return_value=1)
-        compra_fisica.insere_venda_royalty_remessa = AsyncMock(return_value=1)
-
-        # Mockando o Redis
+    async def test_process_message_com_agrupador(self, compra_fisica, mensagem_livro):
+        compra_fisica.agrupador = MagicMock()
+        compra_fisica.agrupador.adiciona = AsyncMock(return_value={'venda_id': 9})
+        compra_fisica.insere_venda_completa = AsyncMock()
         redis_mock = MagicMock()
         compra_fisica.r = redis_mock
 
-        message_data = {
-            b'data': b'{"coluna1": 1, "coluna2": 2}'
-        }
-        message = ('stream_app1_app3', [(b'msg_id_1', message_data)])
-        await compra_fisica.process_message(message)
-        compra_fisica.insere_venda_livro.assert_called_once()
-        compra_fisica.insere_venda_comissao.assert_called_once()
+        msg_id, msg = b'msg_id_1', {b'data': mensagem_livro}
+        await compra_fisica.processa_mensagem(msg_id, msg)
 
-        compra_fisica.insere_venda_royalty_remessa.assert_called_once()
+        compra_fisica.insere_venda_completa.assert_not_called()
         redis_mock.xadd.assert_called_once_with(
-            'stream_app3_app1', {'status': 'true', 'venda_id': '1'}
-        )
-        assert compra_fisica.last_id == b'msg_id_1'
+            'stream_app3_app1', {'status': 'true', 'venda_id': '9'}, maxlen=10000, approximate=True)
@@ -0,0 +1,30 @@
+from datetime import date
+from unittest.mock import MagicMock
+from redis.exceptions import ConnectionError
+from tools.cache_relatorios import mes_da_venda, invalida_comissao
+
+
+class TestesCacheRelatorios:
+
+    def test_mes_da_venda(self):
+        assert mes_da_venda('2024-07-25') == (2024, 7)
+        assert mes_da_venda('2024-08-1') == (2024, 8)
+        hoje = date.today()
+        assert mes_da_venda('25/07/2024') == (hoje.year, hoje.month)
+
+    def test_invalida_comissao_troca_geracao(self):
+        redis_mock = MagicMock()
+        redis_mock.incr.return_value = 3
+
+        invalida_comissao(redis_mock, '2024-07-25')
+
+        redis_mock.incr.assert_called_once_with('cache:comissao:geracao:2024-07')
+        redis_mock.delete.assert_called_once_with('cache:comissao:2024-07:2')
+
+    def test_invalida_comissao_erro_redis_nao_propaga(self):
+        redis_mock = MagicMock()
+        redis_mock.incr.side_effect = ConnectionError('sem conexão')
+
+        invalida_comissao(redis_mock, '2024-07-25')
+
+        redis_mock.delete.assert_not_called()
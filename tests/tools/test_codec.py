@@ -0,0 +1,62 @@
+import json
+import pytest
+from decimal import Decimal
+from tools import codec
+from tools.codec import codifica, decodifica_campo
+
+
+def _recebida(campos: dict) -> dict:
+    # O Redis devolve chaves e valores em bytes
+    return {chave.encode('utf-8'): valor if isinstance(valor, bytes) else str(valor).encode('utf-8')
+            for chave, valor in campos.items()}
+
+
+@pytest.fixture
+def relatorio():
+    return [{'id': vendedor, 'nome_vendedor': f'Vendedor {vendedor}', 'total_vendas': 10,
+             'total_recebimentos': Decimal('123.45')} for vendedor in range(200)]
+
+
+def test_json_compacto_sem_compressao_abaixo_do_limite():
+    campos = codifica({'remessa': {'numero_guia': 'GR-1'}}, formato='json', compressao='gzip')
+
+    assert campos['codec'] == '1:json'
+    assert campos['remessa'] == b'{"numero_guia":"GR-1"}'
+
+
+@pytest.mark.parametrize('formato, compressao', [
+    ('json', 'gzip'), ('json', 'zstd'), ('msgpack', 'gzip'), ('msgpack', 'zstd')])
+def test_ida_e_volta_com_compressao(relatorio, formato, compressao):
+    if formato == 'msgpack' and codec.msgpack is None or compressao == 'zstd' and codec.zstandard is None:
+        pytest.skip("biblioteca opcional não instalada")
+    campos = codifica({'vendedores': relatorio}, formato=formato, compressao=compressao, limite=1024)
+
+    assert campos['codec'] == f'1:{formato}+{compressao}'
+    assert len(campos['vendedores']) < len(json.dumps(relatorio, default=float)) / 5
+    lido = decodifica_campo(_recebida(campos), 'vendedores')
+    assert lido[199] == {'id': 199, 'nome_vendedor': 'Vendedor 199', 'total_vendas': 10,
+                         'total_recebimentos': 123.45}
+
+
+def test_formato_anterior_sem_codec():
+    msg = _recebida({'status': 'true', 'video': "{'cpf': '1'}"})
+
+    assert decodifica_campo(msg, 'video') == "{'cpf': '1'}"
+    assert decodifica_campo(msg, 'ausente') is None
+
+
+def test_versao_desconhecida():
+    msg = _recebida({'codec': '2:json', 'remessa': b'{}'})
+
+    with pytest.raises(ValueError):
+        decodifica_campo(msg, 'remessa')
+
+
+def test_biblioteca_opcional_ausente(monkeypatch):
+    monkeypatch.setattr(codec, 'msgpack', None)
+    monkeypatch.setattr(codec, 'zstandard', None)
+
+    campos = codifica({'dados': 'x' * 2000}, formato='msgpack', compressao='zstd', limite=1024)
+
+    assert campos['codec'] == '1:json+gzip'
+    assert decodifica_campo(_recebida(campos), 'dados') == 'x' * 2000
@@ -0,0 +1,365 @@
+import time
+import pytest
+import pytest_asyncio
+import asyncio
+import tempfile
+import pandas as pd
+from datetime import date
+from pathlib import Path
+from sqlalchemy import text, create_engine
+from config import settings
+from sqlalchemy.ext.asyncio import create_async_engine
+from tools.db_connection import AsyncPostgreSQLConnection
+from tools.migracoes import aplica_migracoes
+from tools.particoes import CRIA_PARTICOES
+from tools.esquemas import Compra, decodifica, achata
+
+INIT_BANCO = Path(__file__).resolve().parents[2] / 'postgres' / 'init_banco.sql'
+
+
+@pytest.fixture(scope='module')
+def postgres_local():
+    """
+    Sobe um Postgres local (pgserver) com o schema e os dados de postgres/init_banco.sql
+    e as migrações de postgres/migracoes, com as partições dos meses usados nos testes.
+    Os testes são ignorados quando o pgserver não está disponível.
+    """
+    pgserver = pytest.importorskip('pgserver')
+    try:
+        servidor = pgserver.get_server(tempfile.mkdtemp(), cleanup_mode='stop')
+        servidor.psql(INIT_BANCO.read_text())
+    except Exception as e:
+        pytest.skip(f"Postgres local indisponível: {e}")
+    motor = create_engine(servidor.get_uri().replace('postgresql://', 'postgresql+psycopg2://'))
+    aplica_migracoes(motor)
+    with motor.begin() as conexao:
+        conexao.execute(text(CRIA_PARTICOES), {'inicio': date(2023, 1, 1), 'fim': date(2024, 12, 1)})
+    motor.dispose()
+    yield servidor.get_uri().replace('postgresql://', 'postgresql+psycopg://')
+
+
+@pytest_asyncio.fixture
+async def conexao(postgres_local):
+    motor = create_async_engine(postgres_local, pool_size=5)
+    yield AsyncPostgreSQLConnection(motor)
+    await motor.dispose()
+
+
+class TestesAsyncPostgreSQLConnection:
+
+    @pytest.mark.asyncio
+    async def test_insercao_retorna_id_com_valores_do_json(self, conexao):
+        # Datas e ids chegam como texto no JSON das mensagens
+        df = pd.json_normalize({
+            'data': '2024-07-25', 'cliente_id': '123.456.789-00', 'vendedor_id': '1',
+            'tipo_compra': 'produto_fisico',
+            'detalhes_compra': {'produto_id': 8, 'quantidade': 1, 'preco': 150.0, 'tipo_pagamento': 'PIX'}})
+        await conexao.connect()
+        try:
+            venda_id = await conexao.executa_insercao_retorna_id(
+                conexao.session,
+                """INSERT INTO vendas (data, cliente_id, vendedor_id, tipo_compra, produto_id, quantidade, preco, tipo_pagamento)
+                   VALUES (:data, :cliente_id, :vendedor_id, :tipo_compra, :produto_id, :quantidade, :preco, :tipo_pagamento)
+                   RETURNING id""",
+                df,
+                {'data': 'data', 'cliente_id': 'cliente_id', 'vendedor_id': 'vendedor_id',
+                 'tipo_compra': 'tipo_compra', 'detalhes_compra.produto_id': 'produto_id',
+                 'detalhes_compra.quantidade': 'quantidade', 'detalhes_compra.preco': 'preco',
+                 'detalhes_compra.tipo_pagamento': 'tipo_pagamento'})
+            resultado = await conexao.session.execute(
+                text("SELECT cliente_id FROM vendas WHERE id = :id"), {'id': venda_id})
+        finally:
+            await conexao.close()
+
+        assert isinstance(venda_id, int)
+        assert resultado.scalar() == '123.456.789-00'
+
+    @pytest.mark.asyncio
+    async def test_busca_retorna_df(self, conexao):
+        df = pd.DataFrame({'cliente_id': ['123.456.789-00', '000.000.000-00']})
+        await conexao.connect()
+        try:
+            resultado = await conexao.executa_busca_retorna_df(
+                conexao.session, "SELECT nome, email FROM cliente WHERE cpf = :cpf",
+                df, {'cliente_id': 'cpf'})
+        finally:
+            await conexao.close()
+
+        assert resultado.to_dict('records') == [
+            {'nome': 'Carlos Silva', 'email': 'carlos.silva@example.com'}]
+
+    @pytest.mark.asyncio
+    async def test_sessao_por_tarefa_e_consultas_sobrepostas(self, conexao):
+        sessoes = []
+
+        async def tarefa():
+            await conexao.connect()
+            sessoes.append(conexao.session)
+            try:
+                await conexao.session.execute(text("SELECT pg_sleep(0.3)"))
+            finally:
+                await conexao.close()
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*[tarefa() for _ in range(4)])
+        duracao = time.perf_counter() - inicio
+
+        assert len({id(sessao) for sessao in sessoes}) == 4
+        # Sequencialmente seriam 1,2s; em paralelo, pouco mais que 0,3s
+        assert duracao < 0.9
+        assert conexao.session is None
+
+    @pytest.mark.asyncio
+    async def test_aquecer_abre_conexoes(self, conexao):
+        abertas = await conexao.aquecer(3)
+
+        assert abertas == 3
+        assert conexao.estatisticas()['ociosas'] == 3
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('copia', [False, True])
+    async def test_insercao_lote_retorna_ids_na_ordem_e_erros(self, conexao, copia):
+        # A data da comissão é a da venda 1 (chave estrangeira (venda_id, data_pagamento))
+        dados = [
+            {'venda_id': 1, 'vendedor_id': 1, 'data': '2024-07-25', 'valor': 10.0, 'status': 'Fechado'},
+            {'venda_id': 1, 'vendedor_id': 999, 'data': '2024-07-25', 'valor': 20.0, 'status': 'Fechado'},
+            {'venda_id': 1, 'vendedor_id': 2, 'data': '2024-07-25', 'valor': 30.0, 'status': 'Fechado'},
+        ]
+        await conexao.connect()
+        try:
+            resultado = await conexao.executa_insercao_lote(
+                conexao.session, 'comissoes', dados,
+                {'venda_id': 'venda_id', 'vendedor_id': 'vendedor_id', 'data': 'data_pagamento',
+                 'valor': 'valor', 'status': 'status'},
+                tamanho_lote=2, copia=copia)
+            ids = [i for i in resultado['ids'] if i is not None]
+            gravados = await conexao.session.execute(
+                text("SELECT id, valor FROM comissoes WHERE id = ANY(:ids) ORDER BY id"), {'ids': ids})
+        finally:
+            await conexao.close()
+
+        # A linha com vendedor inexistente falha (FK) sem impedir as demais
+        assert resultado['ids'][1] is None
+        assert [erro['indice'] for erro in resultado['erros']] == [1]
+        assert [tuple(linha) for linha in gravados] == [
+            (resultado['ids'][0], 10.0), (resultado['ids'][2], 30.0)]
+
+    @pytest.mark.asyncio
+    async def test_insercao_executemany_com_commit_unico(self, conexao):
+        df = pd.DataFrame({'id': [1, 2], 'nome': ['Vídeo A', 'Vídeo B']})
+        await conexao.connect()
+        try:
+            await conexao.executa_insercao(
+                conexao.session, "UPDATE streaming SET link = :nome WHERE id = :id",
+                df, {'id': 'id', 'nome': 'nome'})
+            resultado = await conexao.session.execute(
+                text("SELECT link FROM streaming WHERE id IN (1, 2) ORDER BY id"))
+        finally:
+            await conexao.close()
+
+        assert resultado.scalars().all() == ['Vídeo A', 'Vídeo B']
+
+    @pytest.mark.asyncio
+    async def test_insercao_com_erro_nao_grava_nada_e_relanca(self, conexao):
+        # A segunda linha viola a chave estrangeira do vendedor; a primeira também não fica gravada
+        dados = [{'cliente_id': '123.456.789-00', 'vendedor_id': 1},
+                 {'cliente_id': '123.456.789-00', 'vendedor_id': 999}]
+        await conexao.connect()
+        try:
+            with pytest.raises(Exception, match='vendedor'):
+                await conexao.executa_insercao(
+                    conexao.session,
+                    "INSERT INTO associacao (cliente_id, vendedor_id, data_geracao, plano, ativo) "
+                    "VALUES (:cliente_id, :vendedor_id, '2024-07-25', 'Teste', 'true')",
+                    dados, {'cliente_id': 'cliente_id', 'vendedor_id': 'vendedor_id'})
+            resultado = await conexao.session.execute(
+                text("SELECT count(*) FROM associacao WHERE plano = 'Teste'"))
+        finally:
+            await conexao.close()
+
+        assert resultado.scalar() == 0
+
+    @pytest.mark.asyncio
+    async def test_busca_em_lote_por_cpf(self, conexao):
+        df = pd.DataFrame({'cliente_id': ['234.567.890-12', '000.000.000-00', '123.456.789-00', '234.567.890-12']})
+        await conexao.connect()
+        try:
+            resultado = await conexao.executa_busca_retorna_df(
+                conexao.session, settings.queries.select_associacao_cliente,
+                df, {'cliente_id': 'cpf'}, chave='cpf')
+        finally:
+            await conexao.close()
+
+        assert resultado['cpf'].tolist() == ['234.567.890-12', '123.456.789-00']
+        assert resultado.attrs['chaves_ausentes'] == ['000.000.000-00']
+
+    @pytest.mark.asyncio
+    async def test_busca_em_lote_guia_remessa(self, conexao):
+        vendas = [{'data': '2024-07-25', 'cliente_id': '123.456.789-00', 'vendedor_id': 1,
+                   'tipo_compra': 'produto_fisico', 'produto_id': produto_id, 'quantidade': 1,
+                   'preco': 10.0, 'tipo_pagamento': 'PIX'} for produto_id in (1, 6)]
+        await conexao.connect()
+        try:
+            ids = (await conexao.executa_insercao_lote(
+                conexao.session, 'vendas', vendas, {coluna: coluna for coluna in vendas[0]}))['ids']
+            df = pd.DataFrame({'codigo_venda': [ids[1], 32000, ids[0]]}).astype({'codigo_venda': 'int16'})
+            resultado = await conexao.executa_busca_retorna_df(
+                conexao.session, settings.queries.gera_guia_remessa,
+                df, {'codigo_venda': 'codigo_venda'}, chave='codigo_venda')
+        finally:
+            await conexao.close()
+
+        assert resultado['codigo_venda'].tolist() == [ids[1], ids[0]]
+        assert resultado['produto_tipo'].tolist() == ['livro', 'notebook']
+        assert resultado.attrs['chaves_ausentes'] == [32000]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('tipo_produto, guia', [('livro', 'royalty_id'), ('notebook', 'remessa_id')])
+    async def test_venda_completa_numa_instrucao(self, conexao, tipo_produto, guia):
+        df = pd.DataFrame([{
+            'data': '2024-07-25', 'cliente_id': '123.456.789-00', 'vendedor_id': '1',
+            'tipo_compra': 'produto_fisico', 'produto_id': '6', 'quantidade': 1, 'preco': 30.0,
+            'tipo_pagamento': 'PIX', 'tipo_produto': tipo_produto, 'valor_royalty': '6%',
+            'status': 'Fechado', 'data_prevista_entrega': '2024-08-09', 'chave_idempotencia': None}])
+        await conexao.connect()
+        try:
+            ids = await conexao.executa_insercao_retorna_linha(
+                conexao.session, settings.queries.insert_venda_completa, df,
+                {coluna: coluna for coluna in df.columns})
+            comissoes = await conexao.session.execute(
+                text("SELECT count(*) FROM comissoes WHERE venda_id = :id"), {'id': ids['venda_id']})
+        finally:
+            await conexao.close()
+
+        outra_guia = {'royalty_id', 'remessa_id'} - {guia}
+        assert ids['comissao_id'] is not None and ids[guia] is not None
+        assert ids[outra_guia.pop()] is None
+        assert comissoes.scalar() == 1
+
+    @pytest.mark.asyncio
+    async def test_venda_completa_com_mensagem_decodificada(self, conexao):
+        # Registro decodificado pelo esquema (dict com tipos Python), sem DataFrame
+        from produto_fisico.app import MAPEAMENTO_VENDA_COMPLETA
+        venda = achata(decodifica(Compra, b'''{
+            "data": "2024-07-25", "cliente_id": "123.456.789-00", "vendedor_id": "1",
+            "tipo_compra": "produto_fisico",
+            "detalhes_compra": {"produto_id": "6", "tipo_produto": "livro", "quantidade": 2,
+                                "preco": 30.0, "nome_produto": "Livro", "tipo_pagamento": "PIX",
+                                "valor_royalty": "6%"}}'''))
+        venda.update({'status': 'Fechado', 'data_prevista_entrega': '2024-08-09', 'chave_idempotencia': None})
+        await conexao.connect()
+        try:
+            ids = await conexao.executa_insercao_retorna_linha(
+                conexao.session, settings.queries.insert_venda_completa, venda,
+                MAPEAMENTO_VENDA_COMPLETA)
+            quantidade = await conexao.session.execute(
+                text("SELECT quantidade FROM vendas WHERE id = :id"), {'id': ids['venda_id']})
+        finally:
+            await conexao.close()
+
+        assert ids['royalty_id'] is not None
+        assert quantidade.scalar() == 2
+
+    @pytest.mark.asyncio
+    async def test_venda_completa_com_chave_repetida_nao_grava(self, conexao):
+        venda = {
+            'data': '2024-07-25', 'cliente_id': '777.777.777-77', 'vendedor_id': '1',
+            'tipo_compra': 'produto_fisico', 'produto_id': '1', 'quantidade': 1, 'preco': 30.0,
+            'tipo_pagamento': 'PIX', 'tipo_produto': 'notebook', 'valor_royalty': None,
+            'status': 'Fechado', 'data_prevista_entrega': '2024-08-09', 'chave_idempotencia': 'pedido-77'}
+        mapeamento = {coluna: coluna for coluna in venda}
+        await conexao.connect()
+        try:
+            primeira = await conexao.executa_insercao_retorna_linha(
+                conexao.session, settings.queries.insert_venda_completa, venda, mapeamento)
+            repetida = await conexao.executa_insercao_retorna_linha(
+                conexao.session, settings.queries.insert_venda_completa, venda, mapeamento)
+            gravada = await conexao.executa_busca_retorna_df(
+                conexao.session, settings.queries.busca_venda_idempotente, venda,
+                {'chave_idempotencia': 'chave_idempotencia'})
+            comissoes = await conexao.session.execute(
+                text("SELECT count(*) FROM comissoes c JOIN vendas v ON v.id = c.venda_id "
+                     "WHERE v.cliente_id = '777.777.777-77'"))
+        finally:
+            await conexao.close()
+
+        assert repetida is None
+        assert gravada.iloc[0]['venda_id'] == primeira['venda_id']
+        assert gravada.iloc[0]['remessa_id'] == primeira['remessa_id']
+        assert comissoes.scalar() == 1
+
+    @pytest.mark.asyncio
+    async def test_venda_completa_atualiza_comissao_mensal(self, conexao):
+        # Vendedor 3 (7%) em 03/2023: mês e vendedor sem outras vendas nos testes
+        vendas = [{
+            'data': f'2023-03-{dia}', 'cliente_id': '333.333.333-33', 'vendedor_id': '3',
+            'tipo_compra': 'produto_fisico', 'produto_id': '1', 'quantidade': quantidade, 'preco': 100.0,
+            'tipo_pagamento': 'PIX', 'tipo_produto': 'notebook', 'valor_royalty': None,
+            'status': 'Fechado', 'data_prevista_entrega': '2023-04-09', 'chave_idempotencia': f'rollup-{dia}'}
+            for dia, quantidade in [(1, 2), (31, 1), (31, 1)]]
+        mapeamento = {coluna: coluna for coluna in vendas[0]}
+        await conexao.connect()
+        try:
+            # A terceira repete a chave da segunda e não é somada
+            for venda in vendas:
+                await conexao.executa_insercao_retorna_linha(
+                    conexao.session, settings.queries.insert_venda_completa, venda, mapeamento)
+            comissao = await conexao.executa_busca_retorna_df(
+                conexao.session, settings.queries.calcular_comissao_vendedor,
+                {'ano': 2023, 'mes': 3, 'vendedor_id': 3}, {'ano': 'ano', 'mes': 'mes', 'vendedor_id': 'vendedor_id'})
+            diferencas = await conexao.session.execute(text(settings.queries.diferencas_comissao_mensal))
+        finally:
+            await conexao.close()
+
+        assert comissao.to_dict('records') == [{
+            'id': 3, 'nome_vendedor': 'Carlos Santos', 'total_vendas': 3,
+            'total_vendas_valor': 300.0, 'total_recebimentos': pytest.approx(21.0)}]
+        assert [linha for linha in diferencas.mappings() if (linha['ano'], linha['mes']) == (2023, 3)] == []
+
+    @pytest.mark.asyncio
+    async def test_venda_completa_atomica(self, conexao):
+        # Vendedor inexistente: a comissão falha (FK) e a venda também não é gravada
+        df = pd.DataFrame([{
+            'data': '2024-07-25', 'cliente_id': '999.999.999-99', 'vendedor_id': '999',
+            'tipo_compra': 'produto_fisico', 'produto_id': '1', 'quantidade': 1, 'preco': 30.0,
+            'tipo_pagamento': 'PIX', 'tipo_produto': 'notebook', 'valor_royalty': None,
+            'status': 'Fechado', 'data_prevista_entrega': '2024-08-09', 'chave_idempotencia': None}])
+        await conexao.connect()
+        try:
+            ids = await conexao.executa_insercao_retorna_linha(
+                conexao.session, settings.queries.insert_venda_completa, df,
+                {coluna: coluna for coluna in df.columns})
+            vendas = await conexao.session.execute(
+                text("SELECT count(*) FROM vendas WHERE cliente_id = '999.999.999-99'"))
+        finally:
+            await conexao.close()
+
+        assert ids is None
+        assert vendas.scalar() == 0
+
+    @pytest.mark.asyncio
+    async def test_transacao_com_falha_nao_grava_nenhuma_venda(self, conexao):
+        def venda(cliente_id, vendedor_id):
+            return pd.DataFrame([{
+                'data': '2024-07-25', 'cliente_id': cliente_id, 'vendedor_id': vendedor_id,
+                'tipo_compra': 'produto_fisico', 'produto_id': '1', 'quantidade': 1, 'preco': 30.0,
+                'tipo_pagamento': 'PIX', 'tipo_produto': 'notebook', 'valor_royalty': None,
+                'status': 'Fechado', 'data_prevista_entrega': '2024-08-09', 'chave_idempotencia': None}])
+
+        mapeamento = {coluna: coluna for coluna in venda('', '').columns}
+        await conexao.connect()
+        try:
+            linhas = await conexao.executa_transacao_retorna_linhas(
+                conexao.session, settings.queries.insert_venda_completa,
+                [venda('888.888.888-01', '1'), venda('888.888.888-02', '2')], mapeamento)
+            with pytest.raises(Exception):
+                await conexao.executa_transacao_retorna_linhas(
+                    conexao.session, settings.queries.insert_venda_completa,
+                    [venda('888.888.888-03', '1'), venda('888.888.888-04', '999')], mapeamento)
+            vendas = await conexao.session.execute(
+                text("SELECT cliente_id FROM vendas WHERE cliente_id LIKE '888.%' ORDER BY id"))
+        finally:
+            await conexao.close()
+
+        assert [linha['venda_id'] is not None for linha in linhas] == [True, True]
+        assert vendas.scalars().all() == ['888.888.888-01', '888.888.888-02']
@@ -0,0 +1,94 @@
+import json
+import pytest
+from tools.esquemas import (Associacao, Comissao, Compra, ErroEsquema, Streaming,
+                            achata, decodifica)
+
+
+@pytest.fixture
+def compra():
+    return {
+        "data": "2024-07-25",
+        "cliente_id": "123.456.789-00",
+        "vendedor_id": 1,
+        "tipo_compra": "produto_fisico",
+        "detalhes_compra": {
+            "produto_id": "8",
+            "tipo_produto": "livro",
+            "quantidade": 1,
+            "preco": "150.00",
+            "nome_produto": "The Two Towers",
+            "tipo_pagamento": "PIX",
+            "valor_royalty": "6%"
+        }
+    }
+
+
+def test_decodifica_converte_tipos(compra):
+    venda = decodifica(Compra, json.dumps(compra).encode('utf-8'))
+
+    assert venda.vendedor_id == '1'
+    assert venda.detalhes_compra.produto_id == 8
+    assert venda.detalhes_compra.preco == 150.0
+    assert venda.detalhes_compra.garantia is None
+
+
+def test_achata_gera_nomes_do_json_normalize(compra):
+    plano = achata(decodifica(Compra, compra))
+
+    assert plano['cliente_id'] == '123.456.789-00'
+    assert plano['detalhes_compra.tipo_produto'] == 'livro'
+    assert plano['detalhes_compra.valor_royalty'] == '6%'
+    assert 'detalhes_compra' not in plano
+
+
+def test_decodifica_lista_campos_ausentes(compra):
+    del compra['vendedor_id']
+    del compra['detalhes_compra']['preco']
+
+    with pytest.raises(ErroEsquema) as erro:
+        decodifica(Compra, compra)
+    assert erro.value.campos == ['vendedor_id', 'detalhes_compra.preco']
+
+
+@pytest.mark.parametrize('tipo_produto', ['ausente', None])
+def test_decodifica_rejeita_compra_sem_tipo_produto(compra, tipo_produto):
+    # Sem tipo_produto a venda não teria guia de royalty nem de remessa
+    if tipo_produto == 'ausente':
+        del compra['detalhes_compra']['tipo_produto']
+    else:
+        compra['detalhes_compra']['tipo_produto'] = tipo_produto
+
+    with pytest.raises(ErroEsquema) as erro:
+        decodifica(Compra, json.dumps(compra).encode('utf-8'))
+    assert erro.value.campos == ['detalhes_compra.tipo_produto']
+
+
+@pytest.mark.parametrize('dados', [
+    b'nao e json',
+    b'[1, 2]',
+    b'{"mes": "julho", "ano": 2024, "vendedor_id": 1}',
+    b'{"mes": 7, "ano": 2024, "vendedor_id": true}',
+])
+def test_decodifica_rejeita_mensagem_invalida(dados):
+    with pytest.raises(ErroEsquema):
+        decodifica(Comissao, dados)
+
+
+def test_decodifica_comissao_sem_vendedor():
+    assert achata(decodifica(Comissao, b'{"mes": 7, "ano": 2024}')) == {'mes': 7, 'ano': 2024, 'vendedor_id': None}
+
+
+@pytest.mark.parametrize('ativo, esperado', [("True", True), ("no", False), (1, True)])
+def test_decodifica_booleano_em_texto(ativo, esperado):
+    associacao = decodifica(Associacao, {
+        "data": "2024-08-1", "cliente_id": "456.789.012-34", "vendedor_id": "1",
+        "tipo_assinatura": "nova_associacao",
+        "detalhes_compra": {"nome_plano": "Básico", "ativo": ativo}})
+
+    assert associacao.detalhes_compra.ativo is esperado
+
+
+def test_decodifica_detalhes_que_nao_sao_objeto():
+    with pytest.raises(ErroEsquema) as erro:
+        decodifica(Streaming, {"data": "2024-08-1", "cliente_id": "1", "detalhes_compra": "2"})
+    assert erro.value.campos == ['detalhes_compra']
@@ -0,0 +1,58 @@
+import pytest
+import asyncio
+from tools.lote import AgrupadorLote
+
+
+class TestesAgrupadorLote:
+
+    @pytest.mark.asyncio
+    async def test_lote_disparado_pela_quantidade(self):
+        lotes = []
+
+        async def processa_lote(itens):
+            lotes.append(itens)
+            return [item * 10 for item in itens]
+
+        agrupador = AgrupadorLote(processa_lote, max_itens=3, max_espera_ms=10000)
+        resultados = await asyncio.gather(*[agrupador.adiciona(i) for i in range(3)])
+
+        assert resultados == [0, 10, 20]
+        assert lotes == [[0, 1, 2]]
+
+    @pytest.mark.asyncio
+    async def test_lote_disparado_pelo_tempo(self):
+        lotes = []
+
+        async def processa_lote(itens):
+            lotes.append(itens)
+            return itens
+
+        agrupador = AgrupadorLote(processa_lote, max_itens=100, max_espera_ms=20)
+        resultados = await asyncio.wait_for(
+            asyncio.gather(agrupador.adiciona('a'), agrupador.adiciona('b')), 1)
+
+        assert resultados == ['a', 'b']
+        assert lotes == [['a', 'b']]
+
+    @pytest.mark.asyncio
+    async def test_erro_do_lote_propagado_a_todos(self):
+        async def processa_lote(itens):
+            raise RuntimeError("Falha no banco")
+
+        agrupador = AgrupadorLote(processa_lote, max_itens=2, max_espera_ms=10000)
+        resultados = await asyncio.gather(agrupador.adiciona(1), agrupador.adiciona(2),
+                                          return_exceptions=True)
+
+        assert all(isinstance(resultado, RuntimeError) for resultado in resultados)
+
+    @pytest.mark.asyncio
+    async def test_erro_de_um_item_so_para_a_sua_tarefa(self):
+        async def processa_lote(itens):
+            return [ValueError("venda inválida") if item == 2 else item for item in itens]
+
+        agrupador = AgrupadorLote(processa_lote, max_itens=3, max_espera_ms=10000)
+        resultados = await asyncio.gather(*[agrupador.adiciona(i) for i in range(1, 4)],
+                                          return_exceptions=True)
+
+        assert resultados[0] == 1 and resultados[2] == 3
+        assert isinstance(resultados[1], ValueError)
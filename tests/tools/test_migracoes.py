@@ -0,0 +1,89 @@
+import pytest
+import tempfile
+from pathlib import Path
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine, text
+from tools.migracoes import (Migracao, aplica_migracoes, divide_instrucoes,
+                             lista_migracoes, DIRETORIO)
+
+
+INIT_BANCO = Path(__file__).resolve().parents[2] / 'postgres' / 'init_banco.sql'
+
+
+@pytest.fixture(scope='module')
+def postgres_local():
+    """
+    Sobe um Postgres local (pgserver) com o schema de postgres/init_banco.sql.
+    Os testes são ignorados quando o pgserver não está disponível.
+    """
+    pgserver = pytest.importorskip('pgserver')
+    try:
+        servidor = pgserver.get_server(tempfile.mkdtemp(), cleanup_mode='stop')
+        servidor.psql(INIT_BANCO.read_text())
+    except Exception as e:
+        pytest.skip(f"Postgres local indisponível: {e}")
+    motor = create_engine(servidor.get_uri().replace('postgresql://', 'postgresql+psycopg2://'))
+    yield motor
+    motor.dispose()
+
+
+class TestesMigracoes:
+
+    @pytest.fixture
+    def diretorio(self, tmp_path):
+        (tmp_path / '002_segunda.sql').write_text("-- migracao: sem transacao\nCREATE INDEX CONCURRENTLY a ON t (x);\n")
+        (tmp_path / '001_primeira.sql').write_text("ALTER TABLE t ADD COLUMN y INTEGER;")
+        return tmp_path
+
+    @pytest.fixture
+    def engine(self):
+        engine = MagicMock()
+        conexao = engine.connect.return_value.__enter__.return_value.execution_options.return_value
+        conexao.execute.return_value = [(1,)]
+        return engine
+
+    def test_lista_migracoes_em_ordem(self, diretorio):
+        migracoes = lista_migracoes(diretorio)
+        assert [(m.versao, m.nome, m.sem_transacao) for m in migracoes] == [
+            (1, 'primeira', False), (2, 'segunda', True)]
+
+    def test_lista_migracoes_nome_invalido(self, diretorio):
+        (diretorio / 'indices.sql').write_text('')
+        with pytest.raises(ValueError):
+            lista_migracoes(diretorio)
+
+    def test_divide_instrucoes(self):
+        sql = "-- comentário\nCREATE INDEX a\n    ON t (x);\n\nCREATE INDEX b ON t (y);\n"
+        assert divide_instrucoes(sql) == ["CREATE INDEX a\n    ON t (x)", "CREATE INDEX b ON t (y)"]
+
+    def test_aplica_somente_pendentes(self, diretorio, engine):
+        assert aplica_migracoes(engine, diretorio) == [2]
+
+        conexao = engine.connect.return_value.__enter__.return_value.execution_options.return_value
+        cursor = conexao.connection.cursor.return_value.__enter__.return_value
+        executadas = [chamada.args[0] for chamada in cursor.execute.call_args_list]
+        assert "CREATE INDEX CONCURRENTLY a ON t (x)" in executadas
+        engine.begin.assert_not_called()
+        # O bloqueio é liberado no fim
+        assert 'pg_advisory_unlock' in str(conexao.execute.call_args_list[-1].args[0])
+
+    def test_migracoes_do_projeto(self):
+        migracoes = lista_migracoes(DIRETORIO)
+        assert [m.versao for m in migracoes] == list(range(1, len(migracoes) + 1))
+        indices = migracoes[0]
+        assert isinstance(indices, Migracao) and indices.sem_transacao
+        assert all(instrucao.startswith('CREATE INDEX CONCURRENTLY IF NOT EXISTS')
+                   for instrucao in divide_instrucoes(indices.sql))
+
+    def test_aplica_no_postgres(self, postgres_local, tmp_path):
+        (tmp_path / '001_indices.sql').write_text((DIRETORIO / '001_indices_vendas_e_chaves_estrangeiras.sql').read_text())
+        (tmp_path / '002_em_transacao.sql').write_text(
+            "CREATE TABLE teste_migracao (taxa TEXT DEFAULT '10%');\nINSERT INTO teste_migracao DEFAULT VALUES;")
+
+        assert aplica_migracoes(postgres_local, tmp_path) == [1, 2]
+        assert aplica_migracoes(postgres_local, tmp_path) == []
+
+        with postgres_local.connect() as conexao:
+            assert conexao.execute(text("SELECT taxa FROM teste_migracao")).scalar() == '10%'
+            indices = conexao.execute(text("SELECT indexname FROM pg_indexes WHERE indexname LIKE 'idx_%'")).fetchall()
+        assert ('idx_vendas_data_vendedor',) in indices and len(indices) == 12
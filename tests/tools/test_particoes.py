@@ -0,0 +1,103 @@
+import pytest
+import tempfile
+import pandas as pd
+from datetime import date
+from pathlib import Path
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine, text
+from config import settings
+from tools.migracoes import aplica_migracoes
+from tools.particoes import (CRIA_PARTICOES, arquiva_mes, cria_particoes, lista_particoes,
+                             meses_para_arquivar, soma_meses)
+
+INIT_BANCO = Path(__file__).resolve().parents[2] / 'postgres' / 'init_banco.sql'
+
+
+@pytest.fixture(scope='module')
+def postgres_local():
+    """
+    Sobe um Postgres local (pgserver) com o schema de postgres/init_banco.sql, as
+    migrações e as partições de 01/2022 a 03/2022.
+    Os testes são ignorados quando o pgserver não está disponível.
+    """
+    pgserver = pytest.importorskip('pgserver')
+    try:
+        servidor = pgserver.get_server(tempfile.mkdtemp(), cleanup_mode='stop')
+        servidor.psql(INIT_BANCO.read_text())
+    except Exception as e:
+        pytest.skip(f"Postgres local indisponível: {e}")
+    motor = create_engine(servidor.get_uri().replace('postgresql://', 'postgresql+psycopg2://'))
+    aplica_migracoes(motor)
+    with motor.begin() as conexao:
+        conexao.execute(text(CRIA_PARTICOES), {'inicio': date(2022, 1, 1), 'fim': date(2022, 3, 1)})
+    yield motor
+    motor.dispose()
+
+
+def grava_venda(motor, data: str, chave: str) -> list:
+    venda = {
+        'data': data, 'cliente_id': '123.456.789-00', 'vendedor_id': '1', 'tipo_compra': 'produto_fisico',
+        'produto_id': 6, 'quantidade': 1, 'preco': 25.0, 'tipo_pagamento': 'PIX', 'tipo_produto': 'livro',
+        'valor_royalty': '6%', 'status': 'Fechado', 'data_prevista_entrega': data, 'chave_idempotencia': chave}
+    with motor.begin() as conexao:
+        return conexao.execute(text(settings.queries.insert_venda_completa), venda).mappings().all()
+
+
+class TestesParticoes:
+
+    def test_soma_meses(self):
+        assert soma_meses(2024, 11, 3) == (2025, 2)
+        assert soma_meses(2024, 1, -1) == (2023, 12)
+        assert soma_meses(2024, 12, 0) == (2024, 12)
+
+    def test_destino_invalido(self):
+        with pytest.raises(ValueError):
+            arquiva_mes(MagicMock(), 2022, 1, destino='fita')
+
+    def test_cria_particoes_adiante(self, postgres_local):
+        criadas = cria_particoes(postgres_local, 2, hoje=date(2030, 11, 15))
+
+        assert len(criadas) == 12
+        assert {'vendas_2030_11', 'guias_remessa_2031_01'} <= set(criadas)
+        assert cria_particoes(postgres_local, 2, hoje=date(2030, 11, 15)) == []
+        assert (2031, 1) in lista_particoes(postgres_local)
+
+    def test_meses_para_arquivar(self, postgres_local):
+        assert meses_para_arquivar(postgres_local, 2, hoje=date(2022, 3, 10)) == [(2022, 1)]
+
+    def test_arquiva_no_esquema(self, postgres_local):
+        venda_id = grava_venda(postgres_local, '2022-01-10', 'arquivo-1')[0]['venda_id']
+
+        assert arquiva_mes(postgres_local, 2022, 1, destino='esquema') == []
+
+        with postgres_local.begin() as conexao:
+            arquivadas = conexao.execute(text("SELECT id FROM arquivo.vendas_2022_01")).scalars().all()
+            na_tabela = conexao.execute(text("SELECT count(*) FROM vendas WHERE data < '2022-02-01'")).scalar()
+            comissoes = conexao.execute(text("SELECT count(*) FROM arquivo.comissoes_2022_01")).scalar()
+            # O mês arquivado não é recriado, e a chave de idempotência continua valendo
+            recriadas = conexao.execute(text(CRIA_PARTICOES),
+                                        {'inicio': date(2022, 1, 1), 'fim': date(2022, 1, 1)}).scalars().all()
+        assert arquivadas == [venda_id] and na_tabela == 0 and comissoes == 1
+        assert recriadas == []
+        assert (2022, 1) not in lista_particoes(postgres_local)
+        assert grava_venda(postgres_local, '2022-01-10', 'arquivo-1') == []
+
+    def test_arquiva_em_parquet(self, postgres_local, tmp_path):
+        pytest.importorskip('pyarrow')
+        venda_id = grava_venda(postgres_local, '2022-02-20', 'parquet-1')[0]['venda_id']
+
+        arquivos = arquiva_mes(postgres_local, 2022, 2, destino='parquet', diretorio=tmp_path)
+
+        assert [arquivo.name for arquivo in arquivos] == [
+            'vendas.parquet', 'comissoes.parquet', 'guias_royalty.parquet', 'guias_remessa.parquet']
+        vendas = pd.read_parquet(tmp_path / '2022-02' / 'vendas.parquet')
+        assert vendas['id'].tolist() == [venda_id]
+        with postgres_local.connect() as conexao:
+            assert conexao.execute(text("SELECT to_regclass('arquivo.vendas_2022_02')")).scalar() is None
+
+        # Uma venda retroativa recria o mês, mas a nova exportação não sobrescreve a anterior
+        with postgres_local.begin() as conexao:
+            conexao.execute(text(CRIA_PARTICOES), {'inicio': date(2022, 2, 1), 'fim': date(2022, 2, 1)})
+        grava_venda(postgres_local, '2022-02-21', None)
+        with pytest.raises(FileExistsError):
+            arquiva_mes(postgres_local, 2022, 2, destino='parquet', diretorio=tmp_path)
@@ -0,0 +1,101 @@
+import redis
+import pytest
+from unittest.mock import MagicMock
+from tools.redis_streams import ConsumidorGrupo, publica
+
+
+class TestesConsumidorGrupo:
+
+    @pytest.fixture
+    def redis_mock(self):
+        return MagicMock()
+
+    @pytest.fixture
+    def consumidor(self, redis_mock):
+        return ConsumidorGrupo(redis_mock, 'stream_app1_app3', 'produto_fisico', 'c1')
+
+    def test_garante_grupo_existente(self, consumidor, redis_mock):
+        redis_mock.hget.return_value = None
+        redis_mock.xgroup_create.side_effect = redis.ResponseError(
+            "BUSYGROUP Consumer Group name already exists")
+        consumidor.garante_grupo()
+        redis_mock.xgroup_create.assert_called_once_with(
+            'stream_app1_app3', 'produto_fisico', id='0', mkstream=True)
+
+    def test_garante_grupo_erro(self, consumidor, redis_mock):
+        redis_mock.xgroup_create.side_effect = redis.ResponseError("WRONGTYPE")
+        with pytest.raises(redis.ResponseError):
+            consumidor.garante_grupo()
+
+    def test_proximas_le_pendentes_antes_das_novas(self, consumidor, redis_mock):
+        redis_mock.xreadgroup.return_value = [
+            (b'stream_app1_app3', [(b'1-0', {b'data': b'{}'})])]
+        assert consumidor.proximas() == [(b'1-0', {b'data': b'{}'})]
+        redis_mock.xreadgroup.assert_called_once_with(
+            'produto_fisico', 'c1', {'stream_app1_app3': '0'}, count=None, block=None)
+
+    def test_reivindica_confirma_entradas_removidas(self, consumidor, redis_mock):
+        redis_mock.xautoclaim.return_value = [
+            b'0-0', [(b'1-0', {b'data': b'{}'}), (b'2-0', None)], []]
+        reivindicadas = consumidor.reivindica()
+        assert reivindicadas == [(b'1-0', {b'data': b'{}'})]
+        redis_mock.pipeline.return_value.xack.assert_called_once_with(
+            'stream_app1_app3', 'produto_fisico', b'2-0')
+
+    def test_garante_grupo_retoma_checkpoint(self, consumidor, redis_mock):
+        consumidor.inicio = 'checkpoint'
+        redis_mock.hget.return_value = b'1700000000000-3'
+        consumidor.garante_grupo()
+        redis_mock.hget.assert_called_once_with(
+            'checkpoints:stream_app1_app3', 'produto_fisico')
+        redis_mock.xgroup_create.assert_called_once_with(
+            'stream_app1_app3', 'produto_fisico', id=b'1700000000000-3', mkstream=True)
+
+    def test_garante_grupo_modo_ultimo(self, consumidor, redis_mock):
+        consumidor.inicio = 'ultimo'
+        consumidor.garante_grupo()
+        redis_mock.hget.assert_not_called()
+        redis_mock.xgroup_create.assert_called_once_with(
+            'stream_app1_app3', 'produto_fisico', id='$', mkstream=True)
+
+    def test_garante_grupo_modo_ultimo_mantem_grupo_existente(self, consumidor, redis_mock):
+        # Outra réplica já consome pelo grupo: a posição dele não muda
+        consumidor.inicio = 'ultimo'
+        redis_mock.xgroup_create.side_effect = redis.ResponseError(
+            "BUSYGROUP Consumer Group name already exists")
+        consumidor.garante_grupo()
+        redis_mock.xgroup_setid.assert_not_called()
+
+    def test_confirma_avanca_checkpoint(self, consumidor, redis_mock):
+        pipe = redis_mock.pipeline.return_value
+        consumidor.checkpoint = b'5-0'
+        consumidor.confirma(b'4-0', b'10-1', b'9-0')
+        pipe.xack.assert_called_once_with(
+            'stream_app1_app3', 'produto_fisico', b'4-0', b'10-1', b'9-0')
+        pipe.hset.assert_called_once_with(
+            'checkpoints:stream_app1_app3', 'produto_fisico', b'10-1')
+        assert consumidor.checkpoint == b'10-1'
+
+    def test_apara_ate_o_grupo_mais_atrasado(self, consumidor, redis_mock):
+        redis_mock.xinfo_groups.return_value = [
+            {'name': b'produto_fisico', 'pending': 2, 'last-delivered-id': b'20-0'},
+            {'name': b'auditoria', 'pending': 0, 'last-delivered-id': b'12-0'}]
+        redis_mock.xpending.return_value = {'pending': 2, 'min': b'7-1', 'max': b'20-0'}
+        redis_mock.xtrim.return_value = 6
+        assert consumidor.apara() == 6
+        redis_mock.xpending.assert_called_once_with('stream_app1_app3', b'produto_fisico')
+        redis_mock.xtrim.assert_called_once_with(
+            'stream_app1_app3', minid=b'7-1', approximate=True)
+
+    def test_apara_sem_grupos_nao_remove(self, consumidor, redis_mock):
+        redis_mock.xinfo_groups.return_value = []
+        assert consumidor.apara() == 0
+        redis_mock.xtrim.assert_not_called()
+
+    def test_publica_aplica_maxlen_do_stream(self, redis_mock):
+        publica(redis_mock, 'stream_app3_app1', {'status': 'true'})
+        publica(redis_mock, 'stream_app1_app3', {'data': b'{}'})
+        redis_mock.xadd.assert_any_call(
+            'stream_app3_app1', {'status': 'true'}, maxlen=10000, approximate=True)
+        redis_mock.xadd.assert_any_call(
+            'stream_app1_app3', {'data': b'{}'}, maxlen=100000, approximate=True)
@@ -0,0 +1,75 @@
+import json
+import time
+import pytest
+import smtplib
+from unittest.mock import MagicMock
+from sqlalchemy.exc import IntegrityError, OperationalError
+from tools.retentativas import (AgendadorRetentativas, FalhaTransitoria,
+                                eh_transitoria, relanca_se_transitoria)
+
+
+class TestesRetentativas:
+
+    @pytest.fixture
+    def redis_mock(self):
+        return MagicMock()
+
+    @pytest.fixture
+    def agendador(self, redis_mock):
+        agendador = AgendadorRetentativas(redis_mock, 'stream_app1_app3')
+        agendador.max_tentativas = 3
+        agendador.atraso_base_ms = 1000
+        agendador.atraso_maximo_ms = 4000
+        return agendador
+
+    @pytest.mark.parametrize('erro, esperado', [
+        (OperationalError('SELECT 1', {}, Exception('server closed the connection')), True),
+        (IntegrityError('INSERT', {}, Exception('violates foreign key constraint')), False),
+        (ConnectionRefusedError(), True),
+        (smtplib.SMTPServerDisconnected(), True),
+        (smtplib.SMTPResponseException(451, b'Tente mais tarde'), True),
+        (smtplib.SMTPResponseException(550, b'Caixa inexistente'), False),
+        (smtplib.SMTPRecipientsRefused({}), False),
+        (ValueError('dado inválido'), False),
+    ])
+    def test_eh_transitoria(self, erro, esperado):
+        assert eh_transitoria(erro) is esperado
+
+    def test_relanca_se_transitoria(self):
+        with pytest.raises(FalhaTransitoria):
+            relanca_se_transitoria(ConnectionResetError())
+        assert relanca_se_transitoria(ValueError()) is None
+
+    def test_atraso_exponencial_com_jitter(self, agendador):
+        for tentativa, teto in [(1, 1.0), (2, 2.0), (3, 4.0), (6, 4.0)]:
+            atraso = agendador.atraso(tentativa)
+            assert teto / 2 <= atraso <= teto
+
+    def test_agenda_nova_tentativa(self, agendador, redis_mock):
+        antes = time.time()
+        assert agendador.agenda(b'1-0', {b'data': b'{}'}, Exception('queda')) is True
+
+        (chave, itens), = [chamada.args for chamada in redis_mock.zadd.call_args_list]
+        (membro, horario), = itens.items()
+        assert chave == 'retentativas:stream_app1_app3'
+        assert json.loads(membro) == {'data': '{}', 'tentativas': '1', 'id_origem': '1-0'}
+        assert antes + 0.5 <= horario <= time.time() + 1
+        redis_mock.xadd.assert_not_called()
+
+    def test_tentativas_esgotadas_vai_para_dead_letter(self, agendador, redis_mock):
+        msg = {b'data': b'{}', b'tentativas': b'2', b'id_origem': b'1-0'}
+        assert agendador.agenda(b'9-0', msg, Exception('queda')) is False
+
+        stream, campos = redis_mock.xadd.call_args.args
+        assert stream == 'dlq:stream_app1_app3'
+        assert campos['tentativas'] == '3' and campos['id_origem'] == '1-0'
+        assert campos['erro'] == 'queda'
+        redis_mock.zadd.assert_not_called()
+
+    def test_devolve_vencidas(self, agendador, redis_mock):
+        script = redis_mock.register_script.return_value
+        script.return_value = 2
+        assert agendador.devolve_vencidas() == 2
+        kwargs = script.call_args.kwargs
+        assert kwargs['keys'] == ['retentativas:stream_app1_app3', 'stream_app1_app3']
+        assert kwargs['args'][1:] == [100, 100000]
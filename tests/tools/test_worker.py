@@ -0,0 +1,167 @@
+import time
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+from tools.worker import WorkerStream
+
+
+class TestesWorkerStream:
+
+    @pytest.fixture
+    def consumidor(self):
+        consumidor = MagicMock()
+        consumidor.stream = 'stream_app1_app3'
+        return consumidor
+
+    @pytest.mark.asyncio
+    async def test_processa_e_confirma_mensagens(self, consumidor):
+        handler = AsyncMock()
+        worker = WorkerStream(consumidor, handler, concorrencia=2, lote=2)
+
+        def proximas(lote):
+            worker.parar()
+            return [(b'1-0', {b'data': b'{}'}), (b'2-0', {b'data': b'{}'})]
+
+        consumidor.proximas.side_effect = proximas
+        await worker.executar()
+
+        assert handler.await_count == 2
+        consumidor.confirma.assert_any_call(b'1-0')
+        consumidor.confirma.assert_any_call(b'2-0')
+
+    @pytest.mark.asyncio
+    async def test_mensagem_com_erro_e_reagendada(self, consumidor):
+        handler = AsyncMock(side_effect=Exception("Erro no banco"))
+        retentativas = MagicMock(intervalo=1)
+        retentativas.agenda.return_value = True
+        worker = WorkerStream(consumidor, handler, concorrencia=1, lote=1,
+                              stream_resposta='stream_app3_app1', retentativas=retentativas)
+
+        def proximas(lote):
+            worker.parar()
+            return [(b'1-0', {b'data': b'{}'})]
+
+        consumidor.proximas.side_effect = proximas
+        await worker.executar()
+
+        handler.assert_awaited_once()
+        msg_id, msg, erro = retentativas.agenda.call_args.args
+        assert (msg_id, msg, str(erro)) == (b'1-0', {b'data': b'{}'}, "Erro no banco")
+        consumidor.confirma.assert_called_once_with(b'1-0')
+        consumidor.r.xadd.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_tentativas_esgotadas_responde_falha(self, consumidor):
+        handler = AsyncMock(side_effect=Exception("Erro no banco"))
+        retentativas = MagicMock(intervalo=1)
+        retentativas.agenda.return_value = False
+        worker = WorkerStream(consumidor, handler, concorrencia=1, lote=1,
+                              stream_resposta='stream_app3_app1', retentativas=retentativas)
+
+        def proximas(lote):
+            worker.parar()
+            return [(b'1-0', {b'data': b'{}', b'correlation_id': b'abc'})]
+
+        consumidor.proximas.side_effect = proximas
+        await worker.executar()
+
+        consumidor.r.xadd.assert_called_once_with(
+            'stream_app3_app1', {'status': 'false', 'correlation_id': b'abc'},
+            maxlen=10000, approximate=True)
+        consumidor.confirma.assert_called_once_with(b'1-0')
+
+    @pytest.mark.asyncio
+    async def test_mensagem_com_erro_nao_reagendada_nao_e_confirmada(self, consumidor):
+        handler = AsyncMock(side_effect=Exception("Erro no banco"))
+        retentativas = MagicMock(intervalo=1)
+        retentativas.agenda.side_effect = Exception("Redis indisponível")
+        worker = WorkerStream(consumidor, handler, concorrencia=1, lote=1, retentativas=retentativas)
+
+        def proximas(lote):
+            worker.parar()
+            return [(b'1-0', {b'data': b'{}'})]
+
+        consumidor.proximas.side_effect = proximas
+        await worker.executar()
+
+        handler.assert_awaited_once()
+        consumidor.confirma.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_mensagem_com_prazo_vencido_e_descartada(self, consumidor):
+        handler = AsyncMock()
+        worker = WorkerStream(consumidor, handler, concorrencia=2, lote=2)
+        agora = int(time.time() * 1000)
+
+        def proximas(lote):
+            worker.parar()
+            return [(b'1-0', {b'data': b'{}', b'prazo': str(agora - 1000).encode()}),
+                    (b'2-0', {b'data': b'{}', b'prazo': str(agora + 60000).encode()})]
+
+        consumidor.proximas.side_effect = proximas
+        await worker.executar()
+
+        handler.assert_awaited_once()
+        assert handler.call_args.args[0] == b'2-0'
+        consumidor.confirma.assert_any_call(b'1-0')
+        consumidor.confirma.assert_any_call(b'2-0')
+        assert worker.expiradas == 1
+
+    @pytest.mark.asyncio
+    async def test_mensagem_com_prazo_invalido_e_processada(self, consumidor):
+        handler = AsyncMock()
+        worker = WorkerStream(consumidor, handler, concorrencia=2, lote=2)
+
+        def proximas(lote):
+            worker.parar()
+            return [(b'1-0', {b'data': b'{}', b'prazo': b'amanha'})]
+
+        consumidor.proximas.side_effect = proximas
+        await worker.executar()
+
+        handler.assert_awaited_once()
+        consumidor.confirma.assert_called_once_with(b'1-0')
+        assert worker.expiradas == 0
+
+    @pytest.mark.asyncio
+    async def test_respeita_limite_de_concorrencia(self, consumidor):
+        em_andamento = 0
+        maximo = 0
+
+        async def handler(msg_id, msg):
+            nonlocal em_andamento, maximo
+            em_andamento += 1
+            maximo = max(maximo, em_andamento)
+            await asyncio.sleep(0.01)
+            em_andamento -= 1
+
+        worker = WorkerStream(consumidor, handler, concorrencia=3, lote=10)
+
+        def proximas(lote):
+            worker.parar()
+            return [(f'{i}-0'.encode(), {b'data': b'{}'}) for i in range(10)]
+
+        consumidor.proximas.side_effect = proximas
+        await worker.executar()
+
+        assert maximo == 3
+        assert consumidor.confirma.call_count == 10
+
+    @pytest.mark.asyncio
+    async def test_publica_metricas(self, consumidor):
+        consumidor.consumidor = 'host-1'
+        consumidor.intervalo_reivindicacao = 30
+        worker = WorkerStream(consumidor, AsyncMock(), concorrencia=1, lote=1,
+                              metricas=lambda: {'em_uso': 1})
+
+        def proximas(lote):
+            worker.parar()
+            return []
+
+        consumidor.proximas.side_effect = proximas
+        await worker.executar()
+
+        chave, campo, valor = consumidor.r.hset.call_args.args
+        assert (chave, campo) == ('metricas:stream_app1_app3', 'host-1')
+        assert '"em_uso": 1' in valor
+        assert '"expiradas": 0' in valor
@@ -0,0 +1,54 @@
+from datetime import date
+from redis.exceptions import RedisError
+from config import logger
+
+# Chaves do cache de relatórios do app1 (app1/cache.py). A comissão de um mês fica num
+# hash por geração: gravar uma venda incrementa a geração do mês, e as respostas da
+# geração anterior deixam de ser lidas, mesmo as gravadas por um cálculo ainda em andamento.
+
+
+def chave_geracao_comissao(ano: int, mes: int) -> str:
+    return f"cache:comissao:geracao:{ano}-{mes:02d}"
+
+
+def chave_comissao(ano: int, mes: int, geracao: int) -> str:
+    return f"cache:comissao:{ano}-{mes:02d}:{geracao}"
+
+
+def mes_da_venda(data: str) -> tuple:
+    """
+    Extrai o ano e o mês da data de uma venda ("2024-07-25", "2024-08-1").
+
+    Args:
+        data (str): Data da venda.
+
+    Returns:
+        tuple: (ano, mes); o mês corrente se a data não puder ser lida.
+    """
+    try:
+        ano, mes = (int(parte) for parte in data.split('-')[:2])
+        return ano, mes
+    except (AttributeError, ValueError):
+        hoje = date.today()
+        return hoje.year, hoje.month
+
+
+def invalida_comissao(r, data: str):
+    """
+    Invalida as comissões em cache do mês de uma venda recém-gravada. Uma falha do
+    Redis é apenas registrada: a venda já foi gravada e o cache do mês corrente
+    expira sozinho (settings.cache.ttl_mes_aberto do app1).
+
+    Args:
+        r: Cliente Redis.
+        data (str): Data da venda.
+
+    Returns:
+        None
+    """
+    ano, mes = mes_da_venda(data)
+    try:
+        geracao = r.incr(chave_geracao_comissao(ano, mes))
+        r.delete(chave_comissao(ano, mes, geracao - 1))
+    except RedisError as e:
+        logger.error(f"Erro ao invalidar o cache de comissões de {mes:02d}/{ano}: {e}")
@@ -0,0 +1,146 @@
+import gzip
+import json
+import datetime
+from decimal import Decimal
+from config import settings, logger
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Formato dos campos de dados das mensagens dos streams. O campo `codec` da mensagem
+# traz "<versão>:<serialização>[+<compressão>]", ex.: "1:json" ou "1:msgpack+zstd".
+# O app1 tem uma cópia da decodificação em app1/codec.py.
+VERSAO = 1
+CAMPO_CODEC = 'codec'
+
+
+def _padrao(valor):
+    """
+    Converte para tipos serializáveis os valores vindos do banco e do pandas.
+    """
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        return valor.isoformat()
+    if hasattr(valor, 'item'):
+        return valor.item()
+    return str(valor)
+
+
+def _serializa(valor, formato: str) -> bytes:
+    if formato == 'msgpack':
+        return msgpack.packb(valor, default=_padrao, use_bin_type=True)
+    return json.dumps(valor, default=_padrao, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def _desserializa(dados: bytes, formato: str):
+    if formato == 'msgpack':
+        return msgpack.unpackb(dados, raw=False)
+    if formato == 'json':
+        return json.loads(dados)
+    raise ValueError(f"Serialização não suportada: {formato}")
+
+
+def _comprime(dados: bytes, compressao: str) -> bytes:
+    if compressao == 'zstd':
+        return zstandard.ZstdCompressor().compress(dados)
+    return gzip.compress(dados, compresslevel=6)
+
+
+def _descomprime(dados: bytes, compressao: str) -> bytes:
+    if compressao == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(dados)
+    if compressao == 'gzip':
+        return gzip.decompress(dados)
+    raise ValueError(f"Compressão não suportada: {compressao}")
+
+
+def _opcoes(formato: str, compressao: str) -> tuple:
+    """
+    Resolve a serialização e a compressão a usar: as informadas, ou as de
+    settings.codec, trocando msgpack por json e zstd por gzip quando a
+    biblioteca opcional não está instalada.
+
+    Returns:
+        tuple: (serialização, compressão ou None).
+    """
+    opcoes = settings.get('codec', {})
+    formato = formato or opcoes.get('formato', 'json')
+    compressao = compressao or opcoes.get('compressao', 'gzip')
+
+    if formato == 'msgpack' and msgpack is None:
+        logger.warning("msgpack não instalado, usando json")
+        formato = 'json'
+    if compressao == 'zstd' and zstandard is None:
+        logger.warning("zstandard não instalado, usando gzip")
+        compressao = 'gzip'
+    return formato, (None if compressao == 'nenhuma' else compressao)
+
+
+def codifica(dados: dict, formato: str = None, compressao: str = None, limite: int = None) -> dict:
+    """
+    Codifica os campos de dados de uma mensagem no formato versionado: cada valor é
+    serializado (json compacto ou msgpack) e, se o total passar de `limite` bytes,
+    comprimido (gzip ou zstd). O campo `codec` registra o formato usado.
+
+    Args:
+        dados (dict): Campos de dados (nome -> valor serializável).
+        formato (str): "json" ou "msgpack" (padrão: settings.codec.formato).
+        compressao (str): "gzip", "zstd" ou "nenhuma" (padrão: settings.codec.compressao).
+        limite (int): Tamanho mínimo, em bytes, para comprimir (padrão: settings.codec.limite_compressao).
+
+    Returns:
+        dict: Os campos codificados, acrescidos do campo `codec`.
+    """
+    formato, compressao = _opcoes(formato, compressao)
+    if limite is None:
+        limite = settings.get('codec', {}).get('limite_compressao', 1024)
+
+    campos = {campo: _serializa(valor, formato) for campo, valor in dados.items()}
+    codec = f"{VERSAO}:{formato}"
+    if compressao and sum(len(valor) for valor in campos.values()) >= limite:
+        campos = {campo: _comprime(valor, compressao) for campo, valor in campos.items()}
+        codec += f"+{compressao}"
+
+    campos[CAMPO_CODEC] = codec
+    return campos
+
+
+def decodifica_campo(msg: dict, campo: str):
+    """
+    Lê um campo de dados de uma mensagem recebida do stream. Mensagens sem o campo
+    `codec` (formato anterior) têm o valor devolvido como texto.
+
+    Args:
+        msg (dict): Campos da mensagem, com chaves em bytes.
+        campo (str): Nome do campo.
+
+    Returns:
+        O valor decodificado, ou None se o campo não existir.
+
+    Raises:
+        ValueError: Se a versão, a serialização ou a compressão não forem suportadas.
+    """
+    valor = msg.get(campo.encode('utf-8'))
+    if valor is None:
+        return None
+
+    codec = msg.get(CAMPO_CODEC.encode('utf-8'))
+    if codec is None:
+        return valor.decode('utf-8')
+
+    versao, _, nome = codec.decode('utf-8').partition(':')
+    if versao != str(VERSAO):
+        raise ValueError(f"Versão do formato não suportada: {versao}")
+    formato, _, compressao = nome.partition('+')
+    if compressao:
+        valor = _descomprime(valor, compressao)
+    return _desserializa(valor, formato)
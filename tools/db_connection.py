@@ -1,24 +1,217 @@
+import math
 import numpy as np
 import pandas as pd
 from sqlalchemy import text
+from contextvars import ContextVar
 from config import settings, logger
+from tools.retentativas import relanca_se_transitoria
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 DATABASE_URL = f"postgresql+psycopg2://{settings.database.username}:{settings.database.password}@{
     settings.database.host}:{settings.database.port}/{settings.database.database}"
 
+# Driver psycopg 3 em modo asyncio: envia textos sem tipo fixo, deixando o Postgres
+# converter datas e números recebidos como string, como o psycopg2 já fazia
+ASYNC_DATABASE_URL = f"postgresql+psycopg://{settings.database.username}:{settings.database.password}@{
+    settings.database.host}:{settings.database.port}/{settings.database.database}"
+
 Base = declarative_base()
-engine = create_engine(DATABASE_URL)
+
+OPCOES_POOL = {
+    'pool_size': settings.database.get('pool_size', 5),
+    'max_overflow': settings.database.get('max_overflow', 10),
+    'pool_timeout': settings.database.get('pool_timeout', 30),
+    'pool_recycle': settings.database.get('pool_recycle', 1800),
+    'pool_pre_ping': settings.database.get('pool_pre_ping', True),
+}
+
+# Um único engine por processo: todas as instâncias de PostgreSQLConnection
+# compartilham o mesmo pool de conexões.
+engine = create_engine(DATABASE_URL, **OPCOES_POOL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **OPCOES_POOL)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False)
+
+
+def _parametros(linha, column_mapping: dict) -> dict:
+    """
+    Monta os parâmetros de uma consulta a partir de uma linha do DataFrame (ou de um
+    dicionário), convertendo escalares numpy para tipos Python.
+
+    Args:
+        linha: Linha do DataFrame (pd.Series) ou dicionário.
+        column_mapping (dict): Mapeamento de colunas do DataFrame para parâmetros da consulta.
+
+    Returns:
+        dict: Parâmetros da consulta.
+    """
+    parametros = {}
+    for col, sql_param in column_mapping.items():
+        valor = linha[col]
+        if isinstance(valor, np.generic):
+            valor = valor.item()
+        if isinstance(valor, float) and math.isnan(valor):
+            valor = None
+        parametros[sql_param] = valor
+    return parametros
+
+
+def _parametros_chaves(dados, column_mapping: dict) -> tuple:
+    """
+    Monta o parâmetro de uma busca em lote: todas as chaves distintas dos dados,
+    na ordem de entrada, num único array.
+
+    Args:
+        dados: DataFrame, dicionário ou lista de dicionários com a coluna de chaves.
+        column_mapping (dict): Mapeamento com uma única coluna -> parâmetro da consulta.
+
+    Returns:
+        tuple: (parâmetros da consulta, lista de chaves distintas).
+    """
+    if len(column_mapping) != 1:
+        raise ValueError("A busca em lote aceita um único parâmetro de chave")
+
+    (coluna, sql_param), = column_mapping.items()
+    chaves = list(dict.fromkeys(_parametros(linha, {coluna: 'chave'})['chave']
+                                for linha in _linhas(dados)))
+    return {sql_param: chaves}, chaves
+
+
+def _ordena_por_chave(resultado: pd.DataFrame, chaves: list, chave: str) -> pd.DataFrame:
+    """
+    Ordena o resultado de uma busca em lote pela ordem das chaves de entrada e
+    registra em resultado.attrs['chaves_ausentes'] as chaves sem nenhuma linha.
+
+    Args:
+        resultado (pd.DataFrame): Linhas retornadas pela consulta.
+        chaves (list): Chaves distintas, na ordem de entrada.
+        chave (str): Coluna do resultado que contém a chave.
+
+    Returns:
+        pd.DataFrame: O resultado ordenado.
+    """
+    posicoes = {str(valor): posicao for posicao, valor in enumerate(chaves)}
+    if not resultado.empty:
+        ordem = resultado[chave].map(lambda valor: posicoes.get(str(valor)))
+        resultado = resultado.iloc[ordem.argsort(kind='stable')].reset_index(drop=True)
+
+    encontradas = set() if resultado.empty else set(resultado[chave].map(str))
+    ausentes = [valor for valor in chaves if str(valor) not in encontradas]
+    resultado.attrs['chaves_ausentes'] = ausentes
+    if ausentes:
+        logger.warning(f"Chaves sem resultado ({chave}): {ausentes}")
+    return resultado
+
+
+def _linhas(dados):
+    """
+    Percorre as linhas de um DataFrame, de um dicionário (um único registro, como os
+    decodificados por tools.esquemas) ou de uma lista de dicionários.
+
+    Args:
+        dados: DataFrame, dicionário ou lista de dicionários.
+
+    Returns:
+        Iterador com uma linha (pd.Series ou dict) por registro.
+    """
+    if isinstance(dados, pd.DataFrame):
+        return (linha for _, linha in dados.iterrows())
+    if isinstance(dados, dict):
+        return iter([dados])
+    return iter(dados)
+
+
+def _registros(dados, column_mapping: dict) -> list:
+    """
+    Converte um DataFrame (ou dicionário, ou lista de dicionários) na lista de parâmetros, um por linha.
+
+    Args:
+        dados: DataFrame, dicionário ou lista de dicionários com as colunas de column_mapping.
+        column_mapping (dict): Mapeamento de colunas para parâmetros da consulta.
+
+    Returns:
+        list: Lista de dicionários de parâmetros, na ordem de entrada.
+    """
+    return [_parametros(linha, column_mapping) for linha in _linhas(dados)]
+
+
+def _insert_multiplo(tabela: str, colunas: list, linhas: int):
+    """
+    Monta um INSERT com várias linhas em VALUES; os parâmetros de cada linha
+    recebem o sufixo _<n> (ex.: :venda_id_0, :venda_id_1).
+
+    Args:
+        tabela (str): Nome da tabela.
+        colunas (list): Colunas inseridas (iguais aos nomes dos parâmetros).
+        linhas (int): Quantidade de linhas.
+
+    Returns:
+        TextClause: O comando SQL.
+    """
+    valores = ", ".join(
+        "(" + ", ".join(f":{coluna}_{n}" for coluna in colunas) + ")" for n in range(linhas))
+    return text(f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES {valores}")
+
+
+def aquecer_pool(conexoes: int = None) -> int:
+    """
+    Abre as conexões mínimas do pool na partida do processo, para que as primeiras
+    consultas após um deploy não paguem o custo de conexão (TCP, TLS, autenticação).
+
+    Args:
+        conexoes (int): Quantidade de conexões a abrir; por padrão settings.database.pool_minimo.
+
+    Returns:
+        int: Quantidade de conexões efetivamente abertas.
+    """
+    conexoes = min(conexoes or settings.database.get('pool_minimo', 1),
+                   engine.pool.size())
+    abertas = []
+    try:
+        # As conexões são mantidas em uso ao mesmo tempo, senão o pool reutilizaria a primeira
+        for _ in range(conexoes):
+            conexao = engine.connect()
+            abertas.append(conexao)
+            conexao.execute(text("SELECT 1"))
+    except Exception as e:
+        logger.error(f"Erro ao aquecer o pool de conexões: {e}")
+    finally:
+        for conexao in abertas:
+            conexao.close()
+
+    logger.info(f"Pool de conexões aquecido: {estatisticas_pool()}")
+    return len(abertas)
+
+
+def estatisticas_pool(motor=None) -> dict:
+    """
+    Retorna o estado atual do pool de conexões, para monitoramento.
+
+    Args:
+        motor: Engine (síncrono ou assíncrono) cujo pool é inspecionado; por padrão o engine síncrono.
+
+    Returns:
+        dict: tamanho configurado, conexões ociosas, em uso, overflow e total aberto.
+    """
+    pool = (motor or engine).pool
+    return {
+        'tamanho': pool.size(),
+        'ociosas': pool.checkedin(),
+        'em_uso': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+        'abertas': pool.checkedin() + pool.checkedout(),
+    }
+
 
 class PostgreSQLConnection:
     def __init__(self):
-        self.engine = create_engine(DATABASE_URL)
-        self.SessionLocal = sessionmaker(
-            autocommit=False, autoflush=False, bind=self.engine)
+        self.engine = engine
+        self.SessionLocal = SessionLocal
         self.connection = None
         self.session = None
 
@@ -34,15 +227,34 @@ class PostgreSQLConnection:
             self.session.close()
             print("Conexão fechada com sucesso!")
 
-    async def executa_busca_retorna_df(self, session: Session, query: str, df: pd.DataFrame, column_mapping: dict) -> pd.DataFrame:
-        results = []
-        for _, linha in df.iterrows():
-            # params = {sql_param: row[col]
-            #          for col, sql_param in column_mapping.items()}
-            params = {sql_param: int(linha[col]) if isinstance(linha[col], np.integer) else linha[col]
-                      for col, sql_param in column_mapping.items()}
+    async def executa_busca_retorna_df(self, session: Session, query: str, df: pd.DataFrame, column_mapping: dict,
+                                       chave: str = None) -> pd.DataFrame:
+        """
+        Executa uma consulta com os parâmetros do DataFrame e retorna o resultado.
+
+        Sem `chave`, a consulta é executada uma vez por linha. Com `chave`, todas as
+        chaves vão num único array (a consulta deve usar `= ANY(:parametro)`): uma só
+        ida ao banco, linhas na ordem das chaves de entrada e as chaves não encontradas
+        em result_df.attrs['chaves_ausentes'].
+
+        Args:
+            session (Session): Sessão do SQLAlchemy.
+            query (str): Consulta SQL.
+            df (pd.DataFrame): DataFrame com os parâmetros da consulta.
+            column_mapping (dict): Mapeamento de colunas do DataFrame para parâmetros da consulta.
+            chave (str): Coluna do resultado que contém a chave, para a busca em lote.
 
+        Returns:
+            pd.DataFrame: Resultado da consulta, vazio se nenhuma linha for encontrada.
+        """
+        if chave:
+            params, chaves = _parametros_chaves(df, column_mapping)
             result = session.execute(text(query), params)
+            return _ordena_por_chave(pd.DataFrame(result.fetchall(), columns=list(result.keys())), chaves, chave)
+
+        results = []
+        for _, linha in df.iterrows():
+            result = session.execute(text(query), _parametros(linha, column_mapping))
             rows = result.fetchall()
             if rows:
                 results.extend(rows)
@@ -56,23 +268,31 @@ class PostgreSQLConnection:
 
     async def executa_insercao(self, session: Session, query: str, df: pd.DataFrame, column_mapping: dict) -> None:
         """
-        Executa inserções no banco de dados com base nos dados do DataFrame.
+        Executa inserções no banco de dados com base nos dados do DataFrame, todas as
+        linhas num único executemany e com um único commit. Se alguma linha falhar,
+        nada é gravado; para manter as demais linhas e obter o erro de cada uma e os
+        IDs gerados, ver AsyncPostgreSQLConnection.executa_insercao_lote.
 
         Args:
             session (Session): Sessão do SQLAlchemy.
             query (str): Consulta SQL para inserção.
             df (pd.DataFrame): DataFrame contendo os dados a serem inseridos.
             column_mapping (dict): Mapeamento de colunas do DataFrame para parâmetros da consulta.
+
+        Raises:
+            Exception: O erro da inserção que falhou, após o rollback da transação.
         """
-        for _, row in df.iterrows():
-            params = {sql_param: row[col]
-                      for col, sql_param in column_mapping.items()}
-            try:
-                session.execute(text(query), params)
-                session.commit()
-            except Exception as e:
-                session.rollback()
-                logger.error(f"Erro ao inserir: {e}")
+        registros = _registros(df, column_mapping)
+        if not registros:
+            return
+
+        try:
+            session.execute(text(query), registros)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao inserir: {e}")
+            raise
 
     async def executa_insercao_retorna_id(self, session: Session, query: str, df: pd.DataFrame, column_mapping: dict) -> int:
         """
@@ -105,4 +325,320 @@ class PostgreSQLConnection:
                 return None
 
 
+class AsyncPostgreSQLConnection:
+    """
+    Variante assíncrona de PostgreSQLConnection, com os mesmos métodos e contratos,
+    sobre um driver asyncio: as consultas não bloqueiam o event loop e as mensagens
+    processadas em paralelo pelo worker sobrepõem suas idas ao banco.
+
+    A sessão aberta por connect() é guardada num ContextVar, portanto cada tarefa
+    (cada mensagem em processamento) tem a sua própria sessão.
+    """
+
+    def __init__(self, motor=None):
+        """
+        Inicializa a conexão.
+
+        Args:
+            motor: AsyncEngine a utilizar; por padrão o engine assíncrono do processo.
+        """
+        self.engine = motor or async_engine
+        self.SessionLocal = AsyncSessionLocal if motor is None else async_sessionmaker(
+            motor, autoflush=False, expire_on_commit=False)
+        self._session = ContextVar(f"sessao_{id(self)}", default=None)
+
+    @property
+    def session(self) -> AsyncSession:
+        return self._session.get()
+
+    async def connect(self):
+        try:
+            self._session.set(self.SessionLocal())
+            logger.debug("Sessão com o banco de dados aberta")
+        except Exception as e:
+            logger.error(f"Erro ao conectar ao banco de dados: {e}")
+
+    async def close(self):
+        session = self._session.get()
+        if session:
+            await session.close()
+            self._session.set(None)
+            logger.debug("Sessão com o banco de dados fechada")
+
+    async def aquecer(self, conexoes: int = None) -> int:
+        """
+        Abre as conexões mínimas do pool assíncrono na partida do worker.
+
+        Args:
+            conexoes (int): Quantidade de conexões a abrir; por padrão settings.database.pool_minimo.
+
+        Returns:
+            int: Quantidade de conexões efetivamente abertas.
+        """
+        conexoes = min(conexoes or settings.database.get('pool_minimo', 1),
+                       self.engine.pool.size())
+        abertas = []
+        try:
+            for _ in range(conexoes):
+                conexao = await self.engine.connect()
+                abertas.append(conexao)
+                await conexao.execute(text("SELECT 1"))
+        except Exception as e:
+            logger.error(f"Erro ao aquecer o pool de conexões: {e}")
+        finally:
+            for conexao in abertas:
+                await conexao.close()
+
+        logger.info(f"Pool de conexões aquecido: {self.estatisticas()}")
+        return len(abertas)
+
+    def estatisticas(self) -> dict:
+        """
+        Retorna o estado atual do pool de conexões assíncrono.
+
+        Returns:
+            dict: O mesmo formato de estatisticas_pool().
+        """
+        return estatisticas_pool(self.engine)
+
+    async def executa_busca_retorna_df(self, session: AsyncSession, query: str, df, column_mapping: dict,
+                                       chave: str = None) -> pd.DataFrame:
+        """
+        Executa uma consulta com os parâmetros dos dados de entrada e retorna o resultado.
+
+        Sem `chave`, a consulta é executada uma vez por linha. Com `chave`, todas as
+        chaves vão num único array (a consulta deve usar `= ANY(:parametro)`): uma só
+        ida ao banco, linhas na ordem das chaves de entrada e as chaves não encontradas
+        em result_df.attrs['chaves_ausentes'].
+
+        Args:
+            session (AsyncSession): Sessão assíncrona do SQLAlchemy.
+            query (str): Consulta SQL.
+            df: DataFrame, dicionário ou lista de dicionários com os parâmetros da consulta.
+            column_mapping (dict): Mapeamento de colunas dos dados para parâmetros da consulta.
+            chave (str): Coluna do resultado que contém a chave, para a busca em lote.
+
+        Returns:
+            pd.DataFrame: Resultado da consulta, vazio se nenhuma linha for encontrada.
+        """
+        if chave:
+            params, chaves = _parametros_chaves(df, column_mapping)
+            result = await session.execute(text(query), params)
+            return _ordena_por_chave(pd.DataFrame(result.fetchall(), columns=list(result.keys())), chaves, chave)
+
+        results = []
+        for linha in _linhas(df):
+            result = await session.execute(text(query), _parametros(linha, column_mapping))
+            rows = result.fetchall()
+            if rows:
+                results.extend(rows)
+
+        if results:
+            result_df = pd.DataFrame(results, columns=result.keys())
+        else:
+            result_df = pd.DataFrame()
+
+        return result_df
+
+    async def executa_insercao(self, session: AsyncSession, query: str, df, column_mapping: dict) -> None:
+        """
+        Executa inserções no banco de dados com base nos dados de entrada, todas as
+        linhas num único executemany e com um único commit. Se alguma linha falhar,
+        nada é gravado; para manter as demais linhas e obter o erro de cada uma e os
+        IDs gerados, ver AsyncPostgreSQLConnection.executa_insercao_lote.
+
+        Args:
+            session (AsyncSession): Sessão assíncrona do SQLAlchemy.
+            query (str): Consulta SQL para inserção.
+            df: DataFrame, dicionário ou lista de dicionários com os dados a serem inseridos.
+            column_mapping (dict): Mapeamento de colunas dos dados para parâmetros da consulta.
+
+        Raises:
+            Exception: O erro da inserção que falhou, após o rollback da transação.
+        """
+        registros = _registros(df, column_mapping)
+        if not registros:
+            return
+
+        try:
+            await session.execute(text(query), registros)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Erro ao inserir: {e}")
+            raise
+
+    async def executa_insercao_retorna_linha(self, session: AsyncSession, query: str, df, column_mapping: dict) -> dict:
+        """
+        Executa uma instrução de escrita com RETURNING (ex.: CTEs encadeadas que gravam
+        várias tabelas) para o primeiro registro dos dados, com um único commit, e
+        retorna a linha devolvida.
+
+        Args:
+            session (AsyncSession): Sessão assíncrona do SQLAlchemy.
+            query (str): Instrução SQL com RETURNING (ou SELECT final).
+            df: DataFrame, dicionário ou lista de dicionários com os dados a serem gravados.
+            column_mapping (dict): Mapeamento de colunas dos dados para parâmetros da consulta.
+
+        Returns:
+            dict: A linha retornada (coluna -> valor), ou None se a instrução falhar.
+        """
+        try:
+            result = await session.execute(text(query), _parametros(next(_linhas(df)), column_mapping))
+            linha = result.mappings().fetchone()
+            await session.commit()
+            return dict(linha) if linha else None
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Erro ao gravar: {e}")
+            relanca_se_transitoria(e)
+            return None
+
+    async def executa_transacao_retorna_linhas(self, session: AsyncSession, query: str, dfs: list, column_mapping: dict) -> list:
+        """
+        Executa a instrução uma vez para cada registro, todas na mesma transação e
+        com um único commit (group commit). Se qualquer uma falhar, nada é gravado.
+
+        Args:
+            session (AsyncSession): Sessão assíncrona do SQLAlchemy.
+            query (str): Instrução SQL com RETURNING (ou SELECT final).
+            dfs (list): Lista de registros (dicionários, ou DataFrames dos quais vale a primeira linha).
+            column_mapping (dict): Mapeamento de colunas dos dados para parâmetros da consulta.
+
+        Returns:
+            list: A linha retornada (coluna -> valor) por cada registro, na mesma ordem.
+
+        Raises:
+            Exception: O erro da instrução que falhou, após o rollback da transação.
+        """
+        try:
+            linhas = []
+            for registro in dfs:
+                result = await session.execute(text(query), _parametros(next(_linhas(registro)), column_mapping))
+                linha = result.mappings().fetchone()
+                linhas.append(dict(linha) if linha else None)
+            await session.commit()
+            return linhas
+        except Exception:
+            await session.rollback()
+            raise
+
+    async def executa_insercao_lote(self, session: AsyncSession, tabela: str, dados, column_mapping: dict,
+                                    tamanho_lote: int = None, copia: bool = None) -> dict:
+        """
+        Insere muitas linhas de uma vez e retorna os IDs gerados na ordem de entrada.
+
+        Os IDs são reservados antes na sequence da tabela (uma consulta), então a
+        correspondência linha -> ID não depende da ordem do RETURNING. As linhas vão em
+        INSERTs de várias linhas (até tamanho_lote por comando) ou, a partir de
+        settings.database.limite_copy linhas, via COPY. Há um único commit por chamada.
+        Se um bloco falhar, as linhas dele são repetidas uma a uma com savepoints para
+        identificar as que falharam, sem perder as demais.
+
+        Args:
+            session (AsyncSession): Sessão assíncrona do SQLAlchemy.
+            tabela (str): Tabela de destino (com coluna id serial).
+            dados: DataFrame ou lista de dicionários.
+            column_mapping (dict): Mapeamento de colunas dos dados para colunas da tabela.
+            tamanho_lote (int): Máximo de linhas por comando; por padrão settings.database.lote_insercao.
+            copia (bool): Força (True) ou impede (False) o uso de COPY; por padrão decide pelo volume.
+
+        Returns:
+            dict: {'ids': IDs na ordem de entrada (None nas linhas com erro),
+                   'erros': lista de {'indice', 'erro'}}.
+        """
+        registros = _registros(dados, column_mapping)
+        if not registros:
+            return {'ids': [], 'erros': []}
+
+        colunas = ['id'] + list(column_mapping.values())
+        # O Postgres aceita no máximo 65535 parâmetros por comando
+        tamanho_lote = min(tamanho_lote or settings.database.get('lote_insercao', 1000),
+                           65535 // len(colunas))
+        if copia is None:
+            copia = len(registros) >= settings.database.get('limite_copy', 5000)
+
+        resultado = await session.execute(
+            text("SELECT nextval(pg_get_serial_sequence(:tabela, 'id')) FROM generate_series(1, :quantidade)"),
+            {'tabela': tabela, 'quantidade': len(registros)})
+        ids = [linha[0] for linha in resultado.fetchall()]
+        for id_reservado, registro in zip(ids, registros):
+            registro['id'] = id_reservado
+
+        erros = []
+        for inicio in range(0, len(registros), tamanho_lote):
+            bloco = registros[inicio:inicio + tamanho_lote]
+            try:
+                async with session.begin_nested():
+                    if copia:
+                        await self._copia(session, tabela, colunas, bloco)
+                    else:
+                        await session.execute(
+                            _insert_multiplo(tabela, colunas, len(bloco)),
+                            {f"{coluna}_{n}": registro[coluna]
+                             for n, registro in enumerate(bloco) for coluna in colunas})
+            except Exception:
+                for indice in range(inicio, inicio + len(bloco)):
+                    try:
+                        async with session.begin_nested():
+                            await session.execute(_insert_multiplo(tabela, colunas, 1),
+                                                  {f"{coluna}_0": registros[indice][coluna] for coluna in colunas})
+                    except Exception as e:
+                        erro = str(getattr(e, 'orig', e)).splitlines()[0]
+                        logger.error(f"Erro ao inserir linha {indice} em {tabela}: {erro}")
+                        erros.append({'indice': indice, 'erro': erro})
+                        ids[indice] = None
+
+        await session.commit()
+        logger.info(f"{len(registros) - len(erros)} linhas inseridas em {tabela}")
+        return {'ids': ids, 'erros': erros}
+
+    async def _copia(self, session: AsyncSession, tabela: str, colunas: list, registros: list):
+        """
+        Envia as linhas com COPY FROM STDIN pela conexão da própria sessão (mesma transação).
+
+        Args:
+            session (AsyncSession): Sessão assíncrona do SQLAlchemy.
+            tabela (str): Tabela de destino.
+            colunas (list): Colunas enviadas.
+            registros (list): Linhas a enviar.
+
+        Returns:
+            None
+        """
+        conexao = await (await session.connection()).get_raw_connection()
+        async with conexao.driver_connection.cursor() as cursor:
+            async with cursor.copy(f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN") as copia:
+                for registro in registros:
+                    # Booleanos como 'true'/'false', o mesmo texto gravado pelo INSERT em colunas TEXT
+                    await copia.write_row([str(registro[coluna]).lower() if isinstance(registro[coluna], bool)
+                                           else registro[coluna] for coluna in colunas])
+
+    async def executa_insercao_retorna_id(self, session: AsyncSession, query: str, df, column_mapping: dict) -> int:
+        """
+        Executa uma inserção no banco de dados com base nos dados de entrada e retorna o ID gerado.
+
+        Args:
+            session (AsyncSession): Sessão assíncrona do SQLAlchemy.
+            query (str): Consulta SQL para inserção.
+            df: DataFrame, dicionário ou lista de dicionários com os dados a serem inseridos.
+            column_mapping (dict): Mapeamento de colunas dos dados para parâmetros da consulta.
+
+        Returns:
+            int: O ID gerado pela inserção.
+        """
+        for row in _linhas(df):
+            try:
+                result = await session.execute(text(query), _parametros(row, column_mapping))
+                inserted_id = result.fetchone()[0]
+                await session.commit()
+                logger.info(f"Inserido com sucesso, ID: {inserted_id}")
+                return inserted_id
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Erro ao inserir: {e}")
+                relanca_se_transitoria(e)
+                return None
+
+
 db_connection = PostgreSQLConnection()
@@ -0,0 +1,235 @@
+import json
+import typing
+import dataclasses
+from dataclasses import dataclass
+from typing import Optional
+
+
+class ErroEsquema(ValueError):
+    """
+    Mensagem que não corresponde ao esquema esperado (campo ausente ou de tipo inválido).
+    """
+
+    def __init__(self, mensagem: str, campos: list = None):
+        super().__init__(mensagem)
+        self.campos = campos or []
+
+
+# Esquemas das mensagens dos streams, espelhando os modelos de app1/models.py.
+# São dataclasses com __slots__: a mensagem é decodificada direto nelas, sem DataFrame.
+
+@dataclass(slots=True)
+class DetalhesCompra:
+    produto_id: int
+    tipo_produto: str
+    quantidade: int
+    preco: float
+    nome_produto: str
+    tipo_pagamento: str
+    especificacoes: Optional[str] = None
+    garantia: Optional[int] = None
+    autor: Optional[str] = None
+    isbn: Optional[str] = None
+    valor_royalty: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Compra:
+    data: str
+    cliente_id: str
+    vendedor_id: str
+    tipo_compra: str
+    detalhes_compra: DetalhesCompra
+
+
+@dataclass(slots=True)
+class DetalhesAssociacao:
+    nome_plano: str
+    ativo: bool
+
+
+@dataclass(slots=True)
+class Associacao:
+    data: str
+    cliente_id: str
+    vendedor_id: str
+    tipo_assinatura: str
+    detalhes_compra: DetalhesAssociacao
+
+
+@dataclass(slots=True)
+class DetalhesStreaming:
+    id_streaming: str
+
+
+@dataclass(slots=True)
+class Streaming:
+    data: str
+    cliente_id: str
+    detalhes_compra: DetalhesStreaming
+
+
+@dataclass(slots=True)
+class Comissao:
+    mes: int
+    ano: int
+    # Sem vendedor, as comissões de todos os vendedores do mês
+    vendedor_id: Optional[int] = None
+
+
+@dataclass(slots=True)
+class Remessa:
+    codigo_venda: int
+
+
+_CAMPOS = {}
+
+# Textos aceitos como booleano, os mesmos aceitos pela validação do Pydantic no app1
+_BOOLEANOS = {'true': True, 'false': False, '1': True, '0': False, 'yes': True, 'no': False,
+              'on': True, 'off': False, 't': True, 'f': False, 'y': True, 'n': False}
+
+
+def _campos(esquema) -> list:
+    """
+    Retorna, com cache, os campos do esquema como tuplas
+    (nome, tipo, obrigatório, valor padrão).
+
+    Args:
+        esquema: Classe do esquema.
+
+    Returns:
+        list: Os campos do esquema.
+    """
+    campos = _CAMPOS.get(esquema)
+    if campos is None:
+        tipos = typing.get_type_hints(esquema)
+        campos = []
+        for campo in dataclasses.fields(esquema):
+            tipo = tipos[campo.name]
+            opcional = typing.get_origin(tipo) is typing.Union
+            if opcional:
+                tipo = next(t for t in typing.get_args(tipo) if t is not type(None))
+            obrigatorio = campo.default is dataclasses.MISSING
+            campos.append((campo.name, tipo, obrigatorio, None if obrigatorio else campo.default))
+        _CAMPOS[esquema] = campos
+    return campos
+
+
+def _converte(valor, tipo, caminho: str):
+    """
+    Converte um valor do JSON para o tipo do campo, aceitando números enviados como
+    texto (e vice-versa) e booleanos como 'true'/'false', como a validação do app1,
+    que encaminha o corpo original da requisição sem serializá-lo de novo.
+
+    Args:
+        valor: Valor lido do JSON.
+        tipo: Tipo declarado no esquema.
+        caminho (str): Nome completo do campo, para a mensagem de erro.
+
+    Returns:
+        O valor convertido.
+
+    Raises:
+        ErroEsquema: Se o valor não puder ser convertido.
+    """
+    if dataclasses.is_dataclass(tipo):
+        if not isinstance(valor, dict):
+            raise ErroEsquema(f"Campos ausentes ou inválidos: {caminho}", [caminho])
+        return _decodifica(tipo, valor, caminho + '.')
+    try:
+        if tipo is bool:
+            if isinstance(valor, bool):
+                return valor
+            if isinstance(valor, int) and valor in (0, 1):
+                return bool(valor)
+            if isinstance(valor, str) and valor.lower() in _BOOLEANOS:
+                return _BOOLEANOS[valor.lower()]
+            raise TypeError
+        if tipo is int:
+            if isinstance(valor, bool) or (isinstance(valor, float) and not valor.is_integer()):
+                raise TypeError
+            return int(valor)
+        if tipo is float:
+            if isinstance(valor, bool):
+                raise TypeError
+            return float(valor)
+        if tipo is str:
+            if isinstance(valor, (dict, list)):
+                raise TypeError
+            return valor if isinstance(valor, str) else str(valor)
+    except (TypeError, ValueError):
+        raise ErroEsquema(f"Campos ausentes ou inválidos: {caminho}", [caminho])
+    return valor
+
+
+def _decodifica(esquema, dados: dict, prefixo: str = ''):
+    """
+    Decodifica um objeto JSON já carregado no esquema, reunindo numa única
+    ErroEsquema todos os campos ausentes ou inválidos, inclusive os aninhados.
+    """
+    valores = {}
+    problemas = []
+    for nome, tipo, obrigatorio, padrao in _campos(esquema):
+        valor = dados.get(nome)
+        if valor is None:
+            if obrigatorio:
+                problemas.append(prefixo + nome)
+            else:
+                valores[nome] = padrao
+            continue
+        try:
+            valores[nome] = _converte(valor, tipo, prefixo + nome)
+        except ErroEsquema as e:
+            problemas.extend(e.campos)
+
+    if problemas:
+        raise ErroEsquema(f"Campos ausentes ou inválidos: {', '.join(problemas)}", problemas)
+    return esquema(**valores)
+
+
+def decodifica(esquema, dados):
+    """
+    Decodifica uma mensagem (bytes, texto JSON ou dicionário) direto no esquema,
+    validando os campos obrigatórios e os tipos.
+
+    Args:
+        esquema: Classe do esquema (ex.: Compra, Associacao).
+        dados: Conteúdo do campo `data` da mensagem.
+
+    Returns:
+        Instância do esquema.
+
+    Raises:
+        ErroEsquema: Se a mensagem não for um objeto JSON válido para o esquema.
+    """
+    if isinstance(dados, (bytes, str)):
+        try:
+            dados = json.loads(dados)
+        except ValueError as e:
+            raise ErroEsquema(f"Mensagem não é um JSON válido: {e}")
+    if not isinstance(dados, dict):
+        raise ErroEsquema("Mensagem não é um objeto JSON")
+    return _decodifica(esquema, dados)
+
+
+def achata(registro, prefixo: str = '') -> dict:
+    """
+    Converte um registro decodificado num dicionário plano, com os campos aninhados
+    em nomes pontuados (ex.: 'detalhes_compra.preco'), os mesmos nomes de coluna
+    gerados por pd.json_normalize e usados nos mapeamentos das consultas.
+
+    Args:
+        registro: Instância de um esquema.
+        prefixo (str): Prefixo dos nomes (uso interno, na recursão).
+
+    Returns:
+        dict: O registro achatado.
+    """
+    plano = {}
+    for nome, tipo, _, _ in _campos(type(registro)):
+        valor = getattr(registro, nome)
+        if dataclasses.is_dataclass(tipo) and valor is not None:
+            plano.update(achata(valor, f"{prefixo}{nome}."))
+        else:
+            plano[prefixo + nome] = valor
+    return plano
@@ -0,0 +1,96 @@
+import asyncio
+from config import logger
+
+
+class AgrupadorLote:
+    """
+    Classe que agrupa itens enviados por várias tarefas concorrentes em lotes
+    (group commit): o lote é processado quando atinge `max_itens` ou quando o item
+    mais antigo espera `max_espera_ms`, e cada tarefa recebe o resultado do seu item.
+    """
+
+    def __init__(self, processa_lote, max_itens: int, max_espera_ms: int):
+        """
+        Inicializa o agrupador.
+
+        Args:
+            processa_lote: Corrotina `processa_lote(itens) -> list` que retorna um
+                resultado por item, na mesma ordem; um resultado que é uma exceção é
+                levantado só para a tarefa daquele item.
+            max_itens (int): Quantidade de itens que dispara o processamento do lote.
+            max_espera_ms (int): Espera máxima do primeiro item do lote, em milissegundos.
+        """
+        self.processa_lote = processa_lote
+        self.max_itens = max_itens
+        self.max_espera_ms = max_espera_ms
+        self._itens = []
+        self._temporizador = None
+        self._tarefas = set()
+
+    async def adiciona(self, item):
+        """
+        Adiciona um item ao lote atual e aguarda o processamento do lote.
+
+        Args:
+            item: Item a processar.
+
+        Returns:
+            O resultado do item retornado por processa_lote.
+
+        Raises:
+            Exception: A exceção do item, ou a levantada por processa_lote se o lote inteiro falhar.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._itens.append((item, future))
+
+        if len(self._itens) >= self.max_itens:
+            self._dispara()
+        elif self._temporizador is None:
+            self._temporizador = loop.call_later(
+                self.max_espera_ms / 1000, self._dispara)
+
+        return await future
+
+    def _dispara(self):
+        """
+        Fecha o lote atual e o processa numa tarefa própria, para que o cancelamento
+        de uma das tarefas que aguardam não interrompa o lote das demais.
+
+        Returns:
+            None
+        """
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+
+        itens, self._itens = self._itens, []
+        if itens:
+            tarefa = asyncio.create_task(self._descarrega(itens))
+            self._tarefas.add(tarefa)
+            tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _descarrega(self, itens: list):
+        """
+        Processa um lote e entrega a cada item o seu resultado.
+
+        Args:
+            itens (list): Lista de tuplas (item, future).
+
+        Returns:
+            None
+        """
+        logger.info(f"Processando lote de {len(itens)} itens")
+        try:
+            resultados = await self.processa_lote([item for item, _ in itens])
+            for (_, future), resultado in zip(itens, resultados):
+                if future.done():
+                    continue
+                if isinstance(resultado, Exception):
+                    future.set_exception(resultado)
+                else:
+                    future.set_result(resultado)
+        except Exception as e:
+            for _, future in itens:
+                if not future.done():
+                    future.set_exception(e)
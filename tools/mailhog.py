@@ -1,5 +1,6 @@
 import smtplib
 from config import settings, logger
+from tools.retentativas import relanca_se_transitoria
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
@@ -24,4 +25,5 @@ class Mailhog:
                 return True
         except Exception as e:
             logger.error(f"Erro ao enviar email: {e}")
+            relanca_se_transitoria(e)
             return False
@@ -0,0 +1,48 @@
+import time
+from config import logger
+from tools.codec import codifica
+
+
+def monta_resposta(msg: dict, campos: dict, dados: dict = None) -> dict:
+    """
+    Monta os campos de uma mensagem de resposta, ecoando o correlation_id da
+    mensagem recebida para que o app1 entregue a resposta ao request correto.
+
+    Args:
+        msg (dict): Campos da mensagem recebida do stream Redis.
+        campos (dict): Campos simples da resposta (status, ids, etc), enviados como estão.
+        dados (dict): Campos de dados (listas, relatórios), codificados por tools.codec.
+
+    Returns:
+        dict: Campos da resposta acrescidos do correlation_id, quando presente.
+    """
+    resposta = dict(campos)
+    if dados:
+        resposta.update(codifica(dados))
+    correlation_id = msg.get(b'correlation_id')
+    if correlation_id:
+        resposta['correlation_id'] = correlation_id
+    return resposta
+
+
+def prazo_expirado(msg: dict) -> bool:
+    """
+    Indica se já passou o prazo carimbado pelo app1 na mensagem (campo `prazo`, em
+    milissegundos desde a época): depois dele ninguém aguarda mais a resposta.
+
+    Args:
+        msg (dict): Campos da mensagem recebida do stream Redis.
+
+    Returns:
+        bool: True se a mensagem tem prazo e ele já passou. Um prazo ilegível é
+            tratado como ausente, para que a mensagem seja processada em vez de falhar
+            a cada entrega.
+    """
+    prazo = msg.get(b'prazo')
+    if prazo is None:
+        return False
+    try:
+        return int(prazo) < time.time() * 1000
+    except (TypeError, ValueError):
+        logger.warning(f"Prazo inválido na mensagem, ignorado: {prazo!r}")
+        return False
@@ -0,0 +1,152 @@
+import re
+import time
+from pathlib import Path
+from dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from config import logger
+
+# Migrações do schema: arquivos postgres/migracoes/<versão>_<descrição>.sql, aplicados
+# em ordem de versão e registrados na tabela schema_migracoes. O init_banco.sql cria o
+# schema inicial; toda mudança posterior vira uma nova migração, nunca uma edição.
+DIRETORIO = Path(__file__).resolve().parent.parent / 'postgres' / 'migracoes'
+
+# Primeira linha das migrações que não podem rodar numa transação (CREATE INDEX
+# CONCURRENTLY): cada instrução é executada e confirmada isoladamente, e devem ser
+# idempotentes (IF NOT EXISTS), pois uma falha no meio deixa a migração pela metade
+MARCADOR_SEM_TRANSACAO = '-- migracao: sem transacao'
+
+# pg_advisory_lock: só um processo aplica migrações por vez
+CHAVE_BLOQUEIO = 4_810_151
+
+CRIA_TABELA = """CREATE TABLE IF NOT EXISTS schema_migracoes (
+    versao INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL,
+    aplicada_em TIMESTAMP NOT NULL DEFAULT now()
+)"""
+
+_ARQUIVO = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+@dataclass(slots=True)
+class Migracao:
+    versao: int
+    nome: str
+    sql: str
+
+    @property
+    def sem_transacao(self) -> bool:
+        return self.sql.lstrip().startswith(MARCADOR_SEM_TRANSACAO)
+
+
+def lista_migracoes(diretorio: Path = DIRETORIO) -> list:
+    """
+    Lê as migrações do diretório, em ordem de versão.
+
+    Args:
+        diretorio (Path): Diretório dos arquivos .sql.
+
+    Returns:
+        list: Lista de Migracao.
+
+    Raises:
+        ValueError: Para um arquivo .sql fora do padrão de nome ou uma versão repetida.
+    """
+    migracoes = {}
+    for arquivo in sorted(Path(diretorio).glob('*.sql')):
+        encontrado = _ARQUIVO.match(arquivo.name)
+        if not encontrado:
+            raise ValueError(f"Nome de migração inválido: {arquivo.name}")
+        versao = int(encontrado.group(1))
+        if versao in migracoes:
+            raise ValueError(f"Versão de migração repetida: {versao}")
+        migracoes[versao] = Migracao(versao, encontrado.group(2), arquivo.read_text(encoding='utf-8'))
+    return [migracoes[versao] for versao in sorted(migracoes)]
+
+
+def divide_instrucoes(sql: str) -> list:
+    """
+    Separa as instruções de uma migração sem transação (terminadas em ';' no fim da
+    linha), descartando as linhas de comentário.
+    """
+    linhas = [linha for linha in sql.splitlines() if not linha.strip().startswith('--')]
+    instrucoes = re.split(r';\s*$', '\n'.join(linhas), flags=re.MULTILINE)
+    return [instrucao.strip() for instrucao in instrucoes if instrucao.strip()]
+
+
+def _executa(conexao, sql: str):
+    # Cursor do driver, sem parâmetros: o SQL segue literal, sem interpretar % nem :nome
+    with conexao.connection.cursor() as cursor:
+        cursor.execute(sql)
+
+
+def _aplica(engine, migracao: Migracao):
+    registro = text("INSERT INTO schema_migracoes (versao, nome) VALUES (:versao, :nome)")
+    parametros = {'versao': migracao.versao, 'nome': migracao.nome}
+    if migracao.sem_transacao:
+        with engine.connect() as conexao:
+            conexao = conexao.execution_options(isolation_level='AUTOCOMMIT')
+            for instrucao in divide_instrucoes(migracao.sql):
+                _executa(conexao, instrucao)
+            conexao.execute(registro, parametros)
+    else:
+        with engine.begin() as conexao:
+            _executa(conexao, migracao.sql)
+            conexao.execute(registro, parametros)
+
+
+def aplica_migracoes(engine, diretorio: Path = DIRETORIO) -> list:
+    """
+    Aplica, em ordem, as migrações ainda não registradas em schema_migracoes. Cada
+    migração roda numa transação própria (ou instrução a instrução, ver
+    MARCADOR_SEM_TRANSACAO); uma falha interrompe as seguintes.
+
+    Args:
+        engine: Engine síncrono do SQLAlchemy.
+        diretorio (Path): Diretório dos arquivos .sql.
+
+    Returns:
+        list: Versões aplicadas nesta execução.
+    """
+    migracoes = lista_migracoes(diretorio)
+    with engine.connect() as bloqueio:
+        bloqueio = bloqueio.execution_options(isolation_level='AUTOCOMMIT')
+        bloqueio.execute(text("SELECT pg_advisory_lock(:chave)"), {'chave': CHAVE_BLOQUEIO})
+        try:
+            _executa(bloqueio, CRIA_TABELA)
+            aplicadas = {linha[0] for linha in bloqueio.execute(text("SELECT versao FROM schema_migracoes"))}
+            novas = []
+            for migracao in migracoes:
+                if migracao.versao in aplicadas:
+                    continue
+                logger.info(f"Aplicando migração {migracao.versao:03d}_{migracao.nome}")
+                inicio = time.monotonic()
+                _aplica(engine, migracao)
+                logger.info(f"Migração {migracao.versao:03d} aplicada em {time.monotonic() - inicio:.1f}s")
+                novas.append(migracao.versao)
+            return novas
+        finally:
+            bloqueio.execute(text("SELECT pg_advisory_unlock(:chave)"), {'chave': CHAVE_BLOQUEIO})
+
+
+def main(tentativas: int = 30, espera: float = 2.0):
+    """
+    Aplica as migrações pendentes, aguardando o Postgres aceitar conexões (na primeira
+    subida o container ainda está executando o init_banco.sql).
+    """
+    from tools.db_connection import engine
+
+    for tentativa in range(1, tentativas + 1):
+        try:
+            novas = aplica_migracoes(engine)
+            break
+        except OperationalError as e:
+            if tentativa == tentativas:
+                raise
+            logger.warning(f"Banco indisponível ({tentativa}/{tentativas}), nova tentativa em {espera}s: {e}")
+            time.sleep(espera)
+    logger.info(f"{len(novas)} migrações aplicadas" if novas else "Schema atualizado, nenhuma migração pendente")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import os
+import re
+import argparse
+import pandas as pd
+from pathlib import Path
+from datetime import date
+from sqlalchemy import text
+from config import settings, logger
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Partições mensais de vendas e das tabelas dependentes (postgres/migracoes/
+# 004_particiona_vendas.sql), nomeadas <tabela>_<ano>_<mês>. Um mês das quatro tabelas
+# é criado e arquivado junto; vendas vem primeiro, pois as demais a referenciam.
+TABELAS = ('vendas', 'comissoes', 'guias_royalty', 'guias_remessa')
+
+# Schema dos meses arquivados no próprio banco (fora das consultas da aplicação)
+ESQUEMA_ARQUIVO = 'arquivo'
+
+DESTINOS = ('esquema', 'parquet')
+
+# Cria as partições que faltam entre dois meses e retorna os nomes das criadas
+CRIA_PARTICOES = "SELECT cria_particoes_vendas(:inicio, :fim)"
+
+_PARTICAO = re.compile(r'^vendas_(\d{4})_(\d{2})$')
+
+
+def nome_particao(tabela: str, ano: int, mes: int) -> str:
+    return f"{tabela}_{ano}_{mes:02d}"
+
+
+def soma_meses(ano: int, mes: int, meses: int) -> tuple:
+    """
+    Retorna o (ano, mes) `meses` meses depois (ou antes, se negativo) de ano/mes.
+    """
+    total = ano * 12 + mes - 1 + meses
+    return total // 12, total % 12 + 1
+
+
+def cria_particoes(engine, meses_a_frente: int = None, hoje: date = None) -> list:
+    """
+    Cria as partições do mês corrente e dos próximos meses que ainda não existem.
+
+    Args:
+        engine: Engine síncrono do SQLAlchemy.
+        meses_a_frente (int): Meses futuros; por padrão settings.particoes.meses_a_frente.
+        hoje (date): Data de referência; por padrão a data atual.
+
+    Returns:
+        list: Nomes das partições criadas.
+    """
+    hoje = hoje or date.today()
+    if meses_a_frente is None:
+        meses_a_frente = settings.particoes.meses_a_frente
+    ano, mes = soma_meses(hoje.year, hoje.month, meses_a_frente)
+    with engine.begin() as conexao:
+        criadas = conexao.execute(text(CRIA_PARTICOES),
+                                  {'inicio': hoje.replace(day=1), 'fim': date(ano, mes, 1)}).scalars().all()
+    for particao in criadas:
+        logger.info(f"Partição {particao} criada")
+    return criadas
+
+
+def lista_particoes(engine) -> list:
+    """
+    Lista os meses com partição de vendas ligada à tabela (não arquivados).
+
+    Args:
+        engine: Engine síncrono do SQLAlchemy.
+
+    Returns:
+        list: (ano, mes) em ordem.
+    """
+    with engine.connect() as conexao:
+        nomes = conexao.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST('public.vendas' AS regclass)")).scalars().all()
+    meses = [_PARTICAO.match(nome) for nome in nomes]
+    return sorted((int(m.group(1)), int(m.group(2))) for m in meses if m)
+
+
+def meses_para_arquivar(engine, meses_retencao: int = None, hoje: date = None) -> list:
+    """
+    Lista os meses ligados à tabela mais antigos que a retenção.
+
+    Args:
+        engine: Engine síncrono do SQLAlchemy.
+        meses_retencao (int): Meses mantidos, o corrente inclusive; por padrão
+            settings.particoes.meses_retencao.
+        hoje (date): Data de referência; por padrão a data atual.
+
+    Returns:
+        list: (ano, mes) em ordem.
+    """
+    hoje = hoje or date.today()
+    if meses_retencao is None:
+        meses_retencao = settings.particoes.meses_retencao
+    limite = soma_meses(hoje.year, hoje.month, 1 - max(meses_retencao, 1))
+    return [mes for mes in lista_particoes(engine) if mes < limite]
+
+
+def _desliga(conexao, ano: int, mes: int):
+    """
+    Desliga as partições do mês das tabelas e as move para o schema de arquivo,
+    primeiro as dependentes. As chaves estrangeiras das partições desligadas que
+    apontam para vendas são removidas: as vendas do mês saem da tabela junto com elas.
+    """
+    for tabela in reversed(TABELAS):
+        particao = nome_particao(tabela, ano, mes)
+        conexao.execute(text(f"ALTER TABLE {tabela} DETACH PARTITION {particao}"))
+        restricoes = conexao.execute(text(
+            "SELECT conname FROM pg_constraint WHERE contype = 'f' "
+            "AND conrelid = CAST(:particao AS regclass) AND confrelid = CAST('public.vendas' AS regclass)"),
+            {'particao': f"public.{particao}"}).scalars().all()
+        for restricao in restricoes:
+            conexao.execute(text(f'ALTER TABLE {particao} DROP CONSTRAINT "{restricao}"'))
+        conexao.execute(text(f"ALTER TABLE {particao} SET SCHEMA {ESQUEMA_ARQUIVO}"))
+
+
+def exporta_parquet(engine, ano: int, mes: int, diretorio: Path = None) -> list:
+    """
+    Exporta as partições de um mês já movidas para o schema de arquivo para arquivos
+    Parquet (<diretorio>/<ano>-<mês>/<tabela>.parquet) e as remove do banco. Cada
+    arquivo é gravado com outro nome e renomeado ao final, e as tabelas só são
+    removidas depois de todos os arquivos gravados. Um arquivo já existente (mês
+    exportado antes e recriado por uma venda retroativa) não é sobrescrito.
+
+    Args:
+        engine: Engine síncrono do SQLAlchemy.
+        ano (int): Ano.
+        mes (int): Mês.
+        diretorio (Path): Diretório base; por padrão settings.particoes.diretorio_parquet.
+
+    Returns:
+        list: Caminhos dos arquivos gravados.
+
+    Raises:
+        RuntimeError: Se o pyarrow não estiver instalado.
+        FileExistsError: Se algum dos arquivos do mês já existir.
+    """
+    if pyarrow is None:
+        raise RuntimeError("pyarrow não instalado: exportação para Parquet indisponível")
+    destino = Path(diretorio or settings.particoes.diretorio_parquet) / f"{ano}-{mes:02d}"
+    existentes = [arquivo for arquivo in (destino / f"{tabela}.parquet" for tabela in TABELAS) if arquivo.exists()]
+    if existentes:
+        raise FileExistsError(f"Arquivos do mês já exportados: {', '.join(map(str, existentes))}")
+    destino.mkdir(parents=True, exist_ok=True)
+
+    arquivos = []
+    with engine.connect() as conexao:
+        for tabela in TABELAS:
+            particao = nome_particao(tabela, ano, mes)
+            df = pd.read_sql(text(f"SELECT * FROM {ESQUEMA_ARQUIVO}.{particao} ORDER BY id"), conexao)
+            arquivo = destino / f"{tabela}.parquet"
+            temporario = arquivo.with_name(f"{arquivo.name}.tmp")
+            df.to_parquet(temporario, index=False)
+            os.replace(temporario, arquivo)
+            logger.info(f"{len(df)} linhas de {particao} exportadas para {arquivo}")
+            arquivos.append(arquivo)
+
+    with engine.begin() as conexao:
+        for tabela in reversed(TABELAS):
+            conexao.execute(text(f"DROP TABLE {ESQUEMA_ARQUIVO}.{nome_particao(tabela, ano, mes)}"))
+    return arquivos
+
+
+def arquiva_mes(engine, ano: int, mes: int, destino: str = None, diretorio: Path = None):
+    """
+    Arquiva um mês: desliga as partições das tabelas numa transação e as mantém no
+    schema de arquivo ou as exporta para Parquet. As linhas de vendas_localizacao do
+    mês são mantidas, e uma compra repetida com a chave de uma venda arquivada
+    continua sem ser gravada de novo.
+
+    Args:
+        engine: Engine síncrono do SQLAlchemy.
+        ano (int): Ano.
+        mes (int): Mês.
+        destino (str): "esquema" ou "parquet"; por padrão settings.particoes.destino.
+        diretorio (Path): Diretório base dos arquivos Parquet.
+
+    Returns:
+        list: Arquivos Parquet gravados (vazia no destino "esquema").
+    """
+    destino = destino or settings.particoes.destino
+    if destino not in DESTINOS:
+        raise ValueError(f"Destino de arquivamento inválido: {destino}")
+    if destino == 'parquet' and pyarrow is None:
+        raise RuntimeError("pyarrow não instalado: exportação para Parquet indisponível")
+
+    with engine.begin() as conexao:
+        ligada = conexao.execute(text("SELECT to_regclass(:particao)"),
+                                 {'particao': f"public.{nome_particao('vendas', ano, mes)}"}).scalar()
+        if ligada:
+            _desliga(conexao, ano, mes)
+            logger.info(f"Partições de {mes:02d}/{ano} movidas para o schema {ESQUEMA_ARQUIVO}")
+    if destino == 'parquet':
+        return exporta_parquet(engine, ano, mes, diretorio)
+    return []
+
+
+def arquiva_particoes(engine, meses_retencao: int = None, destino: str = None,
+                      diretorio: Path = None, hoje: date = None) -> list:
+    """
+    Arquiva os meses mais antigos que a retenção, do mais antigo ao mais recente.
+
+    Returns:
+        list: (ano, mes) arquivados.
+    """
+    meses = meses_para_arquivar(engine, meses_retencao, hoje)
+    for ano, mes in meses:
+        arquiva_mes(engine, ano, mes, destino, diretorio)
+    return meses
+
+
+def main(argumentos: list = None):
+    parser = argparse.ArgumentParser(description="Manutenção das partições mensais de vendas")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    cria = comandos.add_parser('cria', help="cria as partições do mês corrente e dos próximos")
+    cria.add_argument('--meses-a-frente', type=int)
+    arquiva = comandos.add_parser('arquiva', help="arquiva os meses mais antigos que a retenção")
+    arquiva.add_argument('--meses-retencao', type=int)
+    arquiva.add_argument('--mes', help="arquiva só este mês (AAAA-MM), mesmo dentro da retenção")
+    arquiva.add_argument('--destino', choices=DESTINOS)
+    arquiva.add_argument('--diretorio', type=Path)
+    argumentos = parser.parse_args(argumentos)
+
+    from tools.db_connection import engine
+
+    if argumentos.comando == 'cria':
+        criadas = cria_particoes(engine, argumentos.meses_a_frente)
+        logger.info(f"{len(criadas)} partições criadas" if criadas else "Nenhuma partição a criar")
+    elif argumentos.mes:
+        ano, mes = (int(parte) for parte in argumentos.mes.split('-'))
+        arquiva_mes(engine, ano, mes, argumentos.destino, argumentos.diretorio)
+    else:
+        meses = arquiva_particoes(engine, argumentos.meses_retencao, argumentos.destino, argumentos.diretorio)
+        logger.info(f"{len(meses)} meses arquivados" if meses else "Nenhum mês a arquivar")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+import os
+import time
+import redis
+import socket
+from config import settings, logger
+
+
+def compara_ids(a, b) -> int:
+    """
+    Compara dois IDs de mensagem de stream ('<ms>-<seq>').
+
+    Args:
+        a: Primeiro ID (str ou bytes).
+        b: Segundo ID (str ou bytes).
+
+    Returns:
+        int: -1 se a < b, 0 se iguais, 1 se a > b.
+    """
+    def chave(msg_id):
+        if isinstance(msg_id, bytes):
+            msg_id = msg_id.decode('utf-8')
+        ms, _, seq = msg_id.partition('-')
+        return int(ms), int(seq or 0)
+
+    chave_a, chave_b = chave(a), chave(b)
+    return (chave_a > chave_b) - (chave_a < chave_b)
+
+
+def limite_stream(stream: str) -> int:
+    """
+    Retorna o MAXLEN aproximado da política de retenção do stream: o valor de
+    settings.retencao.streams para o stream ou, na falta dele, settings.retencao.maxlen.
+
+    Args:
+        stream (str): Nome do stream.
+
+    Returns:
+        int: Quantidade aproximada de entradas mantidas, ou None para não limitar.
+    """
+    retencao = settings.get('retencao', {})
+    return retencao.get('streams', {}).get(stream, retencao.get('maxlen')) or None
+
+
+def publica(r, stream: str, campos: dict):
+    """
+    Adiciona uma mensagem ao stream (XADD) aplicando o MAXLEN aproximado da política
+    de retenção, para que o stream não cresça sem limite.
+
+    Args:
+        r: Cliente Redis.
+        stream (str): Nome do stream.
+        campos (dict): Campos da mensagem.
+
+    Returns:
+        bytes: O ID da mensagem.
+    """
+    return r.xadd(stream, campos, maxlen=limite_stream(stream), approximate=True)
+
+
+def nome_consumidor() -> str:
+    """
+    Gera o nome deste processo dentro do consumer group (host + pid), único por réplica.
+
+    Returns:
+        str: Nome do consumidor.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ConsumidorGrupo:
+    """
+    Classe que consome um stream Redis através de um consumer group (XREADGROUP),
+    permitindo várias réplicas do mesmo worker e a recuperação (XAUTOCLAIM) das
+    mensagens que ficaram pendentes em réplicas que caíram.
+    """
+
+    def __init__(self, r, stream: str, grupo: str, consumidor: str = None):
+        """
+        Inicializa o consumidor. Nenhum comando é enviado ao Redis aqui.
+
+        Args:
+            r: Cliente Redis.
+            stream (str): Nome do stream de entrada.
+            grupo (str): Nome do consumer group (um por tipo de worker).
+            consumidor (str): Nome do consumidor; por padrão host + pid.
+        """
+        self.r = r
+        self.stream = stream
+        self.grupo = grupo
+        self.consumidor = consumidor or nome_consumidor()
+        self.bloqueio_ms = settings.consumidor.bloqueio_ms
+        self.min_idle_ms = settings.consumidor.min_idle_ms
+        self.intervalo_reivindicacao = settings.consumidor.intervalo_reivindicacao
+        self.inicio = settings.consumidor.inicio
+        self.chave_checkpoint = f"checkpoints:{stream}"
+        self.intervalo_apara = settings.get('retencao', {}).get('intervalo_apara', 0)
+        self.checkpoint = None
+        self._ultima_reivindicacao = 0.0
+        self._ultima_apara = 0.0
+        self._pendentes_lidas = False
+
+    def le_checkpoint(self):
+        """
+        Lê o último ID confirmado por este grupo, gravado no Redis.
+
+        Returns:
+            bytes: O ID do checkpoint, ou None se o grupo nunca confirmou mensagens.
+        """
+        self.checkpoint = self.r.hget(self.chave_checkpoint, self.grupo)
+        return self.checkpoint
+
+    def garante_grupo(self, id_inicial: str = None):
+        """
+        Cria o consumer group (e o stream, se necessário) caso ainda não exista.
+
+        Sem id_inicial, o ponto de partida depende de settings.consumidor.inicio:
+        "checkpoint" retoma do último ID confirmado (ou do início do stream, se não
+        houver checkpoint); "ultimo" ignora o histórico e cria o grupo no fim do stream,
+        para workers sem estado cujas respostas ninguém mais aguarda. Um grupo já
+        existente mantém sua posição: ele é compartilhado pelas réplicas, e movê-lo a
+        cada partida descartaria as mensagens ainda não lidas pelas demais.
+
+        Args:
+            id_inicial (str): ID a partir do qual o grupo começa a entregar mensagens.
+
+        Returns:
+            None
+        """
+        if id_inicial is None:
+            if self.inicio == 'ultimo':
+                id_inicial = '$'
+            else:
+                id_inicial = self.le_checkpoint() or '0'
+
+        try:
+            self.r.xgroup_create(self.stream, self.grupo,
+                                 id=id_inicial, mkstream=True)
+            logger.info(f"Consumer group {self.grupo} criado em {
+                        self.stream} a partir de {id_inicial}")
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def le(self, id_leitura: str = '>', count: int = None, block: int = None) -> list:
+        """
+        Lê mensagens do stream através do consumer group.
+
+        Args:
+            id_leitura (str): '>' para mensagens novas ou '0' para as pendentes deste consumidor.
+            count (int): Quantidade máxima de mensagens.
+            block (int): Tempo máximo de espera em milissegundos.
+
+        Returns:
+            list: Lista de tuplas (msg_id, msg).
+        """
+        resposta = self.r.xreadgroup(self.grupo, self.consumidor,
+                                     {self.stream: id_leitura}, count=count, block=block)
+        mensagens = []
+        for _, itens in resposta or []:
+            # Entradas removidas do stream voltam com msg vazia e são apenas confirmadas
+            for msg_id, msg in itens:
+                if msg:
+                    mensagens.append((msg_id, msg))
+                else:
+                    self.confirma(msg_id)
+        return mensagens
+
+    def confirma(self, *msg_ids):
+        """
+        Confirma (XACK) o processamento das mensagens, removendo-as da lista de pendentes,
+        e avança o checkpoint do grupo no mesmo round trip.
+
+        Args:
+            *msg_ids: IDs das mensagens processadas.
+
+        Returns:
+            None
+        """
+        if not msg_ids:
+            return
+
+        maior = self.checkpoint
+        for msg_id in msg_ids:
+            if maior is None or compara_ids(msg_id, maior) > 0:
+                maior = msg_id
+
+        pipe = self.r.pipeline(transaction=False)
+        pipe.xack(self.stream, self.grupo, *msg_ids)
+        if maior != self.checkpoint:
+            pipe.hset(self.chave_checkpoint, self.grupo, maior)
+        pipe.execute()
+        self.checkpoint = maior
+
+    def reivindica(self, count: int = 100) -> list:
+        """
+        Transfere para este consumidor as mensagens pendentes há mais de min_idle_ms
+        em qualquer consumidor do grupo (réplica que caiu ou travou).
+
+        Args:
+            count (int): Quantidade máxima de mensagens reivindicadas por chamada.
+
+        Returns:
+            list: Lista de tuplas (msg_id, msg) reivindicadas.
+        """
+        self._ultima_reivindicacao = time.monotonic()
+        reivindicadas = []
+        inicio = '0-0'
+
+        while len(reivindicadas) < count:
+            resposta = self.r.xautoclaim(self.stream, self.grupo, self.consumidor,
+                                         min_idle_time=self.min_idle_ms,
+                                         start_id=inicio, count=count - len(reivindicadas))
+            inicio, itens = resposta[0], resposta[1]
+            for msg_id, msg in itens:
+                if msg:
+                    reivindicadas.append((msg_id, msg))
+                else:
+                    self.confirma(msg_id)
+            if inicio in (b'0-0', '0-0'):
+                break
+
+        if reivindicadas:
+            logger.info(f"{len(reivindicadas)} mensagens reivindicadas em {
+                        self.stream}")
+        return reivindicadas
+
+    def posicao_minima(self):
+        """
+        Retorna o menor ID ainda necessário a algum grupo do stream: a mensagem
+        pendente (entregue e não confirmada) mais antiga do grupo ou, se não houver
+        pendentes, o último ID entregue ao grupo.
+
+        Returns:
+            O ID mínimo, ou None se o stream não tiver consumer groups.
+        """
+        minimo = None
+        for grupo in self.r.xinfo_groups(self.stream):
+            if grupo['pending']:
+                posicao = self.r.xpending(self.stream, grupo['name'])['min']
+            else:
+                posicao = grupo['last-delivered-id']
+            if minimo is None or compara_ids(posicao, minimo) < 0:
+                minimo = posicao
+        return minimo
+
+    def apara(self) -> int:
+        """
+        Remove do stream (XTRIM MINID aproximado) as entradas anteriores à posição do
+        grupo mais atrasado, já confirmadas por todos os grupos.
+
+        Returns:
+            int: Quantidade de entradas removidas.
+        """
+        self._ultima_apara = time.monotonic()
+        try:
+            minimo = self.posicao_minima()
+            if minimo is None:
+                return 0
+            removidas = self.r.xtrim(self.stream, minid=minimo, approximate=True)
+        except redis.RedisError as e:
+            logger.error(f"Erro ao aparar {self.stream}: {e}")
+            return 0
+
+        if removidas:
+            logger.info(f"{removidas} entradas removidas de {self.stream} (MINID {minimo})")
+        return removidas
+
+    def proximas(self, count: int = None) -> list:
+        """
+        Retorna as próximas mensagens a processar: na primeira chamada, as pendentes
+        deste próprio consumidor (entregues antes de um reinício); depois, periodicamente,
+        as reivindicadas de outros consumidores, seguidas das mensagens novas. O stream
+        é aparado a cada intervalo_apara segundos (settings.retencao; 0 desativa).
+
+        Args:
+            count (int): Quantidade máxima de mensagens novas.
+
+        Returns:
+            list: Lista de tuplas (msg_id, msg).
+        """
+        if not self._pendentes_lidas:
+            self._pendentes_lidas = True
+            pendentes = self.le('0', count=count)
+            if pendentes:
+                return pendentes
+
+        if self.intervalo_apara and time.monotonic() - self._ultima_apara >= self.intervalo_apara:
+            self.apara()
+
+        if time.monotonic() - self._ultima_reivindicacao >= self.intervalo_reivindicacao:
+            reivindicadas = self.reivindica()
+            if reivindicadas:
+                return reivindicadas
+
+        return self.le('>', count=count, block=self.bloqueio_ms)
@@ -0,0 +1,173 @@
+import json
+import time
+import random
+import smtplib
+from config import settings, logger
+from sqlalchemy.exc import DBAPIError, OperationalError, InterfaceError
+from tools.redis_streams import publica, limite_stream
+
+# Campos acrescentados às mensagens pelas retentativas e pela dead-letter; o app1
+# (app1/streams.py) os remove ao reprocessar uma dead-letter
+CAMPO_TENTATIVAS = 'tentativas'
+CAMPOS_DLQ = ('tentativas', 'id_origem', 'erro', 'falhou_em')
+
+# Move para o stream de entrada as retentativas vencidas, de forma atômica: uma
+# mensagem nunca é devolvida por duas réplicas nem perdida entre o ZREM e o XADD
+SCRIPT_DEVOLVE = """
+local itens = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, item in ipairs(itens) do
+    redis.call('ZREM', KEYS[1], item)
+    local campos = {}
+    for campo, valor in pairs(cjson.decode(item)) do
+        table.insert(campos, campo)
+        table.insert(campos, valor)
+    end
+    if ARGV[3] ~= '' then
+        redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*', unpack(campos))
+    else
+        redis.call('XADD', KEYS[2], '*', unpack(campos))
+    end
+end
+return #itens
+"""
+
+
+class FalhaTransitoria(Exception):
+    """
+    Falha que pode não se repetir (banco ou servidor de e-mail indisponível): a
+    mensagem é processada de novo mais tarde, em vez de respondida com erro.
+    """
+
+
+def eh_transitoria(erro: Exception) -> bool:
+    """
+    Indica se o erro é transitório: conexão perdida ou recusada, failover ou deadlock
+    do banco, timeout e respostas 4xx do servidor SMTP.
+
+    Args:
+        erro (Exception): O erro capturado.
+
+    Returns:
+        bool: True se vale a pena tentar de novo.
+    """
+    if isinstance(erro, FalhaTransitoria):
+        return True
+    if isinstance(erro, DBAPIError):
+        return erro.connection_invalidated or isinstance(erro, (OperationalError, InterfaceError))
+    if isinstance(erro, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(erro, smtplib.SMTPResponseException):
+        return 400 <= erro.smtp_code < 500
+    if isinstance(erro, smtplib.SMTPException):
+        return False
+    return isinstance(erro, OSError)
+
+
+def relanca_se_transitoria(erro: Exception):
+    """
+    Relança como FalhaTransitoria um erro transitório capturado, para que a mensagem
+    seja reprocessada; erros permanentes seguem o tratamento de quem os capturou.
+
+    Args:
+        erro (Exception): O erro capturado.
+
+    Returns:
+        None
+
+    Raises:
+        FalhaTransitoria: Se o erro for transitório.
+    """
+    if isinstance(erro, FalhaTransitoria):
+        raise erro
+    if eh_transitoria(erro):
+        raise FalhaTransitoria(str(erro)) from erro
+
+
+class AgendadorRetentativas:
+    """
+    Classe que agenda o reprocessamento das mensagens que falharam num sorted set
+    (retentativas:<stream>, score = horário da próxima tentativa), com backoff
+    exponencial e jitter, e as move para a dead-letter (dlq:<stream>) depois de
+    settings.retentativas.max_tentativas tentativas.
+    """
+
+    def __init__(self, r, stream: str):
+        """
+        Inicializa o agendador.
+
+        Args:
+            r: Cliente Redis.
+            stream (str): Nome do stream de entrada do worker.
+        """
+        self.r = r
+        self.stream = stream
+        self.chave = f"retentativas:{stream}"
+        self.stream_dlq = f"dlq:{stream}"
+        self.max_tentativas = settings.retentativas.max_tentativas
+        self.atraso_base_ms = settings.retentativas.atraso_base_ms
+        self.atraso_maximo_ms = settings.retentativas.atraso_maximo_ms
+        self.intervalo = settings.retentativas.intervalo
+        self._devolve = r.register_script(SCRIPT_DEVOLVE)
+
+    def atraso(self, tentativa: int) -> float:
+        """
+        Calcula a espera antes da próxima tentativa: o teto dobra a cada falha (até
+        atraso_maximo_ms) e a espera é sorteada entre metade do teto e o teto, para
+        que as mensagens de uma mesma queda não voltem todas ao mesmo tempo.
+
+        Args:
+            tentativa (int): Quantidade de tentativas que já falharam.
+
+        Returns:
+            float: Espera em segundos.
+        """
+        teto = min(self.atraso_maximo_ms, self.atraso_base_ms * 2 ** (tentativa - 1)) / 1000
+        return teto / 2 + random.uniform(0, teto / 2)
+
+    def agenda(self, msg_id, msg: dict, erro: Exception) -> bool:
+        """
+        Agenda uma nova tentativa da mensagem ou, esgotadas as tentativas, a grava
+        na dead-letter.
+
+        Args:
+            msg_id: ID da mensagem no stream.
+            msg (dict): Campos da mensagem.
+            erro (Exception): Erro da tentativa que falhou.
+
+        Returns:
+            bool: True se uma nova tentativa foi agendada; False se a mensagem foi para a dead-letter.
+        """
+        campos = {campo.decode('utf-8'): valor.decode('utf-8') for campo, valor in msg.items()}
+        tentativa = int(campos.get(CAMPO_TENTATIVAS, 0)) + 1
+        campos[CAMPO_TENTATIVAS] = str(tentativa)
+        campos.setdefault('id_origem', msg_id.decode('utf-8') if isinstance(msg_id, bytes) else msg_id)
+
+        if tentativa >= self.max_tentativas:
+            campos['erro'] = str(erro)[:500]
+            campos['falhou_em'] = str(time.time())
+            publica(self.r, self.stream_dlq, campos)
+            logger.error(f"Mensagem {msg_id} de {self.stream} enviada para {
+                         self.stream_dlq} após {tentativa} tentativas: {erro}")
+            return False
+
+        atraso = self.atraso(tentativa)
+        self.r.zadd(self.chave, {json.dumps(campos): time.time() + atraso})
+        logger.warning(f"Mensagem {msg_id} de {self.stream} falhou ({tentativa}/{
+                       self.max_tentativas}), nova tentativa em {atraso:.1f}s: {erro}")
+        return True
+
+    def devolve_vencidas(self, quantidade: int = 100) -> int:
+        """
+        Devolve ao stream de entrada as mensagens cuja próxima tentativa já venceu.
+
+        Args:
+            quantidade (int): Máximo de mensagens devolvidas por chamada.
+
+        Returns:
+            int: Quantidade de mensagens devolvidas.
+        """
+        devolvidas = self._devolve(keys=[self.chave, self.stream],
+                                   args=[time.time(), quantidade, limite_stream(self.stream) or ''])
+        if devolvidas:
+            logger.info(f"{devolvidas} mensagens devolvidas a {self.stream} para nova tentativa")
+        return devolvidas
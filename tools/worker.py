@@ -0,0 +1,170 @@
+import json
+import time
+import signal
+import asyncio
+from config import settings, logger
+from tools.mensagens import monta_resposta, prazo_expirado
+from tools.redis_streams import ConsumidorGrupo, publica
+from tools.retentativas import AgendadorRetentativas
+
+
+class WorkerStream:
+    """
+    Runtime comum dos workers: lê lotes do stream através do consumer group, processa
+    até `concorrencia` mensagens ao mesmo tempo e confirma cada uma ao terminar. As
+    mensagens cujo processamento levanta exceção são reagendadas com backoff e, esgotadas
+    as tentativas, vão para a dead-letter do stream.
+    """
+
+    def __init__(self, consumidor: ConsumidorGrupo, handler, concorrencia: int = None, lote: int = None,
+                 metricas=None, stream_resposta: str = None, retentativas: AgendadorRetentativas = None):
+        """
+        Inicializa o runtime.
+
+        Args:
+            consumidor (ConsumidorGrupo): Consumidor do stream de entrada do worker.
+            handler: Corrotina `handler(msg_id, msg)` que processa uma mensagem.
+            concorrencia (int): Máximo de mensagens processadas ao mesmo tempo.
+            lote (int): Máximo de mensagens lidas por chamada (COUNT).
+            metricas: Função opcional `metricas() -> dict` (ex.: estatísticas do pool de
+                conexões), publicada periodicamente no hash Redis `metricas:<stream>`.
+            stream_resposta (str): Stream de resposta ao app1, que recebe status false
+                quando uma mensagem vai para a dead-letter.
+            retentativas (AgendadorRetentativas): Agendador das novas tentativas; por
+                padrão um para o stream do consumidor.
+        """
+        self.consumidor = consumidor
+        self.handler = handler
+        self.concorrencia = concorrencia or settings.consumidor.concorrencia
+        self.lote = lote or settings.consumidor.lote
+        self._semaforo = asyncio.Semaphore(self.concorrencia)
+        self._tarefas = set()
+        self._parar = asyncio.Event()
+        self.metricas = metricas
+        self.chave_metricas = f"metricas:{consumidor.stream}"
+        self._ultima_publicacao = 0.0
+        self.stream_resposta = stream_resposta
+        self.retentativas = retentativas or AgendadorRetentativas(consumidor.r, consumidor.stream)
+        self._ultima_devolucao = 0.0
+        self.expiradas = 0
+
+    def parar(self):
+        """
+        Solicita o encerramento: nenhuma leitura nova é feita e as mensagens em
+        andamento são concluídas e confirmadas antes de sair.
+
+        Returns:
+            None
+        """
+        if not self._parar.is_set():
+            logger.info(f"Encerrando worker de {self.consumidor.stream} ...")
+            self._parar.set()
+
+    def publica_metricas(self):
+        """
+        Grava as métricas desta réplica no Redis, num campo com o nome do consumidor.
+
+        Returns:
+            None
+        """
+        self._ultima_publicacao = time.monotonic()
+        try:
+            valores = dict(self.metricas(), expiradas=self.expiradas, atualizado_em=time.time())
+            self.consumidor.r.hset(self.chave_metricas, self.consumidor.consumidor,
+                                   json.dumps(valores))
+        except Exception as e:
+            logger.error(f"Erro ao publicar métricas de {self.consumidor.stream}: {e}")
+
+    def _falha(self, msg_id, msg: dict, erro: Exception):
+        """
+        Trata uma mensagem cujo processamento falhou: agenda uma nova tentativa ou,
+        esgotadas as tentativas, responde status false ao app1 (a mensagem já está na
+        dead-letter). Em seguida a mensagem é confirmada.
+
+        Args:
+            msg_id: ID da mensagem no stream.
+            msg (dict): Campos da mensagem.
+            erro (Exception): Erro do processamento.
+
+        Returns:
+            None
+        """
+        if not self.retentativas.agenda(msg_id, msg, erro) and self.stream_resposta:
+            publica(self.consumidor.r, self.stream_resposta,
+                    monta_resposta(msg, {'status': 'false'}))
+        self.consumidor.confirma(msg_id)
+
+    async def _processa(self, msg_id, msg):
+        """
+        Processa uma mensagem e a confirma. Mensagens com o prazo vencido são apenas
+        confirmadas, sem processamento. Em caso de exceção a mensagem é reagendada
+        (ver _falha); se nem o reagendamento for possível, ela não é confirmada e
+        continua pendente, para ser reivindicada depois.
+
+        Args:
+            msg_id: ID da mensagem no stream.
+            msg (dict): Campos da mensagem.
+
+        Returns:
+            None
+        """
+        try:
+            if prazo_expirado(msg):
+                self.expiradas += 1
+                logger.warning(f"Mensagem {msg_id} de {self.consumidor.stream} descartada: prazo vencido")
+                self.consumidor.confirma(msg_id)
+                return
+            try:
+                await self.handler(msg_id, msg)
+            except Exception as e:
+                logger.exception(f"Erro ao processar mensagem {msg_id}: {e}")
+                self._falha(msg_id, msg, e)
+            else:
+                self.consumidor.confirma(msg_id)
+        except Exception as e:
+            logger.exception(f"Erro ao confirmar ou reagendar a mensagem {msg_id}: {e}")
+        finally:
+            self._semaforo.release()
+
+    async def executar(self):
+        """
+        Loop principal do worker. Não há pausa fixa: a própria leitura bloqueante
+        aguarda novas mensagens e, havendo trabalho, o próximo lote é lido assim que
+        houver vaga no semáforo.
+
+        Returns:
+            None
+        """
+        loop = asyncio.get_running_loop()
+        for sinal in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sinal, self.parar)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        await asyncio.to_thread(self.consumidor.garante_grupo)
+        logger.info(f"Worker {self.consumidor.consumidor} consumindo {
+                    self.consumidor.stream} (concorrência {self.concorrencia})")
+
+        while not self._parar.is_set():
+            if self.metricas and time.monotonic() - self._ultima_publicacao >= self.consumidor.intervalo_reivindicacao:
+                await asyncio.to_thread(self.publica_metricas)
+
+            if time.monotonic() - self._ultima_devolucao >= self.retentativas.intervalo:
+                self._ultima_devolucao = time.monotonic()
+                try:
+                    await asyncio.to_thread(self.retentativas.devolve_vencidas)
+                except Exception as e:
+                    logger.error(f"Erro ao devolver retentativas de {self.consumidor.stream}: {e}")
+
+            # A leitura bloqueante roda em thread para não travar as mensagens em andamento
+            mensagens = await asyncio.to_thread(self.consumidor.proximas, self.lote)
+            for msg_id, msg in mensagens:
+                await self._semaforo.acquire()
+                tarefa = asyncio.create_task(self._processa(msg_id, msg))
+                self._tarefas.add(tarefa)
+                tarefa.add_done_callback(self._tarefas.discard)
+
+        if self._tarefas:
+            await asyncio.gather(*self._tarefas, return_exceptions=True)
+        logger.info(f"Worker de {self.consumidor.stream} encerrado")